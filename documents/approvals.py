@@ -0,0 +1,275 @@
+"""
+Bulk approval / rejection of submissions (POST /api/documents/submissions/bulk-review/).
+
+Approving a batch:
+1. validate every id (exists, still Pending, file on disk) - failures are
+   reported per item and do not stop the batch,
+2. resolve each document to a PDF: DOCX submissions use the cached review
+   rendition (normally rendered at submit time); missing ones are converted
+   concurrently on the conversion pool (documents/converters.py),
+3. sign the PDFs in a process pool (documents/signing.py) as each one becomes
+   available, since parsing is CPU bound; the pool is started once per web
+   process and shared by every bulk request, workers keep the parsed overlays
+   of recent signatures, and they send back only the incremental update
+   appended to each PDF,
+4. stream the signed files to storage, then create the ApprovedDocument rows, update the
+   submissions and notify the submitters in bulk inside one transaction.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .converters import ConversionQueueFull
+from .models import ApprovedDocument, SubmittedDocument
+from .renditions import submit_review_rendition
+from .signing import sign_pdf, sign_pdf_file
+from .stats import invalidate_status_counts
+from .utils import get_signature_overlays
+
+logger = logging.getLogger(__name__)
+
+BULK_REVIEW_SETTINGS = {
+    'MAX_ITEMS': 500,
+    'WORKERS': min(4, os.cpu_count() or 1),  # Signing processes per web process, shared by bulk requests
+    **getattr(settings, 'BULK_REVIEW', {}),
+}
+
+
+_signing_pool = None
+_signing_pool_lock = threading.Lock()
+
+
+def get_signing_pool():
+    """Return the process-wide signing pool, starting it on first use."""
+    global _signing_pool
+    with _signing_pool_lock:
+        if _signing_pool is None:
+            # 'spawn': forking a web process that runs threads (conversion pool, channel layer) is unsafe
+            _signing_pool = ProcessPoolExecutor(
+                max_workers=BULK_REVIEW_SETTINGS['WORKERS'],
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _signing_pool
+
+
+def _discard_signing_pool(pool):
+    """Drop a pool that lost a worker; the next request starts a fresh one."""
+    global _signing_pool
+    with _signing_pool_lock:
+        if _signing_pool is pool:
+            _signing_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _Item:
+    def __init__(self, submission_id):
+        self.submission_id = submission_id
+        self.submission = None
+        self.pdf_path = None
+        self.signed_pdf = None
+        self.error = None
+
+    def result(self, ok_status):
+        if self.error:
+            return {'id': self.submission_id, 'status': 'error', 'error': self.error}
+        return {'id': self.submission_id, 'status': ok_status}
+
+
+def _load_items(submission_ids):
+    """One query for the whole batch; items that cannot be reviewed get an error."""
+    items = [_Item(pk) for pk in dict.fromkeys(submission_ids)]
+    submissions = SubmittedDocument.objects.select_related('user', 'template').in_bulk([i.submission_id for i in items])
+    for item in items:
+        item.submission = submissions.get(item.submission_id)
+        if item.submission is None:
+            item.error = 'Submission not found.'
+        elif item.submission.status != 'Pending':
+            item.error = f'Submission is already {item.submission.status}.'
+    return items
+
+
+def _iter_resolved(items):
+    """
+    Yield items as the PDF to sign becomes available (item.pdf_path): submitted
+    PDFs right away, DOCX submissions as the conversion pool finishes their
+    review renditions. Items that cannot be resolved get an error instead.
+    """
+    waiting = deque()
+    for item in items:
+        document = item.submission.document
+        if not document or not os.path.exists(document.path):
+            item.error = 'The original submitted document file cannot be found.'
+        elif document.name.lower().endswith('.pdf'):
+            item.pdf_path = document.path
+            yield item
+        else:
+            waiting.append(item)
+
+    running = {}
+    while waiting or running:
+        while waiting:
+            item = waiting[0]
+            try:
+                running[submit_review_rendition(item.submission.document)] = item
+            except ConversionQueueFull:
+                break  # Submit the rest as conversions finish
+            except Exception as e:
+                logger.error(f"Bulk approval: could not prepare submission {item.submission_id}: {e}", exc_info=True)
+                item.error = str(e)
+            waiting.popleft()
+        if not running:
+            time.sleep(0.5)  # The queue is full of other requests' jobs
+            continue
+        # Hung conversions are failed by the pool's watchdog, so this returns
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            item = running.pop(future)
+            try:
+                item.pdf_path = default_storage.path(future.result())
+            except Exception as e:
+                logger.error(f"Bulk approval: could not convert submission {item.submission_id}: {e}")
+                item.error = f'Could not convert the document to PDF: {e}'
+                continue
+            yield item
+
+
+def _sign_all(items, overlays):
+    """Resolve and sign the items, each as soon as its PDF is available."""
+    workers = min(BULK_REVIEW_SETTINGS['WORKERS'], len(items))
+
+    if workers <= 1:
+        # Not worth starting processes for a single document
+        for item in _iter_resolved(items):
+            try:
+                item.signed_pdf = sign_pdf(item.pdf_path, overlays)
+            except Exception as e:
+                item.error = f'PDF signing failed: {e}'
+        return
+
+    pool = get_signing_pool()
+    futures = []
+    for item in _iter_resolved(items):
+        try:
+            futures.append((item, pool.submit(sign_pdf_file, item.pdf_path, overlays.signature_bytes)))
+        except BrokenProcessPool as e:
+            _discard_signing_pool(pool)
+            item.error = f'PDF signing failed: {e}'
+    for item, future in futures:
+        try:
+            item.signed_pdf = future.result()
+        except BrokenProcessPool as e:
+            _discard_signing_pool(pool)
+            item.error = f'PDF signing failed: {e}'
+        except Exception as e:
+            item.error = f'PDF signing failed: {e}'
+
+
+def bulk_approve(submission_ids, hod_user, profile):
+    """Approve and sign with the HOD's (UserProfile) signature; returns one result dict per id."""
+    from notifications.utils import create_notifications
+
+    items = _load_items(submission_ids)
+    to_sign = [item for item in items if not item.error]
+    if to_sign:
+        _sign_all(to_sign, get_signature_overlays(profile))
+
+    signed = [item for item in to_sign if not item.error]
+    signed_field = ApprovedDocument._meta.get_field('signed_file')
+    stored_names = []
+    try:
+        for item in signed:
+            base_name = os.path.splitext(os.path.basename(item.submission.document.name))[0]
+            name = signed_field.generate_filename(None, f'signed_{base_name}.pdf')
+            try:
+                stored_names.append(signed_field.storage.save(name, File(item.signed_pdf)))
+            finally:
+                item.signed_pdf.close()
+            item.signed_pdf = None  # Free memory as we go
+
+        with transaction.atomic():
+            # Lock the rows and re-check: another HOD may have reviewed them meanwhile
+            still_pending = set(
+                SubmittedDocument.objects.select_for_update()
+                .filter(pk__in=[item.submission_id for item in signed], status='Pending')
+                .values_list('pk', flat=True)
+            )
+            approved = []
+            for item, name in zip(signed, stored_names):
+                if item.submission_id in still_pending:
+                    approved.append((item, name))
+                else:
+                    item.error = 'Submission was reviewed by someone else.'
+                    signed_field.storage.delete(name)
+
+            ApprovedDocument.objects.bulk_create([
+                ApprovedDocument(original_submission=item.submission, approved_by=hod_user, signed_file=name)
+                for item, name in approved
+            ])
+            SubmittedDocument.objects.filter(pk__in=[item.submission_id for item, _ in approved]).update(
+                status='Approved', rejection_reason=None
+            )
+            create_notifications(hod_user, [
+                (
+                    item.submission.user_id,
+                    item.submission,
+                    f"Your submission '{item.submission.template.name}' (ID: {item.submission_id}) has been approved.",
+                )
+                for item, _ in approved
+            ])
+    except Exception:
+        for name in stored_names:
+            signed_field.storage.delete(name)
+        raise
+    finally:
+        invalidate_status_counts()
+
+    logger.info(f"Bulk approval by {hod_user.username}: {len(approved)} of {len(items)} approved")
+    return [item.result('approved') for item in items]
+
+
+def bulk_reject(submission_ids, hod_user, reason):
+    """Reject the given submissions with one reason; returns one result dict per id."""
+    from notifications.utils import create_notifications
+
+    items = _load_items(submission_ids)
+    truncated_reason = (reason[:75] + '...') if len(reason) > 75 else reason
+    with transaction.atomic():
+        pending = set(
+            SubmittedDocument.objects.select_for_update()
+            .filter(pk__in=[item.submission_id for item in items if not item.error], status='Pending')
+            .values_list('pk', flat=True)
+        )
+        rejected = []
+        for item in items:
+            if item.error:
+                continue
+            if item.submission_id in pending:
+                rejected.append(item)
+            else:
+                item.error = 'Submission was reviewed by someone else.'
+
+        SubmittedDocument.objects.filter(pk__in=[item.submission_id for item in rejected]).update(
+            status='Rejected', rejection_reason=reason
+        )
+        create_notifications(hod_user, [
+            (
+                item.submission.user_id,
+                item.submission,
+                f"Your submission '{item.submission.template.name}' (ID: {item.submission_id}) was rejected. Reason: {truncated_reason}",
+            )
+            for item in rejected
+        ])
+    invalidate_status_counts()
+
+    logger.info(f"Bulk rejection by {hod_user.username}: {len(rejected)} of {len(items)} rejected")
+    return [item.result('rejected') for item in items]
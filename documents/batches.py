@@ -0,0 +1,359 @@
+"""
+Mail-merge batches: one template filled once per row of an uploaded file.
+
+POST /api/documents/templates/<id>/batch/ takes a CSV (header row = field
+names) or JSONL (one JSON object per line) upload and queues a
+GenerationBatch. The submission pipeline's runner (documents/tasks.py, the
+`process_submissions` command or the 'thread' runner) then:
+
+1. reads the rows one at a time from the stored upload,
+2. fills them in a process pool whose workers each build the compiled
+   template once (documents/merge_worker.py), keeping only a small window of
+   rows in flight,
+3. for PDF batches, converts the filled DOCX files on this process's shared
+   conversion pool (documents/converters.py), again a few at a time,
+4. writes each document into a ZIP on disk as soon as it is ready, or saves
+   it as a GeneratedDocument when output is 'records',
+5. records progress every PROGRESS_EVERY rows for
+   GET /api/documents/batches/<id>/.
+
+The finished ZIP is streamed from storage by /api/documents/batches/<id>/download/.
+"""
+import csv
+import io
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .converters import CONVERTER_SETTINGS, ConversionQueueFull, get_conversion_pool
+from .merge_worker import fill_row, init_merge_worker
+from .models import GeneratedDocument, GenerationBatch
+from .tasks import PIPELINE_SETTINGS, start_thread_runner
+from .template_cache import get_compiled_template
+
+logger = logging.getLogger(__name__)
+
+BATCH_SETTINGS = {
+    'MAX_ROWS': 5000,  # Rows per uploaded file
+    'WORKERS': min(4, os.cpu_count() or 1),  # Filling processes per batch
+    'PROGRESS_EVERY': 25,  # Rows between progress updates
+    'MAX_ERRORS': 50,  # Row errors kept for the status endpoint
+    **getattr(settings, 'BATCH_GENERATION', {}),
+}
+
+ROWS_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+
+class BatchRowsError(ValueError):
+    """The uploaded rows cannot be used."""
+
+
+def iter_rows(rows_file, rows_format):
+    """Yield each row of a binary CSV/JSONL file as {field name: str}, reading one line at a time."""
+    text = io.TextIOWrapper(rows_file, encoding='utf-8-sig', newline='')
+    try:
+        if rows_format == 'csv':
+            for row in csv.DictReader(text):
+                yield {key.strip(): value or '' for key, value in row.items() if key}
+            return
+
+        for line_number, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise BatchRowsError(f"Line {line_number}: {e.msg}")
+            if not isinstance(row, dict):
+                raise BatchRowsError(f"Line {line_number}: expected a JSON object")
+            yield {str(key): '' if value is None else str(value) for key, value in row.items()}
+    except UnicodeDecodeError:
+        raise BatchRowsError("The rows file must be UTF-8 encoded")
+    finally:
+        text.detach()  # Leave the underlying file open for the caller
+
+
+def count_rows(rows_file, rows_format):
+    """Validate an upload and return its number of rows."""
+    total = 0
+    for _ in iter_rows(rows_file, rows_format):
+        total += 1
+        if total > BATCH_SETTINGS['MAX_ROWS']:
+            raise BatchRowsError(f"At most {BATCH_SETTINGS['MAX_ROWS']} rows per batch")
+    rows_file.seek(0)
+    if not total:
+        raise BatchRowsError("The rows file has no rows")
+    return total
+
+
+def enqueue_batch(user, template, rows, rows_format, format='docx', output='zip', filename_field=''):
+    """Store the uploaded rows and queue a batch; raises BatchRowsError for unusable files."""
+    total_rows = count_rows(rows.file, rows_format)
+    with transaction.atomic():
+        batch = GenerationBatch(
+            user=user, template=template, rows_format=rows_format, format=format,
+            output=output, filename_field=filename_field, total_rows=total_rows,
+        )
+        batch.rows_file.save(f'rows_{template.pk}.{rows_format}', rows, save=False)
+        batch.save()
+        if PIPELINE_SETTINGS['RUNNER'] == 'thread':
+            transaction.on_commit(start_thread_runner)
+    return batch
+
+
+def batch_status(batch):
+    """Payload of GET /api/documents/batches/<id>/."""
+    done = batch.processed_rows + batch.failed_rows
+    data = {
+        'id': batch.id,
+        'template_id': batch.template_id,
+        'status': batch.status,
+        'output': batch.output,
+        'total_rows': batch.total_rows,
+        'processed_rows': batch.processed_rows,
+        'failed_rows': batch.failed_rows,
+        'progress': round(100 * done / batch.total_rows) if batch.total_rows else 0,
+        'errors': batch.errors,
+        'download_url': None,
+    }
+    if batch.status == 'done' and batch.archive:
+        data['download_url'] = reverse('documents:batch-download', args=[batch.id])
+    if batch.output == 'records':
+        data['document_ids'] = list(batch.documents.order_by('id').values_list('id', flat=True))
+    return data
+
+
+def claim_next_batch():
+    """Atomically move the oldest queued batch to 'running' and return it (or None)."""
+    with transaction.atomic():
+        batch = (
+            GenerationBatch.objects.select_for_update(skip_locked=True)
+            .filter(status='queued')
+            .order_by('created_at')
+            .first()
+        )
+        if batch is None:
+            return None
+        batch.status = 'running'
+        batch.started_at = batch.heartbeat_at = timezone.now()
+        batch.save(update_fields=['status', 'started_at', 'heartbeat_at'])
+    return batch
+
+
+def requeue_stale_batches():
+    """Put batches whose worker stopped reporting progress back on the queue (they restart from the first row)."""
+    cutoff = timezone.now() - timedelta(seconds=PIPELINE_SETTINGS['STALE_AFTER'])
+    with transaction.atomic():
+        stale = list(
+            GenerationBatch.objects.select_for_update(skip_locked=True)
+            .filter(status='running', heartbeat_at__lt=cutoff)
+            .values_list('pk', flat=True)
+        )
+        if not stale:
+            return 0
+        # 'records' batches saved documents as they went; the rerun creates them again
+        GeneratedDocument.objects.filter(batch_id__in=stale).delete()
+        return GenerationBatch.objects.filter(pk__in=stale).update(
+            status='queued', processed_rows=0, failed_rows=0, errors=[]
+        )
+
+
+class _InlineExecutor:
+    """Runs submitted calls right away in this process (single worker)."""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class _ZipOutput:
+    """Documents appended to a ZIP in a temporary file, saved to the batch when complete."""
+
+    def __init__(self, batch):
+        self.batch = batch
+        self.file = tempfile.TemporaryFile()
+        # DOCX files are zip archives already; deflating them again only costs time
+        compression = zipfile.ZIP_DEFLATED if batch.format == 'pdf' else zipfile.ZIP_STORED
+        self.archive = zipfile.ZipFile(self.file, 'w', compression)
+
+    def add(self, entry_name, data):
+        self.archive.writestr(entry_name, data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.archive.close()
+        self.file.seek(0)
+        name = f'batch_{self.batch.pk}_{slugify(self.batch.template.name) or "documents"}.zip'
+        self.batch.archive.save(name, File(self.file), save=False)
+        self.file.close()
+
+
+class _RecordOutput:
+    """Documents saved as GeneratedDocument rows, inserted in bulk at every progress update."""
+
+    def __init__(self, batch):
+        self.batch = batch
+        self.field = GeneratedDocument._meta.get_field('file')
+        self.pending = []
+
+    def add(self, entry_name, data):
+        name = self.field.storage.save(self.field.generate_filename(None, entry_name), ContentFile(data))
+        self.pending.append(GeneratedDocument(user_id=self.batch.user_id, file=name, batch=self.batch))
+
+    def flush(self):
+        GeneratedDocument.objects.bulk_create(self.pending)
+        self.pending = []
+
+    def close(self):
+        self.flush()
+
+
+def _entry_name(batch, row_number, values):
+    label = slugify(values.get(batch.filename_field, '')) if batch.filename_field else ''
+    if label:
+        return f'{row_number:05d}_{label}.{batch.format}'
+    return f'{slugify(batch.template.name) or "document"}_{row_number:05d}.{batch.format}'
+
+
+def _generate(batch):
+    template = batch.template
+    compiled = get_compiled_template(template)
+    bindings = {p.placeholder_text: p.name for p in template.placeholders.all()}
+    worker_args = (template.pk, compiled.checksum, compiled.to_payload(), bindings)
+    workers = BATCH_SETTINGS['WORKERS']
+    progress_every = BATCH_SETTINGS['PROGRESS_EVERY']
+
+    processed = failed = 0
+    errors = []
+
+    def report():
+        GenerationBatch.objects.filter(pk=batch.pk).update(
+            processed_rows=processed, failed_rows=failed, errors=errors, heartbeat_at=timezone.now()
+        )
+
+    with ExitStack() as stack:
+        rows_file = stack.enter_context(batch.rows_file.open('rb'))
+        if workers <= 1:
+            init_merge_worker(*worker_args)
+            executor = _InlineExecutor()
+        else:
+            # 'spawn': forking a web process that runs threads (conversion pool, channel layer) is unsafe
+            executor = stack.enter_context(ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_merge_worker,
+                initargs=worker_args,
+            ))
+        output = _ZipOutput(batch) if batch.output == 'zip' else _RecordOutput(batch)
+
+        # Rows are read as the windows drain, so memory does not grow with the file
+        filling = deque()
+        fill_window = max(1, workers) * 4
+        # Conversions share the pool (and its queue) with web requests: keep only a few queued
+        pool = get_conversion_pool() if batch.format == 'pdf' else None
+        converting = deque()
+        convert_window = CONVERTER_SETTINGS['WORKERS'] * 2
+
+        def record(row_number, values, future):
+            nonlocal processed, failed
+            try:
+                output.add(_entry_name(batch, row_number, values), future.result())
+                processed += 1
+            except Exception as e:
+                failed += 1
+                if len(errors) < BATCH_SETTINGS['MAX_ERRORS']:
+                    errors.append({'row': row_number, 'error': str(e)})
+            if (processed + failed) % progress_every == 0:
+                output.flush()
+                report()
+
+        def convert(row_number, values, docx_bytes):
+            while True:
+                try:
+                    converting.append((row_number, values, pool.submit(docx_bytes)))
+                    break
+                except ConversionQueueFull:
+                    # Busy with other work: wait for our own conversions, or a moment
+                    if converting:
+                        record(*converting.popleft())
+                    else:
+                        time.sleep(0.5)
+            if len(converting) >= convert_window:
+                record(*converting.popleft())
+
+        def collect():
+            row_number, values, future = filling.popleft()
+            if pool is None or future.exception() is not None:
+                record(row_number, values, future)
+            else:
+                convert(row_number, values, future.result())
+
+        for row_number, values in enumerate(iter_rows(rows_file.file, batch.rows_format), 1):
+            filling.append((row_number, values, executor.submit(fill_row, values)))
+            if len(filling) >= fill_window:
+                collect()
+        while filling:
+            collect()
+        while converting:
+            record(*converting.popleft())
+        output.close()
+
+    batch.processed_rows = processed
+    batch.failed_rows = failed
+    batch.total_rows = processed + failed
+    batch.errors = errors
+    batch.status = 'done'
+    batch.finished_at = timezone.now()
+    batch.rows_file.delete(save=False)  # Field values are not kept once the documents exist
+    batch.save(update_fields=[
+        'processed_rows', 'failed_rows', 'total_rows', 'errors', 'status', 'finished_at', 'archive', 'rows_file',
+    ])
+
+
+def run_batch(batch):
+    """Generate every row of a claimed batch; returns True when it completed."""
+    try:
+        _generate(batch)
+    except Exception as e:
+        logger.error(f"Generation batch {batch.pk} failed: {e}", exc_info=True)
+        # Row errors so far were reported straight to the database, not to `batch`
+        errors = GenerationBatch.objects.filter(pk=batch.pk).values_list('errors', flat=True).first() or []
+        GenerationBatch.objects.filter(pk=batch.pk).update(
+            status='failed', finished_at=timezone.now(), errors=errors + [{'row': None, 'error': str(e)}],
+        )
+        return False
+    logger.info(f"Generation batch {batch.pk}: {batch.processed_rows} documents, {batch.failed_rows} failed rows")
+    return True
+
+
+def process_pending_batches(limit=None):
+    """Run queued batches (at most `limit`); returns the number run."""
+    processed = 0
+    while limit is None or processed < limit:
+        batch = claim_next_batch()
+        if batch is None:
+            break
+        run_batch(batch)
+        processed += 1
+    return processed
@@ -0,0 +1,105 @@
+"""
+Template catalog: the list of templates every user loads on every page.
+
+The catalog is built with one query (placeholder counts annotated, not the
+placeholders themselves) and kept in a shared cache as a versioned document:
+its entries plus an ETag, the hash of their JSON. It is stored under a
+generation number that any template or placeholder change bumps once the
+change commits (see models.py); the next request rebuilds it under the new
+generation, so between changes no request touches the database. A rebuild
+that read the old rows can only store them under the old generation, which
+nothing reads any more.
+
+GET /api/documents/templates/catalog/ serves pages of it:
+- ?page=N&page_size=M (page_size capped at MAX_PAGE_SIZE),
+- ?fields=id,name sparse fieldsets,
+- If-None-Match: each response's ETag is derived from the catalog ETag and
+  the query, so an unchanged catalog answers with 304 before any work.
+Placeholder schemas are not included; each entry links to
+/api/documents/templates/<id>/placeholders/ for the client to fetch on demand.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count
+from django.urls import reverse
+
+from .models import DocumentTemplate
+
+CATALOG_SETTINGS = {
+    'CACHE_ALIAS': 'templates',  # Shared by all workers, so invalidation reaches every process
+    'CACHE_TIMEOUT': 24 * 60 * 60,  # Seconds; changes invalidate it anyway
+    'PAGE_SIZE': 50,
+    'MAX_PAGE_SIZE': 200,
+    **getattr(settings, 'TEMPLATE_CATALOG', {}),
+}
+
+CATALOG_CACHE_KEY = 'documents:template-catalog:v1'
+CATALOG_GENERATION_KEY = 'documents:template-catalog:generation'
+
+CATALOG_FIELDS = ['id', 'name', 'created_at', 'placeholder_count', 'placeholders_url']
+
+
+def _cache():
+    return caches[CATALOG_SETTINGS['CACHE_ALIAS']]
+
+
+def build_catalog():
+    """{'etag': ..., 'entries': [...]} from a single query."""
+    rows = (
+        DocumentTemplate.objects.annotate(placeholder_count=Count('placeholders'))
+        .order_by('name', 'id')
+        .values('id', 'name', 'created_at', 'placeholder_count')
+    )
+    entries = [
+        {**row, 'placeholders_url': reverse('documents:template-placeholders', args=[row['id']])}
+        for row in rows
+    ]
+    # Serialized once: dates become strings and the hash covers exactly what is served
+    encoded = json.dumps(entries, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return {
+        'etag': hashlib.sha256(encoded.encode()).hexdigest()[:32],
+        'entries': json.loads(encoded),
+    }
+
+
+def get_catalog():
+    # Generation read before building: a change committed meanwhile makes this key obsolete
+    generation = _cache().get_or_set(CATALOG_GENERATION_KEY, time.time_ns, None)
+    key = f'{CATALOG_CACHE_KEY}:{generation}'
+    catalog = _cache().get(key)
+    if catalog is None:
+        catalog = build_catalog()
+        _cache().set(key, catalog, CATALOG_SETTINGS['CACHE_TIMEOUT'])
+    return catalog
+
+
+def _bump_generation():
+    try:
+        _cache().incr(CATALOG_GENERATION_KEY)
+    except ValueError:
+        # Evicted: start from a fresh value so no older entry can match
+        _cache().set(CATALOG_GENERATION_KEY, time.time_ns(), None)
+
+
+def invalidate_template_catalog():
+    # After commit, so the rebuild under the new generation sees the change
+    transaction.on_commit(_bump_generation)
+
+
+def catalog_page(catalog, page, page_size, fields):
+    """(entries of the page with only `fields`, total count)."""
+    entries = catalog['entries']
+    start = (page - 1) * page_size
+    return [{field: entry[field] for field in fields} for entry in entries[start:start + page_size]], len(entries)
+
+
+def page_etag(catalog, page, page_size, fields):
+    """ETag of one catalog response: changes with the catalog and with the query."""
+    key = f"{catalog['etag']}:{page}:{page_size}:{','.join(fields)}"
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
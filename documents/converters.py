@@ -0,0 +1,419 @@
+"""
+DOCX -> PDF conversion backends and the worker pool that runs them.
+
+convert_docx_to_pdf (documents/utils.py) used to write to fixed temp.docx /
+temp.pdf paths in the working directory and call Word over COM, so it only
+worked on Windows and concurrent requests overwrote each other's files.
+
+Conversions now go through a ConversionPool:
+
+* a bounded job queue (a full queue fails fast instead of piling up work),
+* a fixed number of worker threads, each owning one converter "slot"
+  (e.g. its own LibreOffice profile or unoserver process, private to the
+  OS process, since every web and worker process runs its own pool),
+* a private temporary directory per job,
+* a per-job timeout and a retry (with a fresh converter) on failure,
+* a watchdog that aborts a conversion still running past the timeout (for
+  backends that cannot enforce it themselves) and replaces the slot's
+  worker, so a hung conversion does not hold its slot forever.
+
+The backend is chosen with settings.DOCUMENT_CONVERTER['BACKEND']:
+
+* LibreOfficeConverter - headless soffice, one reused profile per slot.
+* UnoserverConverter - one long-lived unoserver process per slot; avoids the
+  LibreOffice start-up cost on every job.
+* Docx2PdfConverter - Microsoft Word via docx2pdf/COM (Windows only).
+* ReportLabConverter - pure-Python text rendering; a local stand-in for
+  development and tests where no office suite is installed.
+"""
+import logging
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from io import BytesIO
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+CONVERTER_SETTINGS = {
+    'BACKEND': 'documents.converters.LibreOfficeConverter',
+    'WORKERS': 2,
+    'QUEUE_SIZE': 32,
+    'TIMEOUT': 120,  # Seconds per attempt
+    'RETRIES': 1,
+    'OPTIONS': {},
+    **getattr(settings, 'DOCUMENT_CONVERTER', {}),
+}
+
+
+class ConversionError(Exception):
+    """Raised when a document could not be converted to PDF."""
+
+
+class ConversionTimeout(ConversionError):
+    """Raised when a conversion did not finish within the configured timeout."""
+
+
+class ConversionQueueFull(ConversionError):
+    """Raised when the conversion queue is full; callers should retry later."""
+
+
+class BaseConverter:
+    """
+    One conversion slot. A pool worker creates it in its own thread, calls
+    convert() for each job and close() when the slot is recycled.
+    """
+
+    def __init__(self, slot, **options):
+        self.slot = slot
+        self.options = options
+
+    def convert(self, docx_path, pdf_path, timeout):
+        raise NotImplementedError
+
+    def abort(self):
+        """Called from the watchdog thread when convert() hangs: stop any external process."""
+
+    def close(self):
+        pass
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class LibreOfficeConverter(BaseConverter):
+    """Headless LibreOffice with a dedicated user profile per slot, reused across its jobs."""
+
+    def __init__(self, slot, soffice_path='soffice', profile_root=None, **options):
+        super().__init__(slot, **options)
+        self.soffice_path = soffice_path
+        self._process = None
+        profile_root = profile_root or os.path.join(tempfile.gettempdir(), 'fillmate-lo-profiles')
+        os.makedirs(profile_root, exist_ok=True)
+        # Parallel soffice instances sharing a profile block each other, so the profile
+        # is private to this slot of this process (other workers run their own pools)
+        self.profile_dir = tempfile.mkdtemp(prefix=f'{os.getpid()}-slot-{slot}-', dir=profile_root)
+
+    def convert(self, docx_path, pdf_path, timeout):
+        out_dir = os.path.dirname(pdf_path)
+        command = [
+            self.soffice_path,
+            f'-env:UserInstallation=file://{self.profile_dir}',
+            '--headless', '--norestore', '--nologo',
+            '--convert-to', 'pdf', '--outdir', out_dir, docx_path,
+        ]
+        try:
+            self._process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except FileNotFoundError as e:
+            raise ConversionError(f"LibreOffice executable not found: {self.soffice_path}") from e
+        try:
+            _, stderr = self._process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired as e:
+            self._process.kill()
+            self._process.communicate()
+            raise ConversionTimeout(f"LibreOffice did not finish within {timeout}s") from e
+
+        produced = os.path.join(out_dir, os.path.splitext(os.path.basename(docx_path))[0] + '.pdf')
+        if self._process.returncode != 0 or not os.path.exists(produced):
+            raise ConversionError(f"LibreOffice failed: {stderr.decode(errors='replace').strip()}")
+        if produced != pdf_path:
+            os.replace(produced, pdf_path)
+
+    def abort(self):
+        process = self._process
+        if process is not None and process.poll() is None:
+            process.kill()
+
+    def close(self):
+        self.abort()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class UnoserverConverter(BaseConverter):
+    """
+    Keeps one unoserver (https://github.com/unoconv/unoserver) process alive per
+    slot and converts through unoconvert, so LibreOffice starts once per slot.
+    Ports are picked free at start-up, since every web and worker process runs
+    its own pool.
+    """
+
+    def __init__(self, slot, unoserver_path='unoserver', unoconvert_path='unoconvert',
+                 startup_timeout=30, **options):
+        super().__init__(slot, **options)
+        self.unoconvert_path = unoconvert_path
+        self.port = _free_port()
+        self.uno_port = _free_port()
+        self.profile_dir = tempfile.mkdtemp(prefix=f'fillmate-unoserver-{os.getpid()}-{slot}-')
+        try:
+            self.process = subprocess.Popen(
+                [unoserver_path, '--interface', '127.0.0.1', '--port', str(self.port),
+                 '--uno-port', str(self.uno_port), '--user-installation', f'file://{self.profile_dir}'],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+        except FileNotFoundError as e:
+            raise ConversionError(f"unoserver executable not found: {unoserver_path}") from e
+        self._wait_until_listening(startup_timeout)
+
+    def _wait_until_listening(self, startup_timeout):
+        deadline = time.monotonic() + startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise ConversionError(f"unoserver on port {self.port} exited during start-up")
+            try:
+                with socket.create_connection(('127.0.0.1', self.port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.25)
+        self.close()
+        raise ConversionTimeout(f"unoserver on port {self.port} did not start within {startup_timeout}s")
+
+    def convert(self, docx_path, pdf_path, timeout):
+        command = [
+            self.unoconvert_path, '--host', '127.0.0.1', '--port', str(self.port),
+            '--host-location', 'local', '--convert-to', 'pdf', docx_path, pdf_path,
+        ]
+        try:
+            result = subprocess.run(command, capture_output=True, timeout=timeout)
+        except subprocess.TimeoutExpired as e:
+            raise ConversionTimeout(f"unoconvert did not finish within {timeout}s") from e
+        if result.returncode != 0 or not os.path.exists(pdf_path):
+            raise ConversionError(f"unoconvert failed: {result.stderr.decode(errors='replace').strip()}")
+
+    def abort(self):
+        # unoconvert fails as soon as its server is gone
+        if self.process.poll() is None:
+            self.process.kill()
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class Docx2PdfConverter(BaseConverter):
+    """Microsoft Word through docx2pdf (Windows only, needs pywin32)."""
+
+    def __init__(self, slot, **options):
+        super().__init__(slot, **options)
+        import pythoncom  # Windows only
+
+        self._pythoncom = pythoncom
+        pythoncom.CoInitialize()  # COM is initialised per worker thread
+
+    def convert(self, docx_path, pdf_path, timeout):
+        from docx2pdf import convert
+
+        convert(docx_path, pdf_path)
+
+    def close(self):
+        self._pythoncom.CoUninitialize()
+
+
+class ReportLabConverter(BaseConverter):
+    """
+    Renders paragraph and table text with ReportLab. Layout is approximate;
+    meant as a stand-in for development machines and tests.
+    """
+
+    def convert(self, docx_path, pdf_path, timeout):
+        from docx import Document
+        from reportlab.lib.pagesizes import letter
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+        from xml.sax.saxutils import escape
+
+        styles = getSampleStyleSheet()
+        word_doc = Document(docx_path)
+        story = [Paragraph(escape(p.text), styles['Normal']) for p in word_doc.paragraphs if p.text.strip()]
+        for table in word_doc.tables:
+            for row in table.rows:
+                story.append(Paragraph(escape(' | '.join(cell.text for cell in row.cells)), styles['Normal']))
+            story.append(Spacer(1, 12))
+        SimpleDocTemplate(pdf_path, pagesize=letter).build(story or [Spacer(1, 12)])
+
+
+class _Job:
+    def __init__(self, docx_bytes):
+        self.docx_bytes = docx_bytes
+        self.future = Future()
+
+
+class ConversionPool:
+    """Bounded queue of conversion jobs served by a fixed set of worker threads."""
+
+    # Extra seconds a backend gets to enforce the timeout itself before the watchdog steps in
+    WATCHDOG_GRACE = 10
+
+    def __init__(self, backend, workers, queue_size, timeout, retries, options):
+        self.backend = import_string(backend) if isinstance(backend, str) else backend
+        self.timeout = timeout
+        self.retries = retries
+        self.options = options
+        self._jobs = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._generations = [0] * workers  # Bumped when a slot's hung worker is replaced
+        self._running = {}  # slot -> (generation, deadline, job, converter) of the current attempt
+        self._threads = {}
+        self._stopping = threading.Event()
+        for slot in range(workers):
+            self._start_worker(slot)
+        self._watchdog = threading.Thread(target=self._watch, name='docx-converter-watchdog', daemon=True)
+        self._watchdog.start()
+
+    def _start_worker(self, slot):
+        generation = self._generations[slot]
+        thread = threading.Thread(
+            target=self._work, args=(slot, generation), name=f'docx-converter-{slot}.{generation}', daemon=True
+        )
+        self._threads[slot] = thread
+        thread.start()
+
+    def submit(self, docx_bytes):
+        """Queue a conversion and return a Future resolving to the PDF bytes."""
+        job = _Job(docx_bytes)
+        try:
+            self._jobs.put_nowait(job)
+        except queue.Full:
+            raise ConversionQueueFull("Too many documents are being converted; please try again shortly.")
+        return job.future
+
+    def convert(self, docx_bytes, timeout=None):
+        """Convert and wait for the result (PDF bytes)."""
+        # Allow for every attempt plus time spent waiting in the queue
+        timeout = timeout or self.timeout * (self.retries + 1) * 2
+        future = self.submit(docx_bytes)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()  # Only succeeds while queued; a running job is the watchdog's business
+            raise ConversionTimeout(f"PDF conversion did not finish within {timeout}s")
+
+    def _begin(self, slot, generation, job, converter):
+        with self._lock:
+            deadline = time.monotonic() + self.timeout + self.WATCHDOG_GRACE
+            self._running[slot] = (generation, deadline, job, converter)
+
+    def _end(self, slot, generation):
+        """Finish the current attempt; False if the watchdog retired this worker meanwhile."""
+        with self._lock:
+            if self._generations[slot] != generation:
+                return False
+            self._running.pop(slot, None)
+            return True
+
+    def _work(self, slot, generation):
+        converter = None
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            if not job.future.set_running_or_notify_cancel():
+                continue  # Caller already gave up on it
+            last_error = None
+            for attempt in range(self.retries + 1):
+                try:
+                    if converter is None:
+                        converter = self.backend(slot, **self.options)
+                    self._begin(slot, generation, job, converter)
+                    pdf_bytes = self._run(converter, job.docx_bytes)
+                except Exception as e:
+                    pdf_bytes, last_error = None, e
+                if not self._end(slot, generation):
+                    # Hung past the deadline: the watchdog failed the job and started a replacement
+                    self._discard(converter)
+                    return
+                if pdf_bytes is not None:
+                    job.future.set_result(pdf_bytes)
+                    break
+                logger.warning(f"Conversion attempt {attempt + 1} failed in slot {slot}: {last_error}")
+                # Start the next attempt with a fresh converter
+                converter = self._discard(converter)
+            else:
+                job.future.set_exception(
+                    last_error if isinstance(last_error, ConversionError) else ConversionError(str(last_error))
+                )
+        self._discard(converter)
+
+    def _watch(self):
+        while not self._stopping.wait(1):
+            now = time.monotonic()
+            with self._lock:
+                hung = [(slot, entry) for slot, entry in self._running.items() if entry[1] < now]
+                for slot, _ in hung:
+                    del self._running[slot]
+                    self._generations[slot] += 1
+                    self._start_worker(slot)
+            for slot, (_, _, job, converter) in hung:
+                logger.error(f"Conversion in slot {slot} hung past {self.timeout}s; replacing the worker")
+                try:
+                    converter.abort()
+                except Exception as e:
+                    logger.warning(f"Error aborting converter: {e}")
+                if not job.future.done():
+                    job.future.set_exception(ConversionTimeout(f"PDF conversion did not finish within {self.timeout}s"))
+
+    def _run(self, converter, docx_bytes):
+        with tempfile.TemporaryDirectory(prefix='fillmate-convert-') as job_dir:
+            docx_path = os.path.join(job_dir, 'document.docx')
+            pdf_path = os.path.join(job_dir, 'document.pdf')
+            with open(docx_path, 'wb') as f:
+                f.write(docx_bytes)
+            converter.convert(docx_path, pdf_path, self.timeout)
+            with open(pdf_path, 'rb') as f:
+                return f.read()
+
+    def _discard(self, converter):
+        if converter is not None:
+            try:
+                converter.close()
+            except Exception as e:
+                logger.warning(f"Error closing converter: {e}")
+        return None
+
+    def shutdown(self):
+        self._stopping.set()
+        for _ in self._threads:
+            self._jobs.put(None)
+        for thread in list(self._threads.values()):
+            thread.join()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_conversion_pool():
+    """Return the process-wide pool, starting it on first use (i.e. after any fork)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConversionPool(
+                    CONVERTER_SETTINGS['BACKEND'],
+                    CONVERTER_SETTINGS['WORKERS'],
+                    CONVERTER_SETTINGS['QUEUE_SIZE'],
+                    CONVERTER_SETTINGS['TIMEOUT'],
+                    CONVERTER_SETTINGS['RETRIES'],
+                    CONVERTER_SETTINGS['OPTIONS'],
+                )
+    return _pool
+
+
+def convert_docx_bytes(docx_bytes):
+    """Convert DOCX bytes to a PDF buffer through the shared pool."""
+    return BytesIO(get_conversion_pool().convert(docx_bytes))
@@ -0,0 +1,203 @@
+"""
+Run-preserving DOCX filling directly on the package XML.
+
+python-docx's `para.text = ...` throws away every run (and its formatting) and
+walking paragraphs/tables/cells through its object model is slow for large
+tables. DocxXmlTemplate instead works on the zip members:
+
+* At compile time each text part (body, headers, footers, foot/endnotes) is
+  stream-parsed once. A placeholder split across several runs is gathered into
+  the first run's <w:t>, so the formatting of that run is kept and every
+  placeholder appears contiguously in its <w:t>. The part is then split into
+  static XML fragments around the placeholders in <w:t> text (never around
+  attribute values or field codes).
+* At fill time the part is re-assembled by joining fragments with values
+  escaped as element text. Every other zip member is written back with its
+  original content.
+"""
+import re
+import uuid
+import zipfile
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from lxml import etree
+
+from .utils import PLACEHOLDER_PATTERN, find_placeholders
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+W_P = f'{{{W_NS}}}p'
+W_T = f'{{{W_NS}}}t'
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+
+# Zip members whose text can hold placeholders
+TEXT_PART_PATTERN = re.compile(r'^word/(document|header\d*|footer\d*|footnotes|endnotes)\.xml$')
+
+# Characters that are not allowed in XML 1.0 documents
+INVALID_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _gather_placeholder(nodes, start, end):
+    """Move the characters in [start, end) of the paragraph text into the first <w:t> they touch."""
+    offset = 0
+    first = None
+    for node in nodes:
+        node_text = node.text or ''
+        node_start, node_end = offset, offset + len(node_text)
+        offset = node_end
+        if node_end <= start or node_start >= end:
+            continue
+        if first is None:
+            first = node
+            if node_end >= end:
+                break  # Already contiguous
+            continue
+        take = min(end, node_end) - node_start
+        first.text = (first.text or '') + node_text[:take]
+        node.text = node_text[take:]
+        if node_end >= end:
+            break
+    if first is not None:
+        first.set(XML_SPACE, 'preserve')
+
+
+def _text_nodes(paragraph):
+    # Text boxes nest paragraphs inside runs; only take text owned by this paragraph
+    return [t for t in paragraph.iter(W_T) if next(t.iterancestors(W_P)) is paragraph]
+
+
+def _normalize_paragraph(paragraph):
+    """Make every placeholder in a <w:p> contiguous; return the placeholders found."""
+    nodes = _text_nodes(paragraph)
+    text = ''.join(t.text or '' for t in nodes)
+    if '<' not in text:
+        return []
+
+    found = []
+    for match in PLACEHOLDER_PATTERN.finditer(text):
+        found.append(match.group(0))
+        _gather_placeholder(nodes, match.start(), match.end())
+    return found
+
+
+def compile_part(xml_bytes):
+    """
+    Stream-parse one XML part and return (fragments, placeholders).
+    fragments alternates static XML and raw placeholders: [xml, raw, xml, raw, ..., xml].
+    Returns (None, []) when the part holds no placeholders.
+    """
+    placeholders = []
+    context = etree.iterparse(BytesIO(xml_bytes), events=('end',), tag=W_P, huge_tree=True)
+    for _, paragraph in context:
+        placeholders.extend(_normalize_paragraph(paragraph))
+    if not placeholders:
+        return None, []
+
+    # Only <w:t> text is split: the same characters in an attribute value or a field
+    # code (<w:instrText>) stay as they are. Each placeholder is swapped for a marker
+    # found nowhere else in the part, and the serialized XML is split on the markers.
+    placeholders = list(dict.fromkeys(placeholders))
+    index = {raw: i for i, raw in enumerate(placeholders)}
+    marker = uuid.uuid4().hex
+    while marker.encode() in xml_bytes:
+        marker = uuid.uuid4().hex
+
+    def mark(match):
+        raw = match.group(0)
+        return f'{marker}{index[raw]}{marker}' if raw in index else raw
+
+    for node in context.root.iter(W_T):
+        if node.text and '<' in node.text:
+            node.text = PLACEHOLDER_PATTERN.sub(mark, node.text)
+
+    xml = etree.tostring(context.root, xml_declaration=True, encoding='UTF-8', standalone=True).decode('utf-8')
+    fragments = re.split(f'{marker}(\\d+){marker}', xml)
+    for i in range(1, len(fragments), 2):
+        fragments[i] = placeholders[int(fragments[i])]
+    return fragments, placeholders
+
+
+def scan_placeholders(docx_file):
+    """
+    Raw placeholders in every text part of a DOCX (path or file object): body,
+    tables, text boxes, headers, footers and foot/endnotes, in document order, once each.
+    Parts are streamed from the zip and paragraphs dropped once read, so memory
+    stays flat however large the template is.
+    """
+    found = {}
+    with zipfile.ZipFile(docx_file) as archive:
+        for name in archive.namelist():
+            if not TEXT_PART_PATTERN.match(name):
+                continue
+            with archive.open(name) as part:
+                for _, paragraph in etree.iterparse(part, events=('end',), tag=W_P, huge_tree=True):
+                    text = ''.join(t.text or '' for t in _text_nodes(paragraph))
+                    if '<' in text:
+                        found.update(dict.fromkeys(find_placeholders(text)))
+                    paragraph.clear(keep_tail=True)
+    return list(found)
+
+
+def _clone_info(info):
+    """Fresh ZipInfo per write: ZipFile.writestr mutates the one it is given."""
+    clone = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+    clone.compress_type = info.compress_type
+    clone.external_attr = info.external_attr
+    clone.create_system = info.create_system
+    return clone
+
+
+class DocxXmlTemplate:
+    """Zip members of a template plus the compiled fragments of its text parts."""
+
+    def __init__(self, source, parts):
+        self.parts = parts  # member name -> fragments
+        with zipfile.ZipFile(BytesIO(source)) as archive:
+            self.members = [
+                (info, None if info.filename in parts else archive.read(info))
+                for info in archive.infolist()
+            ]
+
+    @classmethod
+    def compile(cls, source):
+        """Return (DocxXmlTemplate, raw placeholders found in any text part)."""
+        parts = {}
+        placeholders = []
+        with zipfile.ZipFile(BytesIO(source)) as archive:
+            for name in archive.namelist():
+                if not TEXT_PART_PATTERN.match(name):
+                    continue
+                fragments, found = compile_part(archive.read(name))
+                if fragments is not None:
+                    parts[name] = fragments
+                    placeholders.extend(found)
+        return cls(source, parts), list(dict.fromkeys(placeholders))
+
+    def render_part(self, fragments, values):
+        """Join one part's fragments; returns (xml bytes, placeholders replaced)."""
+        pieces = []
+        replaced = 0
+        for i, fragment in enumerate(fragments):
+            if i % 2 == 0:
+                pieces.append(fragment)
+            elif fragment in values:
+                pieces.append(escape(INVALID_XML_CHARS.sub('', values[fragment])))
+                replaced += 1
+            else:
+                pieces.append(escape(fragment))
+        return ''.join(pieces).encode('utf-8'), replaced
+
+    def render(self, values):
+        """
+        Build the filled DOCX from {raw placeholder: value}.
+        Returns (docx bytes, number of placeholder occurrences replaced).
+        """
+        output = BytesIO()
+        replaced = 0
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for info, data in self.members:
+                if data is None:
+                    data, count = self.render_part(self.parts[info.filename], values)
+                    replaced += count
+                archive.writestr(_clone_info(info), data)
+        return output.getvalue(), replaced
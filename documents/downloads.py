@@ -0,0 +1,152 @@
+"""
+File delivery for documents (generated, submitted and approved documents,
+read through their FileField's storage) and PDF renditions (default storage).
+
+Views check permissions and then call serve_file(), which:
+- answers conditional requests (If-None-Match / If-Modified-Since) with 304,
+- tags files with a strong ETag (storage names are never reused for other
+  content, so name + size + modification time identify the bytes),
+- streams the file with FileResponse, so WSGI servers with a file_wrapper
+  (gunicorn, uWSGI) can use sendfile() and the file never passes through Python,
+- serves a single HTTP Range (206 / 416), e.g. for PDF viewers fetching pages,
+- or hands the transfer to the web server with X-Accel-Redirect (nginx) or
+  X-Sendfile (Apache, lighttpd) when DOCUMENT_DOWNLOADS['OFFLOAD'] is set.
+"""
+import hashlib
+import mimetypes
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+DOWNLOAD_SETTINGS = {
+    'OFFLOAD': None,  # None, 'x-accel-redirect' or 'x-sendfile'
+    'ACCEL_PREFIX': '/protected-media/',  # nginx `internal` location aliased to MEDIA_ROOT
+    **getattr(settings, 'DOCUMENT_DOWNLOADS', {}),
+}
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class _FileRange:
+    """Read-only view of `length` bytes of an open file, from its current position."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _parse_range(header, size):
+    """
+    (first, last) byte of a single range, or None to send the whole file
+    (no range, a malformed one, or several). Raises ValueError if unsatisfiable.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # Suffix range: the last N bytes
+        if int(last) == 0 or size == 0:
+            raise ValueError(header)
+        return max(0, size - int(last)), size - 1
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= size:
+        raise ValueError(header)
+    return first, min(int(last), size - 1) if last else size - 1
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag  # Strong comparison
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _file_response(request, storage, name, size, etag, last_modified, content_type):
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if range_header and _if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    file = storage.open(name, 'rb')
+    if byte_range is None:
+        return FileResponse(file, content_type=content_type)
+
+    first, last = byte_range
+    file.seek(first)
+    response = FileResponse(_FileRange(file, last - first + 1), status=206, content_type=content_type)
+    response['Content-Length'] = last - first + 1
+    response['Content-Range'] = f'bytes {first}-{last}/{size}'
+    return response
+
+
+def serve_file(request, file, filename=None, as_attachment=False, etag=None, content_type=None):
+    """
+    Response for `file`: a FieldFile (read through its field's storage) or the
+    name of a file in the default storage. Permission checks are the caller's
+    job. filename sets Content-Disposition; etag overrides the default
+    (name/size/mtime based) tag, e.g. with a content hash.
+    """
+    storage = getattr(file, 'storage', default_storage)
+    name = getattr(file, 'name', file)
+    try:
+        size = storage.size(name)
+        last_modified = int(storage.get_modified_time(name).timestamp())
+    except (FileNotFoundError, ValueError):
+        raise Http404("File not found.")
+
+    if etag is None:
+        etag = hashlib.sha256(f'{name}:{size}:{last_modified}'.encode()).hexdigest()[:32]
+    etag = quote_etag(etag)
+    content_type = content_type or mimetypes.guess_type(filename or name)[0] or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        offload = DOWNLOAD_SETTINGS['OFFLOAD']
+        if offload == 'x-accel-redirect':
+            # nginx sends the file (and handles Range) from its internal location
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = DOWNLOAD_SETTINGS['ACCEL_PREFIX'] + quote(name)
+        elif offload == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = storage.path(name)
+        else:
+            response = _file_response(request, storage, name, size, etag, last_modified, content_type)
+        if as_attachment or filename:
+            response['Content-Disposition'] = content_disposition_header(
+                as_attachment, filename or posixpath.basename(name)
+            )
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    # Documents are per user; always revalidate (cheap with the ETag)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
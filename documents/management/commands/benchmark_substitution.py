@@ -0,0 +1,124 @@
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+from docx import Document
+
+from documents.substitution import PlaceholderSubstituter
+from documents.template_cache import CompiledTemplate
+from documents.utils import clean_placeholder, extract_placeholders
+
+
+def build_template(placeholder_count, table_rows, table_cols):
+    """Build a synthetic DOCX with many placeholders and one large table."""
+    doc = Document()
+    names = [f"FIELD_{chr(65 + i % 26)}_{'X' * (i // 26)}" for i in range(placeholder_count)]
+
+    for i in range(0, placeholder_count, 4):
+        doc.add_paragraph(' and '.join(f"<{name}>" for name in names[i:i + 4]) + ' appear in this clause.')
+
+    table = doc.add_table(rows=table_rows, cols=table_cols)
+    for r, row in enumerate(table.rows):
+        for c, cell in enumerate(row.cells):
+            name = names[(r * table_cols + c) % placeholder_count]
+            cell.text = f"Row {r}: <{name}>" if c % 2 == 0 else f"Static text {r}-{c}"
+
+    buffer = BytesIO()
+    doc.save(buffer)
+    bindings = {f"<{name}>": name.lower() for name in names}
+    post_data = {name.lower(): f"value for {name.lower()}" for name in names}
+    return buffer.getvalue(), bindings, post_data
+
+
+def legacy_fill(source, bindings, post_data):
+    """The previous per-placeholder str.replace loop over every paragraph and cell."""
+    doc = Document(BytesIO(source))
+    doc_placeholders = {ph: clean_placeholder(ph) for ph in extract_placeholders(doc)}
+
+    def replace_placeholders_in_text(text):
+        for raw_placeholder, cleaned_placeholder in doc_placeholders.items():
+            if cleaned_placeholder in bindings:
+                user_value = post_data.get(bindings[cleaned_placeholder], "").strip()
+                if user_value:
+                    text = text.replace(raw_placeholder, user_value)
+        return text
+
+    for para in doc.paragraphs:
+        para.text = replace_placeholders_in_text(para.text)
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                cell.text = replace_placeholders_in_text(cell.text)
+    return doc
+
+
+class Command(BaseCommand):
+    help = "Benchmark the single-pass placeholder substitution engine against the old replace loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--placeholders', type=int, default=120)
+        parser.add_argument('--rows', type=int, default=200)
+        parser.add_argument('--cols', type=int, default=4)
+        parser.add_argument('--iterations', type=int, default=5)
+
+    def handle(self, *args, **options):
+        source, bindings, post_data = build_template(options['placeholders'], options['rows'], options['cols'])
+        iterations = options['iterations']
+        self.stdout.write(
+            f"Template: {options['placeholders']} placeholders, "
+            f"{options['rows']}x{options['cols']} table, {iterations} iterations"
+        )
+
+        # Text level: the substitution step alone, over every paragraph and cell text
+        doc = Document(BytesIO(source))
+        texts = [p.text for p in doc.paragraphs]
+        texts += [cell.text for table in doc.tables for row in table.rows for cell in row.cells]
+        compiled = CompiledTemplate.compile(0, 'benchmark', source)
+        values = compiled.resolve_values(bindings, post_data)
+        substituter = PlaceholderSubstituter(compiled.placeholders)
+
+        def legacy_texts():
+            out = []
+            for text in texts:
+                for raw, cleaned in compiled.placeholders.items():
+                    if cleaned in bindings:
+                        user_value = post_data.get(bindings[cleaned], "").strip()
+                        if user_value:
+                            text = text.replace(raw, user_value)
+                out.append(text)
+            return out
+
+        def engine_texts():
+            return [substituter.substitute(text, values) for text in texts]
+
+        if legacy_texts() != engine_texts():
+            self.stderr.write(self.style.ERROR("Engine output differs from the legacy loop"))
+            return
+
+        self._report("Substitution only", self._time(legacy_texts, iterations), self._time(engine_texts, iterations))
+
+        # End to end: load + fill + save, as the views do it
+        def legacy_end_to_end():
+            legacy_fill(source, bindings, post_data).save(BytesIO())
+
+        def engine_end_to_end():
+            compiled.fill(bindings, post_data)[0].save(BytesIO())
+
+        def xml_end_to_end():
+            compiled.xml_template.render(compiled.resolve_values(bindings, post_data))
+
+        legacy = self._time(legacy_end_to_end, iterations)
+        self._report("Load + fill + save (docx mode)", legacy, self._time(engine_end_to_end, iterations))
+        self._report("Load + fill + save (xml mode)", legacy, self._time(xml_end_to_end, iterations))
+
+    def _time(self, func, iterations):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        return (time.perf_counter() - start) / iterations
+
+    def _report(self, label, legacy, engine):
+        self.stdout.write(
+            f"{label}: legacy {legacy * 1000:.1f} ms, engine {engine * 1000:.1f} ms "
+            f"({legacy / engine:.1f}x faster)"
+        )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from documents.storage import BLOB_STORAGE_SETTINGS, collect_garbage, recount_references
+
+
+class Command(BaseCommand):
+    help = "Delete deduplicated document files that no document references any more."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=float, default=BLOB_STORAGE_SETTINGS['GC_GRACE_HOURS'],
+            help="Keep unreferenced files younger than this.",
+        )
+        parser.add_argument(
+            '--recount', action='store_true',
+            help="Recompute reference counts from the document tables first.",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be deleted.")
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            corrected = recount_references()
+            self.stdout.write(f"Corrected {corrected} reference count(s)")
+
+        removed, freed = collect_garbage(options['grace_hours'], dry_run=options['dry_run'])
+        verb = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(f"{verb} {removed} file(s), {freed / (1024 * 1024):.1f} MB")
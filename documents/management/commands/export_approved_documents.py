@@ -0,0 +1,35 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.exports import approved_documents, iter_approved_zip
+
+
+def _date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}' (expected YYYY-MM-DD)")
+
+
+class Command(BaseCommand):
+    help = "Write approved (signed) documents and a manifest.csv to a ZIP archive, e.g. for monthly archiving."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Path of the ZIP file to write.")
+        parser.add_argument('--from', dest='date_from', type=_date, help="First approval date (YYYY-MM-DD).")
+        parser.add_argument('--to', dest='date_to', type=_date, help="Last approval date (YYYY-MM-DD).")
+        parser.add_argument('--template', type=int, help="Only this template id.")
+        parser.add_argument('--user', type=int, help="Only documents submitted by this user id.")
+
+    def handle(self, *args, **options):
+        queryset = approved_documents(
+            date_from=options['date_from'], date_to=options['date_to'],
+            template_id=options['template'], user_id=options['user'],
+        )
+        written = 0
+        with open(options['output'], 'wb') as output:
+            for chunk in iter_approved_zip(queryset):
+                output.write(chunk)
+                written += len(chunk)
+        self.stdout.write(f"Wrote {written / (1024 * 1024):.1f} MB to {options['output']}")
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from documents.batches import process_pending_batches, requeue_stale_batches
+from documents.tasks import PIPELINE_SETTINGS, process_pending_jobs, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Run the background worker that renders submitted documents, notifies HODs and runs mail-merge batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the queues once and exit.")
+        parser.add_argument(
+            '--poll-interval', type=float, default=PIPELINE_SETTINGS['POLL_INTERVAL'],
+            help="Seconds to sleep when the queues are empty.",
+        )
+
+    def requeue_stale(self):
+        requeued = requeue_stale_jobs() + requeue_stale_batches()
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} abandoned job(s)")
+
+    def handle(self, *args, **options):
+        self.requeue_stale()
+
+        if options['once']:
+            processed = process_pending_jobs()
+            batches = process_pending_batches()
+            self.stdout.write(f"Processed {processed} job(s) and {batches} batch(es)")
+            return
+
+        self.stdout.write("Waiting for submissions (Ctrl+C to stop)")
+        last_stale_check = time.monotonic()
+        try:
+            while True:
+                # Submissions first: a user is waiting on each of them
+                if not process_pending_jobs() and not process_pending_batches(limit=1):
+                    time.sleep(options['poll_interval'])
+                if time.monotonic() - last_stale_check > PIPELINE_SETTINGS['STALE_AFTER']:
+                    self.requeue_stale()
+                    last_stale_check = time.monotonic()
+        except KeyboardInterrupt:
+            self.stdout.write("Worker stopped")
@@ -0,0 +1,31 @@
+"""
+Process pool workers for mail-merge batches (documents/batches.py).
+
+Imported by freshly spawned processes, so nothing here touches Django at
+import time: the initializer sets Django up (DJANGO_SETTINGS_MODULE is
+inherited from the parent) and rebuilds the compiled template once per worker.
+Workers only fill DOCX files; PDF conversion stays in the parent, on its
+shared conversion pool, so no worker starts converter threads of its own.
+"""
+_worker_template = None
+_worker_bindings = None
+
+
+def init_merge_worker(template_id, checksum, payload, bindings):
+    """ProcessPoolExecutor initializer: each worker keeps one compiled copy of the template."""
+    global _worker_template, _worker_bindings
+    import django
+    from django.apps import apps
+
+    if not apps.ready:  # Already set up when a single-worker batch runs in-process
+        django.setup()
+    from documents.template_cache import CompiledTemplate
+
+    _worker_template = CompiledTemplate.from_payload(template_id, checksum, payload)
+    _worker_bindings = bindings
+
+
+def fill_row(values):
+    """Fill the template with one row ({field name: value}); returns the DOCX bytes."""
+    docx_bytes, _ = _worker_template.render(_worker_bindings, values)
+    return docx_bytes
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0013_submitteddocument_rejection_reason'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documenttemplate',
+            name='checksum',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
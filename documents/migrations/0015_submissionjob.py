@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0014_documenttemplate_checksum'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='submitteddocument',
+            name='document',
+            field=models.FileField(blank=True, upload_to='submitted_documents/'),
+        ),
+        migrations.AlterField(
+            model_name='submitteddocument',
+            name='status',
+            field=models.CharField(choices=[('Rendering', 'Rendering'), ('Failed', 'Failed'), ('Pending', 'Pending'), ('Approved', 'Approved'), ('Rejected', 'Rejected')], default='Pending', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='SubmissionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('submission', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='job', to='documents.submitteddocument')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='documents_s_status_642420_idx')],
+            },
+        ),
+    ]
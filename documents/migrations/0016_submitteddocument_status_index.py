@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0015_submissionjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='submitteddocument',
+            index=models.Index(fields=['status', 'submitted_at'], name='submission_status_date_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0016_submitteddocument_status_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='submitteddocument',
+            name='submission_status_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='submitteddocument',
+            index=models.Index(fields=['status', '-submitted_at', '-id'], name='submission_status_keyset_idx'),
+        ),
+    ]
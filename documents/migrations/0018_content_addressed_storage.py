@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:58
+
+import documents.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0017_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='approveddocument',
+            name='signed_file',
+            field=models.FileField(storage=documents.storage.get_document_storage, upload_to='approved_docs/'),
+        ),
+        migrations.AlterField(
+            model_name='generateddocument',
+            name='file',
+            field=models.FileField(storage=documents.storage.get_document_storage, upload_to='documents/'),
+        ),
+        migrations.AlterField(
+            model_name='submitteddocument',
+            name='document',
+            field=models.FileField(blank=True, storage=documents.storage.get_document_storage, upload_to='submitted_documents/'),
+        ),
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField()),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refcount', 'updated_at'], name='documents_s_refcoun_29bde6_idx')],
+            },
+        ),
+    ]
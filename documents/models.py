@@ -1,21 +1,56 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.auth.models import User
+import hashlib
+import logging
+
+from .storage import get_document_storage
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+def file_checksum(field_file):
+    """Return the SHA-256 hex digest of a (possibly uncommitted) FieldFile."""
+    was_closed = field_file.closed
+    digest = hashlib.sha256()
+    for chunk in field_file.chunks():
+        digest.update(chunk)
+    if was_closed:
+        field_file.close()
+    else:
+        field_file.seek(0)  # Leave the file ready for storage.save()
+    return digest.hexdigest()
 
 class DocumentTemplate(models.Model):
     """Model to store document templates"""
     name = models.CharField(max_length=255, unique=True)  # Template name
     file = models.FileField(upload_to='templates/')  # DOCX file storage
     created_at = models.DateTimeField(auto_now_add=True)  # Timestamp
+    checksum = models.CharField(max_length=64, blank=True, editable=False)  # SHA-256 of file, keys the compiled template cache
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_file_name = instance.__dict__.get('file') and instance.file.name
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Re-hash only when a new file has been assigned
+        self._file_changed = bool(self.file) and (
+            not self.file._committed or self.file.name != getattr(self, '_stored_file_name', None)
+        )
+        if self._file_changed:
+            self.checksum = file_checksum(self.file)
+        super().save(*args, **kwargs)
+        self._stored_file_name = self.file.name
+
 class Placeholder(models.Model):
     """Model to store placeholders for document templates"""
     
@@ -34,23 +69,42 @@ class Placeholder(models.Model):
         return f"{self.name} ({self.placeholder_text})"
 
 # ✅ Fix: Move the import inside the function to prevent circular import
+# The only place placeholders are extracted (API upload, admin and shell saves all land here)
 @receiver(post_save, sender=DocumentTemplate)
 def extract_placeholders_signal(sender, instance, created, **kwargs):
-    if created:  # Only extract for newly uploaded templates
-        print(f"📄 New template uploaded: {instance.name}. Extracting placeholders...")
-        
+    if created or getattr(instance, '_file_changed', False):  # New template or replaced file
+        logger.info(f"Template file uploaded: {instance.name}. Extracting placeholders...")
+
         from documents.utils import extract_placeholders_from_docx  # Move import here
         
         extract_placeholders_from_docx(instance)
 
+@receiver(post_save, sender=DocumentTemplate)
+@receiver(post_delete, sender=DocumentTemplate)
+def invalidate_compiled_template_signal(sender, instance, **kwargs):
+    """Drop cached compiled copies whenever a template is saved or deleted."""
+    from documents.template_cache import invalidate_compiled_template
+
+    invalidate_compiled_template(instance.pk)
+
+@receiver([post_save, post_delete], sender=DocumentTemplate)
+@receiver([post_save, post_delete], sender=Placeholder)
+def invalidate_template_catalog_signal(sender, **kwargs):
+    """Template list or placeholder counts changed: rebuild the catalog on next request."""
+    from documents.catalog import invalidate_template_catalog
+
+    invalidate_template_catalog()
 
 
 
 
 class GeneratedDocument(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)  # Link to the user
-    file = models.FileField(upload_to='documents/')  # Store document files
+    file = models.FileField(upload_to='documents/', storage=get_document_storage)  # Store document files (deduplicated)
     created_at = models.DateTimeField(auto_now_add=True)  # Timestamp
+    batch = models.ForeignKey(
+        'GenerationBatch', on_delete=models.SET_NULL, null=True, blank=True, related_name='documents'
+    )  # Set for documents produced by a mail-merge batch
 
     def __str__(self):
         return f"{self.user.username} - {self.file.name}"
@@ -58,8 +112,10 @@ class GeneratedDocument(models.Model):
 class SubmittedDocument(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="submitted_documents")
     template = models.ForeignKey('documents.DocumentTemplate', on_delete=models.CASCADE, related_name="submitted_documents")
-    document = models.FileField(upload_to='submitted_documents/')  # Temporary null allowed
+    document = models.FileField(upload_to='submitted_documents/', storage=get_document_storage, blank=True)  # Empty while Rendering
     status = models.CharField(max_length=20, choices=[
+        ('Rendering', 'Rendering'),  # Accepted, document still being generated in the background
+        ('Failed', 'Failed'),  # Background rendering gave up
         ('Pending', 'Pending'),
         ('Approved', 'Approved'),
         ('Rejected', 'Rejected')
@@ -68,17 +124,96 @@ class SubmittedDocument(models.Model):
 
     rejection_reason = models.TextField(blank=True, null=True) # Store rejection reason
 
+    class Meta:
+        indexes = [
+            # HOD dashboard status counts and keyset-paginated per-status lists
+            models.Index(fields=['status', '-submitted_at', '-id'], name='submission_status_keyset_idx'),
+        ]
+
     def __str__(self):
          return f"Submission {self.id} by {self.user.username} ({self.status})"
 
 
+@receiver(post_save, sender=SubmittedDocument)
+@receiver(post_delete, sender=SubmittedDocument)
+def invalidate_status_counts_signal(sender, **kwargs):
+    """Status changes show up on the HOD dashboard right away."""
+    from documents.stats import invalidate_status_counts
+
+    invalidate_status_counts()
+
+
+class GenerationBatch(models.Model):
+    """Mail-merge run: one template filled once per uploaded row (see documents/batches.py)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    OUTPUT_CHOICES = [
+        ('zip', 'ZIP archive'),
+        ('records', 'Generated documents'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='generation_batches')
+    template = models.ForeignKey(DocumentTemplate, on_delete=models.CASCADE, related_name='generation_batches')
+    rows_file = models.FileField(upload_to='batches/input/', blank=True)  # Uploaded CSV/JSONL, removed when done
+    rows_format = models.CharField(max_length=5)  # 'csv' or 'jsonl'
+    format = models.CharField(max_length=4, default='docx')  # Output format of each document
+    output = models.CharField(max_length=7, choices=OUTPUT_CHOICES, default='zip')
+    filename_field = models.CharField(max_length=255, blank=True)  # Column used to name ZIP entries
+    archive = models.FileField(upload_to='batches/', blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    failed_rows = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list)  # [{'row': n, 'error': '...'}], capped
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # Last progress update while running
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"Batch {self.id} of {self.template_id} ({self.status}, {self.processed_rows}/{self.total_rows})"
+
+
+class SubmissionJob(models.Model):
+    """DB-backed queue entry that renders, converts and announces a submission (see documents/tasks.py)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    submission = models.OneToOneField(SubmittedDocument, on_delete=models.CASCADE, related_name='job')
+    payload = models.JSONField(default=dict)  # Submitted field values and output format
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    run_after = models.DateTimeField(null=True, blank=True)  # Set when a failed attempt is retried later
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"Job for submission {self.submission_id} ({self.status})"
+
+
 class ApprovedDocument(models.Model):
     original_submission = models.OneToOneField(
         'SubmittedDocument', 
         on_delete=models.CASCADE,
         related_name='approved_version'
     )
-    signed_file = models.FileField(upload_to='approved_docs/')
+    signed_file = models.FileField(upload_to='approved_docs/', storage=get_document_storage)
     approved_at = models.DateTimeField(auto_now_add=True)
     approved_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -94,3 +229,49 @@ class ApprovedDocument(models.Model):
         verbose_name = "Approved Document"
         verbose_name_plural = "Approved Documents"
 
+
+class StoredBlob(models.Model):
+    """A deduplicated document file in ContentAddressedStorage (documents/storage.py)"""
+    name = models.CharField(max_length=100, primary_key=True)  # Storage name, derived from the SHA-256
+    size = models.BigIntegerField()
+    refcount = models.IntegerField(default=0)  # FileField values pointing at this blob
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Last reference change, for the GC grace period
+
+    class Meta:
+        indexes = [models.Index(fields=['refcount', 'updated_at'])]
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
+
+    @classmethod
+    def add_reference(cls, name, size):
+        """
+        Count one more reference. The row is locked while it is checked and
+        incremented, so collect_blobs either sees the new reference or has
+        already deleted row and file, in which case the row is created again
+        (and ContentAddressedStorage._save writes the file again).
+        """
+        with transaction.atomic():
+            if cls.objects.select_for_update().filter(name=name).exists():
+                cls.objects.filter(name=name).update(refcount=models.F('refcount') + 1, updated_at=timezone.now())
+                return
+            try:
+                with transaction.atomic():
+                    cls.objects.create(name=name, size=size, refcount=1)
+            except IntegrityError:
+                # Created by a concurrent save meanwhile: count this reference on it
+                cls.add_reference(name, size)
+
+
+@receiver(post_delete, sender=GeneratedDocument)
+@receiver(post_delete, sender=SubmittedDocument)
+@receiver(post_delete, sender=ApprovedDocument)
+def release_document_file_signal(sender, instance, **kwargs):
+    """A deleted document no longer references its blob (collect_blobs removes unused ones)."""
+    for field in instance._meta.get_fields():
+        if isinstance(field, models.FileField):
+            field_file = getattr(instance, field.name)
+            if field_file:
+                field_file.storage.delete(field_file.name)
+
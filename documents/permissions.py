@@ -1,8 +1,10 @@
 from rest_framework.permissions import BasePermission
 
+from users.roles import is_hod
+
 class IsHODUser(BasePermission):
     """
     Custom permission to only allow HOD users to access certain views.
     """
     def has_permission(self, request, view):
-        return request.user.groups.filter(name='HOD').exists()
\ No newline at end of file
+        return is_hod(request.user)
\ No newline at end of file
@@ -0,0 +1,138 @@
+"""
+On-disk cache of PDF renditions (template previews, HOD review copies).
+
+Renditions are stored in the default storage (MEDIA_ROOT) under
+`renditions/<kind>/v<version>-<key>.pdf`, where key is the SHA-256 of the
+source document. The same source is therefore converted once, no matter how
+many times it is opened, and a changed source gets a new rendition. Keys come
+from what already identifies the content (blob names, template checksums), so
+opening a cached rendition does not read the source.
+
+serve_rendition() serves them through documents/downloads.py, with
+ETag/Last-Modified, 304 Not Modified for matching conditional GETs and Range support.
+"""
+import hashlib
+import logging
+import posixpath
+import threading
+from concurrent.futures import Future
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .converters import get_conversion_pool
+from .downloads import serve_file
+from .storage import ContentAddressedStorage
+from .utils import convert_docx_to_pdf
+
+logger = logging.getLogger(__name__)
+
+RENDITION_SETTINGS = {
+    'LOCATION': 'renditions',  # Directory inside the default storage
+    'VERSION': 1,  # Bump to discard every stored rendition after a renderer change
+    **getattr(settings, 'DOCUMENT_RENDITIONS', {}),
+}
+
+# One render per rendition name at a time within this process. A fixed set of
+# striped locks: names sharing a stripe just wait on each other, and nothing
+# accumulates per rendered name
+_RENDER_LOCK_STRIPES = 64
+_render_locks = [threading.Lock() for _ in range(_RENDER_LOCK_STRIPES)]
+
+
+def content_key(*parts):
+    """SHA-256 over the given bytes/str parts (e.g. the source file content)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8') if isinstance(part, str) else part)
+    return digest.hexdigest()
+
+
+def rendition_name(kind, key):
+    return posixpath.join(RENDITION_SETTINGS['LOCATION'], kind, f"v{RENDITION_SETTINGS['VERSION']}-{key}.pdf")
+
+
+def _lock_for(name):
+    stripe = int.from_bytes(hashlib.blake2b(name.encode('utf-8'), digest_size=4).digest(), 'big')
+    return _render_locks[stripe % _RENDER_LOCK_STRIPES]
+
+
+def get_rendition(kind, key, render):
+    """
+    Return the storage name of the `kind` rendition for `key`, calling
+    render() -> PDF bytes only when it is not stored yet.
+    """
+    name = rendition_name(kind, key)
+    if default_storage.exists(name):
+        return name
+
+    with _lock_for(name):
+        if default_storage.exists(name):
+            return name
+        _store(kind, name, render())
+    return name
+
+
+def _store(kind, name, pdf_bytes):
+    saved_name = default_storage.save(name, ContentFile(pdf_bytes))
+    if saved_name != name:
+        # Another process (or request) stored it first; keep theirs
+        default_storage.delete(saved_name)
+    logger.info(f"Stored {kind} rendition {name}")
+
+
+def document_key(field_file):
+    """SHA-256 of a stored document; read from the name for blobs, which are named by it."""
+    if isinstance(field_file.storage, ContentAddressedStorage) and field_file.storage.is_blob(field_file.name):
+        return posixpath.splitext(posixpath.basename(field_file.name))[0]
+    with field_file.open('rb') as f:  # Stored before blobs existed
+        return content_key(f.read())
+
+
+def get_review_rendition(document):
+    """Rendition shown to HODs in the review iframe for a submitted DOCX (a FieldFile)."""
+    def render():
+        with document.open('rb') as f:
+            return convert_docx_to_pdf(BytesIO(f.read())).getvalue()
+
+    return get_rendition('review', document_key(document), render)
+
+
+def submit_review_rendition(document):
+    """
+    get_review_rendition() without waiting: returns a Future of the rendition's
+    storage name, converted through the shared conversion pool (several can run
+    at once). Raises ConversionQueueFull when the pool takes no more jobs.
+    """
+    name = rendition_name('review', document_key(document))
+    result = Future()
+    if default_storage.exists(name):
+        result.set_result(name)
+        return result
+
+    with document.open('rb') as f:
+        conversion = get_conversion_pool().submit(f.read())
+
+    def store(done):
+        try:
+            if not default_storage.exists(name):
+                _store('review', name, done.result())
+            result.set_result(name)
+        except Exception as e:
+            result.set_exception(e)
+
+    conversion.add_done_callback(store)
+    return result
+
+
+def serve_rendition(request, name, filename=None, etag=None):
+    """
+    Serve a stored PDF inline (see documents/downloads.py), honouring conditional
+    and Range requests. Renditions are tagged by their (content-addressed) name unless etag is given.
+    """
+    return serve_file(
+        request, name, filename=filename, content_type='application/pdf',
+        etag=etag or posixpath.basename(name)[:-len('.pdf')],
+    )
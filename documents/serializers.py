@@ -1,5 +1,9 @@
+import os
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.urls import reverse
 from rest_framework import serializers
-from .models import DocumentTemplate, Placeholder, SubmittedDocument
+from .models import DocumentTemplate, GenerationBatch, Placeholder, SubmittedDocument
 from users.serializers import UserSerializer  # Adjusted import path
 
 class PlaceholderSerializer(serializers.ModelSerializer):
@@ -26,6 +30,50 @@ class SubmittedDocumentSerializer(serializers.ModelSerializer):
         model = SubmittedDocument
         fields = ['id', 'template', 'user', 'document', 'status', 'submitted_at']
 
+class SubmissionDetailSerializer(serializers.ModelSerializer):
+    """
+    Submission for the review modal. Expects the queryset of SubmissionDetailView
+    (user, template and approval joined in); the template's placeholders are
+    only added with context['include_placeholders'] and must be prefetched.
+    """
+    template = serializers.SerializerMethodField()
+    user = UserSerializer(read_only=True)
+    approval = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SubmittedDocument
+        fields = ['id', 'template', 'user', 'document', 'download_url', 'status', 'submitted_at', 'rejection_reason', 'approval']
+
+    def get_template(self, obj):
+        data = {'id': obj.template_id, 'name': obj.template.name}
+        if self.context.get('include_placeholders'):
+            data['placeholders'] = PlaceholderSerializer(obj.template.placeholders.all(), many=True).data
+        return data
+
+    def get_approval(self, obj):
+        try:
+            approved_doc = obj.approved_version
+        except ObjectDoesNotExist:
+            return None
+        return {
+            'approved_at': approved_doc.approved_at,
+            'approved_by': approved_doc.approved_by.username if approved_doc.approved_by else None,
+            'signed_url': reverse('documents:signed-download', args=[obj.id]) if approved_doc.signed_file else None,
+        }
+
+    def get_download_url(self, obj):
+        return reverse('documents:submission-download', args=[obj.id]) if obj.document else None
+
+class SubmissionListSerializer(serializers.ModelSerializer):
+    """Flat row for paginated submission lists (no nested template/placeholders)"""
+    template_name = serializers.CharField(source='template.name', read_only=True)
+    username = serializers.CharField(source='user.username', read_only=True)
+
+    class Meta:
+        model = SubmittedDocument
+        fields = ['id', 'template_id', 'template_name', 'user_id', 'username', 'document', 'status', 'submitted_at', 'rejection_reason']
+
 class DocumentReviewSerializer(serializers.Serializer):
     action = serializers.ChoiceField(choices=['approve', 'reject'])
     reason = serializers.CharField(required=False, allow_blank=True)
@@ -33,4 +81,53 @@ class DocumentReviewSerializer(serializers.Serializer):
     def validate(self, data):
         if data['action'] == 'reject' and not data.get('reason'):
             raise serializers.ValidationError("Reason is required for rejection")
-        return data
\ No newline at end of file
+        return data
+
+class BulkReviewSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+    action = serializers.ChoiceField(choices=['approve', 'reject'])
+    reason = serializers.CharField(required=False, allow_blank=True)
+
+    def validate_ids(self, value):
+        from .approvals import BULK_REVIEW_SETTINGS
+
+        if len(value) > BULK_REVIEW_SETTINGS['MAX_ITEMS']:
+            raise serializers.ValidationError(f"At most {BULK_REVIEW_SETTINGS['MAX_ITEMS']} submissions per request")
+        return value
+
+    def validate(self, data):
+        if data['action'] == 'reject' and not data.get('reason', '').strip():
+            raise serializers.ValidationError("Reason is required for rejection")
+        return data
+
+class BatchGenerationSerializer(serializers.Serializer):
+    rows = serializers.FileField()  # .csv (header row) or .jsonl (one object per line)
+    format = serializers.ChoiceField(choices=['docx', 'pdf'], default='docx')
+    output = serializers.ChoiceField(choices=GenerationBatch.OUTPUT_CHOICES, default='zip')
+    filename_field = serializers.CharField(required=False, allow_blank=True, max_length=255, default='')
+
+    def validate_rows(self, value):
+        from .batches import ROWS_FORMATS
+
+        extension = os.path.splitext(value.name)[1].lower()
+        if extension not in ROWS_FORMATS:
+            raise serializers.ValidationError("Upload a .csv or .jsonl file")
+        return value
+
+    def validate(self, data):
+        from .batches import ROWS_FORMATS
+
+        data['rows_format'] = ROWS_FORMATS[os.path.splitext(data['rows'].name)[1].lower()]
+        return data
+
+class ApprovedExportSerializer(serializers.Serializer):
+    """Query parameters of the approved documents export (all optional, dates inclusive)"""
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    template = serializers.IntegerField(required=False, min_value=1)
+    user = serializers.IntegerField(required=False, min_value=1)
+
+    def validate(self, data):
+        if data.get('date_from') and data.get('date_to') and data['date_from'] > data['date_to']:
+            raise serializers.ValidationError("date_from must not be after date_to")
+        return data
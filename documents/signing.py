@@ -0,0 +1,391 @@
+"""
+PDF signing primitives.
+
+Kept free of Django imports so the functions can run in worker processes
+started with the 'spawn' method (see documents/approvals.py).
+
+The signature overlay (the signature image drawn on an empty page) depends
+only on the signature and the page box, so SignatureOverlays builds it once
+per page box and reuses the parsed page for every document it signs.
+
+Documents are signed with an incremental update (PDF 1.7 spec, 7.5.6): the
+original bytes are kept as they are and a short tail is appended holding the
+overlay as a form XObject, a new version of the last page that draws it and a
+cross-reference section for the changed objects. Only the page tree and the
+last page are parsed, and SignedPdf streams original + tail to storage, so
+memory use does not grow with the document. Files that cannot be updated that
+way (encrypted, damaged cross-reference data) are rewritten with PyPDF2.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+from io import BytesIO
+
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, IndirectObject, NameObject, NumberObject, StreamObject,
+)
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+logger = logging.getLogger(__name__)
+
+# Signature placement, from the bottom-right corner of the page
+SIGNATURE_WIDTH = 150
+SIGNATURE_HEIGHT = 50
+SIGNATURE_RIGHT_MARGIN = 62   # x=400 on a letter page
+SIGNATURE_BOTTOM_MARGIN = 30
+
+
+def build_signature_overlay(signature, page_box=(0, 0) + letter):
+    """
+    Draw the signature (bottom right) on an otherwise empty page covering
+    page_box = (left, bottom, right, top); returns PDF bytes.
+    signature is an image path or file object.
+    """
+    left, bottom, right, top = page_box
+    overlay_packet = BytesIO()
+    # Overlay coordinates must match the target page's, even when its box does not start at 0,0
+    can = canvas.Canvas(overlay_packet, pagesize=(right, top))
+
+    can.drawImage(
+        ImageReader(signature),
+        x=right - SIGNATURE_RIGHT_MARGIN - SIGNATURE_WIDTH,
+        y=bottom + SIGNATURE_BOTTOM_MARGIN,
+        width=SIGNATURE_WIDTH, height=SIGNATURE_HEIGHT,
+        preserveAspectRatio=True,
+        mask='auto'                # Handles transparent PNGs
+    )
+    can.save()
+    return overlay_packet.getvalue()
+
+
+class SignatureOverlays:
+    """Parsed overlay pages for one signature image, one per page box, built on first use."""
+
+    def __init__(self, signature_bytes):
+        self.signature_bytes = signature_bytes
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_path(cls, signature_path):
+        with open(signature_path, 'rb') as f:
+            return cls(f.read())
+
+    def page_for(self, page):
+        box = page.mediabox
+        key = tuple(round(float(v), 2) for v in (box.left, box.bottom, box.right, box.top))
+        overlay = self._pages.get(key)
+        if overlay is None:
+            with self._lock:
+                overlay = self._pages.get(key)
+                if overlay is None:
+                    overlay_bytes = build_signature_overlay(BytesIO(self.signature_bytes), key)
+                    overlay = self._pages[key] = PdfReader(BytesIO(overlay_bytes)).pages[0]
+        return overlay
+
+
+def apply_signature_overlay(original_pdf, overlays):
+    """Sign the last page of original_pdf (path or file object) with a SignatureOverlays; returns a BytesIO."""
+    original = PdfReader(original_pdf)
+    output = PdfWriter()
+
+    # Add signature only to last page
+    for i, page in enumerate(original.pages):
+        if i == len(original.pages) - 1:
+            page.merge_page(overlays.page_for(page))
+        output.add_page(page)
+
+    output_buffer = BytesIO()
+    output.write(output_buffer)
+    output_buffer.seek(0)
+    return output_buffer
+
+
+# --- Incremental update ---
+
+SIGNATURE_XOBJECT_NAME = '/FillMateSignature'
+STARTXREF_SEARCH_BYTES = 1024   # startxref must be in the last 1024 bytes of a PDF
+
+
+class IncrementalUpdate:
+    """Objects to append to a PDF, serialized with their own cross-reference section."""
+
+    def __init__(self, first_id):
+        self.next_id = first_id
+        self.objects = {}   # idnum -> (generation, object)
+        self._copied = {}   # (idnum, generation) in the source PDF -> IndirectObject here
+
+    def add(self, obj, reference=None):
+        """Add a new object, or a new version of `reference`; returns its reference."""
+        if reference is None:
+            reference = IndirectObject(self.next_id, 0, None)
+            self.next_id += 1
+        self.objects[reference.idnum] = (reference.generation, obj)
+        return reference
+
+    def copy(self, obj):
+        """Deep copy of an object from another PDF, its indirect objects added to this update."""
+        if isinstance(obj, IndirectObject):
+            key = (obj.idnum, obj.generation)
+            if key not in self._copied:
+                reference = self._copied[key] = IndirectObject(self.next_id, 0, None)
+                self.next_id += 1
+                self.add(self.copy(obj.get_object()), reference)
+            return self._copied[key]
+        if isinstance(obj, StreamObject):
+            clone = obj.__class__()
+            clone._data = obj._data
+            clone.update({key: self.copy(value) for key, value in dict.items(obj)})
+            return clone
+        if isinstance(obj, DictionaryObject):
+            return DictionaryObject({key: self.copy(value) for key, value in dict.items(obj)})
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self.copy(value) for value in obj)
+        return obj
+
+    def serialize(self, offset, trailer, xref_stream=False):
+        """
+        Bytes to append to a file of `offset` bytes. trailer holds /Root, /Prev and
+        optionally /Info and /ID; xref_stream writes the cross-reference section as
+        a stream, as files whose last section is a stream require.
+        """
+        out = BytesIO()
+        out.write(b'\n')
+        entries = {}
+        for idnum, (generation, obj) in sorted(self.objects.items()):
+            entries[idnum] = (offset + out.tell(), generation)
+            out.write(f'{idnum} {generation} obj\n'.encode())
+            obj.write_to_stream(out, None)
+            out.write(b'\nendobj\n')
+
+        xref_offset = offset + out.tell()
+        if xref_stream:
+            xref_id = self.next_id
+            entries[xref_id] = (xref_offset, 0)
+            trailer[NameObject('/Size')] = NumberObject(xref_id + 1)
+            width = max(4, (xref_offset.bit_length() + 7) // 8)
+            xref = DecodedStreamObject()
+            xref.set_data(b''.join(
+                b'\x01' + entry_offset.to_bytes(width, 'big') + generation.to_bytes(2, 'big')
+                for _, (entry_offset, generation) in sorted(entries.items())
+            ))
+            xref.update(trailer)
+            xref.update({
+                NameObject('/Type'): NameObject('/XRef'),
+                NameObject('/W'): ArrayObject(NumberObject(w) for w in (1, width, 2)),
+                NameObject('/Index'): ArrayObject(
+                    NumberObject(n) for start, ids in _runs(entries) for n in (start, len(ids))
+                ),
+            })
+            out.write(f'{xref_id} 0 obj\n'.encode())
+            xref.write_to_stream(out, None)
+            out.write(b'\nendobj\n')
+        else:
+            trailer[NameObject('/Size')] = NumberObject(self.next_id)
+            # Head of the free list first: some readers take a table not starting at 0 for a damaged one
+            out.write(b'xref\n0 1\n0000000000 65535 f\r\n')
+            for start, ids in _runs(entries):
+                out.write(f'{start} {len(ids)}\n'.encode())
+                for idnum in ids:
+                    entry_offset, generation = entries[idnum]
+                    out.write(f'{entry_offset:010d} {generation:05d} n\r\n'.encode())
+            out.write(b'trailer\n')
+            trailer.write_to_stream(out, None)
+            out.write(b'\n')
+
+        out.write(f'startxref\n{xref_offset}\n%%EOF\n'.encode())
+        return out.getvalue()
+
+
+def _runs(entries):
+    """Object numbers grouped into consecutive runs, for the xref subsections."""
+    runs = []
+    for idnum in sorted(entries):
+        if runs and runs[-1][1][-1] == idnum - 1:
+            runs[-1][1].append(idnum)
+        else:
+            runs.append((idnum, [idnum]))
+    return runs
+
+
+def _last_xref(pdf_file, file_size):
+    """Offset of the file's last cross-reference section and whether it is a stream."""
+    pdf_file.seek(max(0, file_size - STARTXREF_SEARCH_BYTES))
+    match = re.search(rb'startxref\s+(\d+)\s+%%EOF\s*$', pdf_file.read())
+    if match is None:
+        raise ValueError('startxref not found')
+    startxref = int(match.group(1))
+    pdf_file.seek(startxref)
+    head = pdf_file.read(32).lstrip()
+    if head.startswith(b'xref'):
+        return startxref, False
+    if re.match(rb'\d+\s+\d+\s+obj', head):
+        return startxref, True
+    raise ValueError(f'startxref {startxref} does not point at a cross-reference section')
+
+
+def _stream(data):
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    return stream
+
+
+def build_signature_update(pdf_path, overlays):
+    """Incremental update signing the last page of the PDF at pdf_path; returns the bytes to append."""
+    file_size = os.path.getsize(pdf_path)
+    with open(pdf_path, 'rb') as pdf_file:
+        # A file object, not the path: PdfReader reads a path into memory in one go
+        reader = PdfReader(pdf_file)
+        if reader.is_encrypted:
+            raise ValueError('encrypted PDF')
+        startxref, xref_stream = _last_xref(pdf_file, file_size)
+
+        page = reader.pages[-1]
+        page_reference = page.indirect_reference
+        if page_reference is None:
+            raise ValueError('last page is not an indirect object')
+
+        used_ids = [int(reader.trailer.get('/Size', 0)) - 1]
+        for ids in list(reader.xref.values()) + list(reader.xref_free_entry.values()):
+            used_ids.extend(ids)
+        used_ids.extend(reader.xref_objStm)
+        update = IncrementalUpdate(max(used_ids) + 1)
+
+        # The overlay page becomes a form XObject drawn over the page
+        overlay = overlays.page_for(page)
+        form = _stream(overlay.get_contents().get_data()).flate_encode()
+        form.update({
+            NameObject('/Type'): NameObject('/XObject'),
+            NameObject('/Subtype'): NameObject('/Form'),
+            NameObject('/BBox'): ArrayObject(overlay.mediabox),
+            NameObject('/Resources'): update.copy(dict.get(overlay, '/Resources', DictionaryObject())),
+        })
+        form_reference = update.add(form)
+
+        # Shallow copies: everything the page refers to stays where it is in the original
+        resources = DictionaryObject(dict.items(page.get('/Resources', DictionaryObject())))
+        xobjects = DictionaryObject(dict.items(resources.get('/XObject', DictionaryObject())))
+        name = SIGNATURE_XOBJECT_NAME
+        while name in xobjects:
+            name += '_'
+        xobjects[NameObject(name)] = form_reference
+        resources[NameObject('/XObject')] = xobjects
+
+        contents = dict.get(page, '/Contents')
+        if contents is None:
+            contents = []
+        elif isinstance(contents.get_object(), ArrayObject):
+            contents = list(contents.get_object())
+        else:
+            contents = [contents]
+
+        # Same as merge_page: the page's own content runs inside q/Q so its graphics state cannot leak
+        new_page = DictionaryObject(dict.items(page))
+        new_page[NameObject('/Resources')] = resources
+        new_page[NameObject('/Contents')] = ArrayObject([
+            update.add(_stream(b'q\n')),
+            *contents,
+            update.add(_stream(f'\nQ\nq {name} Do Q\n'.encode())),
+        ])
+        update.add(new_page, page_reference)
+
+        trailer = DictionaryObject({NameObject('/Prev'): NumberObject(startxref)})
+        for key in ('/Root', '/Info', '/ID'):
+            if key in reader.trailer:
+                trailer[NameObject(key)] = dict.get(reader.trailer, key)
+        return update.serialize(file_size, trailer, xref_stream=xref_stream)
+
+
+class SignedPdf:
+    """
+    A signed PDF as a read-only file object: the original file followed by the
+    incremental update, read from disk as it is consumed. Without an
+    original_path, `tail` is the whole (rewritten) document.
+    Picklable, so signing workers can hand it back to the parent process.
+    """
+
+    def __init__(self, tail, original_path=None):
+        self.tail = tail
+        self.original_path = original_path
+        self.original_size = os.path.getsize(original_path) if original_path else 0
+        self.size = self.original_size + len(tail)
+        self._position = 0
+        self._file = None
+
+    def __getstate__(self):
+        return {**self.__dict__, '_file': None}
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self._position
+        chunks = []
+        if size > 0 and self._position < self.original_size:
+            if self._file is None:
+                self._file = open(self.original_path, 'rb')
+            self._file.seek(self._position)
+            chunk = self._file.read(min(size, self.original_size - self._position))
+            chunks.append(chunk)
+            self._position += len(chunk)
+            size -= len(chunk)
+        if size > 0 and self._position >= self.original_size:
+            start = self._position - self.original_size
+            chunk = self.tail[start:start + size]
+            chunks.append(chunk)
+            self._position += len(chunk)
+        return b''.join(chunks)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def sign_pdf(original_pdf, overlays):
+    """
+    Sign the last page of original_pdf (path or file object); returns a SignedPdf.
+    Paths are signed with an incremental update, anything else is rewritten.
+    """
+    if isinstance(original_pdf, (str, os.PathLike)):
+        try:
+            return SignedPdf(build_signature_update(original_pdf, overlays), original_pdf)
+        except Exception as e:
+            logger.warning(f"Incremental signing not possible for {original_pdf}, rewriting it instead: {e}")
+    return SignedPdf(apply_signature_overlay(original_pdf, overlays).getvalue())
+
+
+# --- Process pool workers ---
+
+# The pool outlives requests and serves every HOD: each worker keeps the
+# overlays of the few signatures it used last
+WORKER_OVERLAYS_KEPT = 8
+_worker_overlays = {}  # SHA-256 of the signature image -> SignatureOverlays, oldest first
+
+
+def _overlays_for(signature_bytes):
+    key = hashlib.sha256(signature_bytes).hexdigest()
+    overlays = _worker_overlays.pop(key, None) or SignatureOverlays(signature_bytes)
+    _worker_overlays[key] = overlays
+    while len(_worker_overlays) > WORKER_OVERLAYS_KEPT:
+        del _worker_overlays[next(iter(_worker_overlays))]
+    return overlays
+
+
+def sign_pdf_file(pdf_path, signature_bytes):
+    """Sign one PDF with the given signature; returns a SignedPdf (only the appended tail is sent back)."""
+    return sign_pdf(pdf_path, _overlays_for(signature_bytes))
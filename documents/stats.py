@@ -0,0 +1,46 @@
+"""
+Submission status counts for the HOD dashboard.
+
+All counts come from one conditional-aggregate query and are cached for a few
+seconds in a cache shared by the web processes and the process_submissions
+worker, so every HOD loading the dashboard shares the same result. Saving or
+deleting a submission drops the cached counts (see models.py), whichever
+process does it; the short TTL covers bulk .update() calls.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Q
+
+from .models import SubmittedDocument
+
+STATS_SETTINGS = {
+    'CACHE_ALIAS': 'sessions',  # Shared by all workers, so invalidation reaches every process
+    'CACHE_TIMEOUT': 30,  # Seconds
+    **getattr(settings, 'HOD_DASHBOARD_STATS', {}),
+}
+
+STATUS_COUNTS_CACHE_KEY = 'documents:submission-status-counts'
+
+
+def _cache():
+    return caches[STATS_SETTINGS['CACHE_ALIAS']]
+
+
+def compute_status_counts():
+    """{status: count} for every status choice, in a single query."""
+    statuses = [value for value, _ in SubmittedDocument._meta.get_field('status').choices]
+    return SubmittedDocument.objects.aggregate(
+        **{status: Count('id', filter=Q(status=status)) for status in statuses}
+    )
+
+
+def get_status_counts():
+    counts = _cache().get(STATUS_COUNTS_CACHE_KEY)
+    if counts is None:
+        counts = compute_status_counts()
+        _cache().set(STATUS_COUNTS_CACHE_KEY, counts, STATS_SETTINGS['CACHE_TIMEOUT'])
+    return counts
+
+
+def invalidate_status_counts():
+    _cache().delete(STATUS_COUNTS_CACHE_KEY)
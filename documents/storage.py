@@ -0,0 +1,195 @@
+"""
+Content-addressed, deduplicated storage for generated, submitted and approved
+documents.
+
+Files are stored once per content, as `<LOCATION>/<sha256[:2]>/<sha256><ext>`
+in MEDIA_ROOT, whatever name the caller asked for: regenerating or resubmitting
+identical output reuses the existing blob. StoredBlob counts the FileField
+values that point at each blob; saving adds a reference and delete() (called
+when a document row is deleted, see models.py) drops one. Unreferenced blobs
+are removed later by `manage.py collect_blobs`, never inline, so a blob that
+is about to be reused is not deleted under a concurrent save.
+
+Names from before this storage was introduced are not blobs; deleting one
+removes the file as before.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+BLOB_STORAGE_SETTINGS = {
+    'LOCATION': 'blobs',  # Directory inside MEDIA_ROOT
+    'GC_GRACE_HOURS': 24,  # Unreferenced blobs younger than this are kept by collect_blobs
+    **getattr(settings, 'DOCUMENT_BLOB_STORAGE', {}),
+}
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def is_blob(self, name):
+        return name.startswith(BLOB_STORAGE_SETTINGS['LOCATION'] + '/')
+
+    def blob_name(self, digest, ext):
+        return posixpath.join(BLOB_STORAGE_SETTINGS['LOCATION'], digest[:2], f'{digest}{ext.lower()}')
+
+    def get_available_name(self, name, max_length=None):
+        # The stored name comes from the content, so the requested one never needs a suffix
+        return name
+
+    def _save(self, name, content):
+        from .models import StoredBlob
+
+        # Hash while spooling to a temporary file on the same filesystem, so the
+        # content is read once and a new blob is put in place with a rename
+        temp_dir = self.path(posixpath.join(BLOB_STORAGE_SETTINGS['LOCATION'], 'tmp'))
+        os.makedirs(temp_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir, suffix='.part')
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+                    size += len(chunk)
+
+            name = self.blob_name(digest.hexdigest(), os.path.splitext(name)[1])
+            # Reference first: collect_blobs only deletes blobs whose row says unreferenced,
+            # and checks the file only after the reference is in (or the blob is gone)
+            StoredBlob.add_reference(name, size)
+
+            path = self.path(name)
+            if os.path.exists(path):
+                # Reused: a fresh mtime keeps collect_blobs' sweep of row-less files away from it
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temp_path, self.file_permissions_mode)
+                os.replace(temp_path, path)
+                temp_path = None
+        finally:
+            if temp_path is not None:
+                os.unlink(temp_path)
+        return name
+
+    def delete(self, name):
+        """Drop one reference to a blob (the file stays until collect_blobs); other names are deleted."""
+        from .models import StoredBlob
+
+        if not name:
+            return
+        if self.is_blob(name):
+            StoredBlob.objects.filter(name=name).update(refcount=F('refcount') - 1, updated_at=timezone.now())
+        else:
+            super().delete(name)
+
+    def delete_blob(self, name):
+        """Remove a blob's file for good (collect_blobs)."""
+        super().delete(name)
+
+
+document_storage = ContentAddressedStorage()
+
+
+def get_document_storage():
+    """FileField storage callable, so migrations do not serialize the instance."""
+    return document_storage
+
+
+# --- Garbage collection (manage.py collect_blobs) ---
+
+def referenced_blob_counts():
+    """Blob name -> number of document FileField values pointing at it."""
+    from .models import ApprovedDocument, GeneratedDocument, SubmittedDocument
+
+    prefix = BLOB_STORAGE_SETTINGS['LOCATION'] + '/'
+    counts = Counter()
+    for model, field in ((GeneratedDocument, 'file'), (SubmittedDocument, 'document'), (ApprovedDocument, 'signed_file')):
+        counts.update(
+            model.objects.filter(**{f'{field}__startswith': prefix}).values_list(field, flat=True).iterator()
+        )
+    return counts
+
+
+def recount_references():
+    """
+    Reset every refcount from the document tables (fixes drift, e.g. a save whose
+    transaction rolled back); returns the number of blobs corrected.
+    """
+    from .models import StoredBlob
+
+    counts = referenced_blob_counts()
+    now = timezone.now()
+    corrected = 0
+    with transaction.atomic():
+        for blob in StoredBlob.objects.select_for_update().iterator():
+            refcount = counts.pop(blob.name, 0)
+            if blob.refcount != refcount:
+                # updated_at restarts the grace period, in case a save is still committing
+                StoredBlob.objects.filter(name=blob.name).update(refcount=refcount, updated_at=now)
+                corrected += 1
+        # Referenced blobs without a row
+        for name, refcount in counts.items():
+            if document_storage.exists(name):
+                StoredBlob.objects.create(name=name, size=document_storage.size(name), refcount=refcount)
+                corrected += 1
+    return corrected
+
+
+def collect_garbage(grace_hours=None, dry_run=False):
+    """
+    Delete blobs nothing has referenced for the grace period, and files in the
+    blob directory without a row (left by failed saves); returns (files, bytes).
+    """
+    from .models import StoredBlob
+
+    if grace_hours is None:
+        grace_hours = BLOB_STORAGE_SETTINGS['GC_GRACE_HOURS']
+    cutoff = timezone.now() - timedelta(hours=grace_hours)
+    removed = freed = 0
+
+    candidates = StoredBlob.objects.filter(refcount__lte=0, updated_at__lt=cutoff)
+    for name in list(candidates.values_list('name', flat=True)):
+        with transaction.atomic():
+            # Locked and re-checked: a concurrent save may have referenced it again.
+            # StoredBlob.add_reference waits on this lock, so the file is only deleted
+            # while the row still says unreferenced, and a save arriving meanwhile
+            # finds the row gone and stores the file again.
+            blob = candidates.select_for_update().filter(name=name).first()
+            if blob is None:
+                continue
+            if not dry_run:
+                blob.delete()
+                document_storage.delete_blob(name)
+        removed += 1
+        freed += blob.size
+
+    known = set(StoredBlob.objects.values_list('name', flat=True))
+    root = document_storage.path(BLOB_STORAGE_SETTINGS['LOCATION'])
+    cutoff_timestamp = cutoff.timestamp()
+    for directory, _, files in os.walk(root):
+        for file_name in files:
+            path = os.path.join(directory, file_name)
+            name = posixpath.join(
+                BLOB_STORAGE_SETTINGS['LOCATION'], *os.path.relpath(path, root).split(os.sep)
+            )
+            stat = os.stat(path)
+            if name in known or stat.st_mtime >= cutoff_timestamp:
+                continue
+            if StoredBlob.objects.filter(name=name).exists():
+                continue  # Referenced by a save since `known` was read
+            if not dry_run:
+                os.unlink(path)
+            removed += 1
+            freed += stat.st_size
+    return removed, freed
@@ -0,0 +1,220 @@
+"""
+Background submission pipeline.
+
+SubmitDocumentView only records the submission (status 'Rendering') and a
+SubmissionJob row. Rendering, PDF conversion, saving the file and notifying
+the HODs happen here, outside the request:
+
+* `python manage.py process_submissions` runs a worker that polls the queue
+  (several workers can run side by side; jobs are claimed with SKIP LOCKED).
+* With SUBMISSION_PIPELINE['RUNNER'] = 'thread' the web process drains the
+  queue in a background thread instead - handy for development.
+
+A failed job is retried up to MAX_ATTEMPTS times, each retry after twice
+the previous delay (SubmissionJob.run_after).
+
+The frontend polls /api/documents/submissions/<id>/status/ until the
+submission leaves the 'Rendering' state. The same runners also work through
+queued mail-merge batches (documents/batches.py).
+"""
+import logging
+import threading
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import SubmissionJob, SubmittedDocument
+from .renditions import get_review_rendition
+from .stats import invalidate_status_counts
+from .template_cache import get_compiled_template
+from .utils import convert_docx_to_pdf
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_SETTINGS = {
+    'RUNNER': 'command',  # 'command' (process_submissions worker) or 'thread'
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 30,  # Seconds before the first retry, doubled for each further attempt
+    'MAX_RETRY_DELAY': 600,
+    'POLL_INTERVAL': 1.0,  # Seconds between polls when the queue is empty
+    'STALE_AFTER': 600,  # Seconds before a 'running' job is considered abandoned
+    **getattr(settings, 'SUBMISSION_PIPELINE', {}),
+}
+
+
+def enqueue_submission(user, template, post_data, field_names):
+    """
+    Record a submission in the 'Rendering' state and queue its job.
+    Only the template's own fields (plus the output format) are stored.
+    """
+    payload = {
+        'values': {name: post_data.get(name, '') for name in field_names},
+        'format': post_data.get('format', 'docx'),
+    }
+    with transaction.atomic():
+        submission = SubmittedDocument.objects.create(user=user, template=template, status='Rendering')
+        SubmissionJob.objects.create(submission=submission, payload=payload)
+        if PIPELINE_SETTINGS['RUNNER'] == 'thread':
+            transaction.on_commit(start_thread_runner)
+    return submission
+
+
+def claim_next_job():
+    """Atomically move the oldest queued job that is due to 'running' and return it (or None)."""
+    with transaction.atomic():
+        job = (
+            SubmissionJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(run_after__isnull=True) | Q(run_after__lte=timezone.now()), status='queued')
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = 'running'
+        job.attempts += 1
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'attempts', 'started_at'])
+    return job
+
+
+def requeue_stale_jobs():
+    """Put jobs whose worker died mid-run back on the queue."""
+    cutoff = timezone.now() - timedelta(seconds=PIPELINE_SETTINGS['STALE_AFTER'])
+    return SubmissionJob.objects.filter(status='running', started_at__lt=cutoff).update(status='queued')
+
+
+def render_submission(job):
+    """Fill the template, optionally convert to PDF and attach the file to the submission."""
+    submission = SubmittedDocument.objects.select_related('template', 'user').get(pk=job.submission_id)
+    template = submission.template
+
+    compiled = get_compiled_template(template)
+    db_placeholders = {p.placeholder_text: p.name for p in template.placeholders.all()}
+    docx_bytes, _ = compiled.render(db_placeholders, job.payload.get('values', {}))
+
+    if job.payload.get('format') == 'pdf':
+        content = convert_docx_to_pdf(BytesIO(docx_bytes)).getvalue()
+        file_extension = 'pdf'
+    else:
+        content = docx_bytes
+        file_extension = 'docx'
+
+    file_name = f"submitted_{template.name}_{submission.user.username}.{file_extension}"
+    if submission.document:
+        # Left over from an earlier attempt: drop its blob reference
+        submission.document.delete(save=False)
+    submission.document.save(file_name, ContentFile(content), save=False)
+
+    if file_extension == 'docx':
+        # Pre-warm the PDF the HOD review page shows
+        try:
+            get_review_rendition(submission.document)
+        except Exception as e:
+            logger.warning(f"Could not pre-render review PDF for submission {submission.id}: {e}")
+
+    submission.status = 'Pending'
+    submission.save(update_fields=['document', 'status'])
+    return submission
+
+
+def retry_delay(attempts):
+    """Seconds to wait before retrying a job that failed `attempts` times."""
+    return min(PIPELINE_SETTINGS['RETRY_DELAY'] * 2 ** (attempts - 1), PIPELINE_SETTINGS['MAX_RETRY_DELAY'])
+
+
+def run_job(job):
+    """Run one claimed job, recording success, a retry or the final failure."""
+    from notifications.utils import notify_document_submission
+
+    try:
+        submission = render_submission(job)
+    except Exception as e:
+        logger.error(f"Rendering submission {job.submission_id} failed (attempt {job.attempts}): {e}", exc_info=True)
+        job.last_error = str(e)
+        job.finished_at = timezone.now()
+        if job.attempts >= PIPELINE_SETTINGS['MAX_ATTEMPTS']:
+            job.status = 'failed'
+            SubmittedDocument.objects.filter(pk=job.submission_id).update(status='Failed')
+            invalidate_status_counts()
+        else:
+            # Back off, so a failing dependency (converter, storage) is not retried in a tight loop
+            delay = retry_delay(job.attempts)
+            job.status = 'queued'
+            job.run_after = job.finished_at + timedelta(seconds=delay)
+            if PIPELINE_SETTINGS['RUNNER'] == 'thread':
+                _start_thread_runner_later(delay)
+        job.save(update_fields=['status', 'last_error', 'finished_at', 'run_after'])
+        return False
+
+    job.status = 'done'
+    job.last_error = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'last_error', 'finished_at'])
+
+    try:
+        notify_document_submission(submission, submission.user)
+        logger.info(f"HOD notification process initiated for submission {submission.id}")
+    except Exception as notify_error:
+        logger.error(f"Failed to initiate HOD notifications for submission {submission.id}: {notify_error}", exc_info=True)
+    return True
+
+
+def process_pending_jobs(limit=None):
+    """Drain the queue (or run at most `limit` jobs); returns the number of jobs run."""
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job)
+        processed += 1
+    return processed
+
+
+_runner_lock = threading.Lock()
+_runner_thread = None
+_runner_pending = False
+
+
+def start_thread_runner():
+    """Make sure one background thread in this process is draining the queues (submissions, then batches)."""
+    global _runner_thread, _runner_pending
+    with _runner_lock:
+        _runner_pending = True
+        if _runner_thread is None:
+            _runner_thread = threading.Thread(target=_drain_in_thread, name='submission-runner', daemon=True)
+            _runner_thread.start()
+
+
+def _start_thread_runner_later(delay):
+    """Wake the runner thread once a retried job is due (it stops when the queue looks empty)."""
+    timer = threading.Timer(delay, start_thread_runner)
+    timer.daemon = True
+    timer.start()
+
+
+def _drain_in_thread():
+    global _runner_thread, _runner_pending
+    from django.db import connection
+
+    from .batches import process_pending_batches
+
+    try:
+        while True:
+            with _runner_lock:
+                if not _runner_pending:
+                    _runner_thread = None
+                    return
+                _runner_pending = False
+            try:
+                process_pending_jobs()
+                process_pending_batches()
+            except Exception as e:
+                logger.error(f"Submission runner thread failed: {e}", exc_info=True)
+    finally:
+        connection.close()
@@ -0,0 +1,261 @@
+"""
+Compiled template cache.
+
+Every fill used to re-read the template file, re-parse the DOCX and re-scan
+every paragraph and table cell for placeholders. A CompiledTemplate does that
+work once per (template id, file checksum) and is kept in two tiers:
+
+1. A bounded in-process LRU holding the parsed python-docx skeleton.
+2. A shared Django cache (file-based by default, see CACHES['templates'])
+   holding the raw bytes and placeholder map, so other workers skip the scan.
+
+Entries are content-addressed by checksum, so a new upload can never be
+served from a stale entry; the post_save/post_delete signals in models.py
+also evict the old copy from the local LRU.
+"""
+import copy
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import caches
+from docx import Document
+
+from .models import DocumentTemplate
+from .docx_xml import DocxXmlTemplate
+from .substitution import PlaceholderSubstituter
+from .utils import clean_placeholder, find_placeholders
+
+logger = logging.getLogger(__name__)
+
+CACHE_SETTINGS = {
+    'MAX_ENTRIES': 32,  # Compiled templates held per process
+    'CACHE_ALIAS': 'templates',  # Shared tier; set to None to disable
+    'TIMEOUT': 60 * 60 * 24,
+    **getattr(settings, 'DOCUMENT_TEMPLATE_CACHE', {}),
+}
+
+FILL_MODE = getattr(settings, 'DOCUMENT_FILL_MODE', 'xml')
+
+# Bump when the shared-tier payload layout (or how it is compiled) changes
+PAYLOAD_VERSION = 4
+
+
+class _LRUCache:
+    """Small thread-safe LRU keyed by (template_id, checksum)."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard_template(self, template_id):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == template_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local_cache = _LRUCache(CACHE_SETTINGS['MAX_ENTRIES'])
+
+
+class CompiledTemplate:
+    """
+    A parsed template plus a map of where each placeholder occurs.
+
+    locations maps a location tuple to the raw placeholders found there:
+    ('paragraph', i) or ('cell', table_index, row_index, cell_index).
+    xml_parts holds the compiled fragments used by the XML fill mode
+    (see documents/docx_xml.py), which also covers headers and footers.
+    """
+
+    def __init__(self, template_id, checksum, source, placeholders, locations, xml_parts):
+        self.template_id = template_id
+        self.checksum = checksum
+        self.source = source  # Original DOCX bytes
+        self.placeholders = placeholders  # raw placeholder -> cleaned placeholder
+        self.locations = locations
+        self.substituter = PlaceholderSubstituter(placeholders)
+        self.xml_template = DocxXmlTemplate(source, xml_parts)
+        self._skeleton = None  # Parsed lazily, only the 'docx' fill mode needs it
+
+    @classmethod
+    def compile(cls, template_id, checksum, source):
+        """Parse the DOCX once and record every placeholder occurrence."""
+        doc = Document(BytesIO(source))
+        locations = {}
+
+        for i, para in enumerate(doc.paragraphs):
+            found = find_placeholders(para.text)
+            if found:
+                locations[('paragraph', i)] = tuple(dict.fromkeys(found))
+
+        for t, table in enumerate(doc.tables):
+            for r, row in enumerate(table.rows):
+                for c, cell in enumerate(row.cells):
+                    found = find_placeholders(cell.text)
+                    if found:
+                        locations[('cell', t, r, c)] = tuple(dict.fromkeys(found))
+
+        xml_template, xml_placeholders = DocxXmlTemplate.compile(source)
+        raw_placeholders = [raw for found in locations.values() for raw in found] + xml_placeholders
+        placeholders = {raw: clean_placeholder(raw) for raw in raw_placeholders}
+        return cls(template_id, checksum, source, placeholders, locations, xml_template.parts)
+
+    def to_payload(self):
+        """Picklable form stored in the shared cache tier."""
+        return {
+            'source': self.source,
+            'placeholders': self.placeholders,
+            'locations': self.locations,
+            'xml_parts': self.xml_template.parts,
+        }
+
+    @classmethod
+    def from_payload(cls, template_id, checksum, payload):
+        return cls(
+            template_id, checksum, payload['source'], payload['placeholders'],
+            payload['locations'], payload['xml_parts'],
+        )
+
+    def document(self):
+        """Return a fresh, mutable copy of the parsed skeleton."""
+        if self._skeleton is None:
+            # Never read from directly: python-docx caches child proxies whose
+            # elements deepcopy would detach from the copied tree.
+            self._skeleton = Document(BytesIO(self.source))
+        return copy.deepcopy(self._skeleton)
+
+    def resolve_values(self, bindings, post_data):
+        """
+        Map raw placeholders to the submitted values.
+        bindings is {placeholder_text: field name} from the Placeholder table.
+        Placeholders without a (non-blank) value are left untouched.
+        """
+        values = {}
+        for raw, cleaned in self.placeholders.items():
+            field_name = bindings.get(cleaned)
+            if field_name is None:
+                continue
+            value = post_data.get(field_name, "").strip()
+            if value:
+                values[raw] = value
+        return values
+
+    def fill(self, bindings, post_data):
+        """
+        Fill a copy of the template, visiting only paragraphs and cells known to
+        contain placeholders. Returns (document, number of paragraphs/cells changed).
+        """
+        doc = self.document()
+        values = self.resolve_values(bindings, post_data)
+        paragraphs = doc.paragraphs
+        tables = doc.tables
+        row_cells = {}  # row.cells is rebuilt on every access, so resolve each row once
+        replacements_made = 0
+
+        for location in self.locations:
+            if location[0] == 'paragraph':
+                target = paragraphs[location[1]]
+            else:
+                _, t, r, c = location
+                if (t, r) not in row_cells:
+                    row_cells[(t, r)] = tables[t].rows[r].cells
+                target = row_cells[(t, r)][c]
+
+            original_text = target.text
+            text = self.substituter.substitute(original_text, values)
+            if text != original_text:
+                target.text = text
+                replacements_made += 1
+
+        return doc, replacements_made
+
+    def render(self, bindings, post_data):
+        """
+        Fill the template using the configured DOCUMENT_FILL_MODE.
+        Returns (docx bytes, number of replacements made).
+
+        'xml' (default) rewrites only the runs holding placeholders, keeping their
+        formatting; 'docx' goes through python-docx and flattens edited runs.
+        """
+        if FILL_MODE == 'docx':
+            doc, replacements_made = self.fill(bindings, post_data)
+            buffer = BytesIO()
+            doc.save(buffer)
+            return buffer.getvalue(), replacements_made
+        return self.xml_template.render(self.resolve_values(bindings, post_data))
+
+
+def _shared_cache():
+    alias = CACHE_SETTINGS['CACHE_ALIAS']
+    return caches[alias] if alias else None
+
+
+def _shared_key(template_id, checksum):
+    return f"compiled-template:v{PAYLOAD_VERSION}:{template_id}:{checksum}"
+
+
+def _read_template_file(template):
+    template.file.open('rb')
+    try:
+        return template.file.read()
+    finally:
+        template.file.close()
+
+
+def get_compiled_template(template):
+    """Return the CompiledTemplate for a DocumentTemplate, compiling it on a miss."""
+    source = None
+    checksum = template.checksum
+    if not checksum:
+        # Rows uploaded before checksums existed: hash once and backfill
+        source = _read_template_file(template)
+        checksum = hashlib.sha256(source).hexdigest()
+        DocumentTemplate.objects.filter(pk=template.pk).update(checksum=checksum)
+        template.checksum = checksum
+
+    key = (template.pk, checksum)
+    compiled = _local_cache.get(key)
+    if compiled is not None:
+        return compiled
+
+    shared = _shared_cache()
+    payload = shared.get(_shared_key(*key)) if shared is not None else None
+    if payload is not None:
+        compiled = CompiledTemplate.from_payload(template.pk, checksum, payload)
+    else:
+        logger.info(f"Compiling template {template.pk} ({template.name})")
+        if source is None:
+            source = _read_template_file(template)
+        compiled = CompiledTemplate.compile(template.pk, checksum, source)
+        if shared is not None:
+            shared.set(_shared_key(*key), compiled.to_payload(), CACHE_SETTINGS['TIMEOUT'])
+
+    _local_cache.set(key, compiled)
+    return compiled
+
+
+def invalidate_compiled_template(template_id):
+    """Evict every locally cached version of a template."""
+    _local_cache.discard_template(template_id)
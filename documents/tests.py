@@ -1,3 +1,1055 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group, User
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db.models import FileField
+from django.db.models.fields.files import FieldFile
+from django.http import Http404
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+from PIL import Image
+from PyPDF2 import PdfReader
+from reportlab.pdfgen import canvas
+from django.test import RequestFactory
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from notifications.models import Notification
+from users.roles import is_hod
+
+from .converters import BaseConverter, ConversionError, ConversionPool, ConversionQueueFull, ConversionTimeout
+from .docx_xml import DocxXmlTemplate
+from .downloads import DOWNLOAD_SETTINGS, serve_file
+from . import approvals, batches, renditions, tasks
+from .models import (
+    ApprovedDocument, DocumentTemplate, GeneratedDocument, GenerationBatch, Placeholder, StoredBlob, SubmissionJob,
+    SubmittedDocument,
+)
+from .signing import SignatureOverlays, sign_pdf
+from .storage import collect_garbage, document_storage, recount_references
+from .template_cache import get_compiled_template
+from .views import SubmissionDetailView, generate_document
+
+# Roles live in the shared 'sessions' cache, which outlives test runs: give the tests their own
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'documents-tests-default'},
+    'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'documents-tests-sessions'},
+    'templates': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'documents-tests-templates'},
+}
+
+
+class TempMediaMixin:
+    """Files saved by the tests go to a throwaway MEDIA_ROOT."""
+
+    @classmethod
+    def setUpClass(cls):
+        media_root = tempfile.mkdtemp(prefix='fillmate-tests-')
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        cls.addClassCleanup(override.disable)
+        super().setUpClass()
+
+
+def make_docx(*paragraphs, header=None, table=None):
+    """DOCX bytes with the given body paragraphs, an optional header paragraph and table rows."""
+    document = Document()
+    for text in paragraphs:
+        document.add_paragraph(text)
+    if header is not None:
+        document.sections[0].header.paragraphs[0].text = header
+    if table is not None:
+        grid = document.add_table(rows=len(table), cols=len(table[0]))
+        for row, values in zip(grid.rows, table):
+            for cell, value in zip(row.cells, values):
+                cell.text = value
+    buffer = BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SubmissionDetailQueryCountTests(TestCase):
+    """The review modal's detail endpoint must not issue queries per related object."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hod = User.objects.create_user('hod', password='x')
+        cls.hod.groups.add(Group.objects.create(name='HOD'))
+        cls.submitter = User.objects.create_user('submitter', password='x')
+        # bulk_create: no placeholder extraction from a real file
+        small, large = DocumentTemplate.objects.bulk_create([
+            DocumentTemplate(name='Small', file='templates/small.docx'),
+            DocumentTemplate(name='Large', file='templates/large.docx'),
+        ])
+        Placeholder.objects.bulk_create(
+            [Placeholder(template=small, name='field_0', placeholder_text='<FIELD_0>')]
+            + [Placeholder(template=large, name=f'field_{i}', placeholder_text=f'<FIELD_{i}>') for i in range(50)]
+        )
+        cls.pending = SubmittedDocument.objects.create(
+            user=cls.submitter, template=small, document='documents/pending.docx', status='Pending'
+        )
+        cls.approved = SubmittedDocument.objects.create(
+            user=cls.submitter, template=large, document='documents/approved.docx', status='Approved'
+        )
+        ApprovedDocument.objects.create(
+            original_submission=cls.approved, approved_by=cls.hod, signed_file='approved_docs/signed.pdf'
+        )
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        # Roles are resolved once per user object (users/roles.py); resolve them up front
+        is_hod(self.hod)
+        is_hod(self.submitter)
+
+    def get(self, user, submission, query=''):
+        request = APIRequestFactory().get(f'/api/documents/submissions/{submission.id}/{query}')
+        force_authenticate(request, user=user)
+        return SubmissionDetailView.as_view()(request, submission_id=submission.id)
+
+    def test_constant_queries(self):
+        # One joined query, whatever the template and approval
+        for submission in (self.pending, self.approved):
+            with self.assertNumQueries(1):
+                response = self.get(self.hod, submission)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('placeholders', response.data['template'])
+
+        self.assertIsNone(self.get(self.hod, self.pending).data['approval'])
+        approval = self.get(self.hod, self.approved).data['approval']
+        self.assertEqual(approval['approved_by'], 'hod')
+
+    def test_placeholders_prefetched(self):
+        for submission, count in ((self.pending, 1), (self.approved, 50)):
+            with self.assertNumQueries(2):
+                response = self.get(self.hod, submission, '?include=placeholders')
+            self.assertEqual(len(response.data['template']['placeholders']), count)
+
+    def test_submitter_only_sees_own(self):
+        other = User.objects.create_user('other', password='x')
+        self.assertEqual(self.get(self.submitter, self.approved).status_code, 200)
+        self.assertEqual(self.get(other, self.approved).status_code, 404)
+
+    def test_roles_cached_across_requests(self):
+        # A fresh user object (next request) reads the roles from the cache
+        hod = User.objects.get(pk=self.hod.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get(hod, self.approved).status_code, 200)
+
+        # Membership changes reach the cache once committed
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hod.groups.clear()
+        self.assertFalse(is_hod(User.objects.get(pk=self.hod.pk)))
+
+
+class FakeConverter(BaseConverter):
+    """
+    Conversion backend for the pool tests: the "PDF" is the DOCX bytes with a
+    prefix. Each convert() runs the next step of the shared script: 'ok',
+    'fail', 'crash' (not a ConversionError), 'hang' (until abort()) or an Event
+    to wait for.
+    """
+
+    def __init__(self, slot, script, log, **options):
+        super().__init__(slot, **options)
+        self.script = script
+        self.log = log
+        self.aborted = threading.Event()
+        self.closed = False
+        log.setdefault('converters', []).append(self)
+
+    def convert(self, docx_path, pdf_path, timeout):
+        self.log.setdefault('job_dirs', []).append(os.path.dirname(docx_path))
+        step = self.script.pop(0) if self.script else 'ok'
+        if step == 'fail':
+            raise ConversionError('Conversion failed')
+        if step == 'crash':
+            raise RuntimeError('Converter crashed')
+        if step == 'hang':
+            self.aborted.wait(30)
+            raise ConversionError('Aborted')
+        if isinstance(step, threading.Event):
+            step.wait(30)
+        with open(docx_path, 'rb') as source, open(pdf_path, 'wb') as target:
+            target.write(b'PDF:' + source.read())
+
+    def abort(self):
+        self.aborted.set()
+
+    def close(self):
+        self.closed = True
+
+
+class ConversionPoolTests(SimpleTestCase):
+
+    def start_pool(self, script=(), workers=1, queue_size=4, timeout=5, retries=1):
+        self.script = list(script)
+        self.log = {}
+        pool = ConversionPool(FakeConverter, workers, queue_size, timeout, retries, {'script': self.script, 'log': self.log})
+        self.addCleanup(pool.shutdown)
+        return pool
+
+    def test_converts_in_private_job_directories(self):
+        pool = self.start_pool()
+        self.assertEqual(pool.convert(b'one'), b'PDF:one')
+        self.assertEqual(pool.convert(b'two'), b'PDF:two')
+        job_dirs = self.log['job_dirs']
+        self.assertEqual(len(set(job_dirs)), 2)
+        self.assertFalse(any(os.path.exists(job_dir) for job_dir in job_dirs))
+        self.assertEqual(len(self.log['converters']), 1)  # The slot's converter is reused
+
+    def test_full_queue_fails_fast(self):
+        gate = threading.Event()
+        pool = self.start_pool(script=[gate], queue_size=1)
+        self.addCleanup(gate.set)  # Before shutdown, which waits for the worker
+        running = pool.submit(b'running')
+        while not self.log.get('job_dirs'):  # Taken off the queue by the worker
+            time.sleep(0.01)
+        queued = pool.submit(b'queued')
+        with self.assertRaises(ConversionQueueFull):
+            pool.submit(b'rejected')
+        gate.set()
+        self.assertEqual(running.result(timeout=5), b'PDF:running')
+        self.assertEqual(queued.result(timeout=5), b'PDF:queued')
+
+    def test_failed_attempt_retried_with_fresh_converter(self):
+        pool = self.start_pool(script=['fail', 'ok'])
+        self.assertEqual(pool.convert(b'doc'), b'PDF:doc')
+        first, second = self.log['converters']
+        self.assertTrue(first.closed)
+        self.assertFalse(second.closed)
+        self.assertFalse(any(os.path.exists(job_dir) for job_dir in self.log['job_dirs']))
+
+    def test_error_after_last_retry(self):
+        pool = self.start_pool(script=['fail', 'crash'])
+        with self.assertRaisesMessage(ConversionError, 'Converter crashed'):
+            pool.convert(b'doc')
+        self.assertEqual(len(self.log['job_dirs']), 2)
+        # The pool keeps serving
+        self.assertEqual(pool.convert(b'next'), b'PDF:next')
+
+    def test_watchdog_replaces_hung_worker(self):
+        pool = self.start_pool(script=['hang'], timeout=1, retries=0)
+        pool.WATCHDOG_GRACE = 0
+        with self.assertRaises(ConversionTimeout):
+            pool.submit(b'hangs').result(timeout=10)
+        hung = self.log['converters'][0]
+        self.assertTrue(hung.aborted.wait(5))
+        # A replacement worker serves the slot while the hung one winds down
+        self.assertEqual(pool.convert(b'next', timeout=10), b'PDF:next')
+        self.assertEqual(len(self.log['converters']), 2)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class GenerateDocumentTests(TempMediaMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('generator', password='x', first_name='Gen')
+        cls.template = DocumentTemplate(name='Letter')
+        cls.template.file.save('letter.docx', ContentFile(make_docx('Dear <NAME>,')))
+
+    def post(self, data):
+        request = APIRequestFactory().post(f'/api/documents/templates/{self.template.pk}/generate/', data)
+        request.user = self.user
+        return generate_document(request, self.template.pk)
+
+    def test_docx_returned_right_away(self):
+        response = self.post({'name': 'Ada'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Dear Ada,', Document(BytesIO(b''.join(response.streaming_content))).paragraphs[0].text)
+
+    def test_pdf_queued_without_converting(self):
+        with mock.patch('documents.converters.get_conversion_pool', side_effect=AssertionError('converted in the request')):
+            response = self.post({'name': 'Ada', 'format': 'pdf'})
+        self.assertEqual(response.status_code, 202)
+        batch = GenerationBatch.objects.get(pk=json.loads(response.content)['batch_id'])
+        self.assertEqual((batch.format, batch.output, batch.total_rows), ('pdf', 'records', 1))
+        with batch.rows_file.open('rb') as rows:
+            self.assertEqual(json.loads(rows.read()), {'name': 'Ada'})
+
+
+@override_settings(CACHES=TEST_CACHES)
+@mock.patch.dict(batches.BATCH_SETTINGS, {'WORKERS': 1, 'PROGRESS_EVERY': 2})
+class BatchGenerationTests(TempMediaMixin, TestCase):
+    """Mail-merge batches (documents/batches.py), run in-process with a single worker."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('merger', password='x')
+        cls.template = DocumentTemplate(name='Invite')
+        cls.template.file.save('invite.docx', ContentFile(make_docx('Dear <NAME>,')))
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+
+    def run_batch(self, names, **options):
+        rows = ContentFile(''.join(json.dumps({'name': name}) + '\n' for name in names).encode(), name='rows.jsonl')
+        batch = batches.enqueue_batch(self.user, self.template, rows, 'jsonl', **options)
+        claimed = batches.claim_next_batch()
+        self.assertEqual(claimed.pk, batch.pk)
+        batches.run_batch(claimed)
+        batch.refresh_from_db()
+        return batch
+
+    def fake_pool(self, script=()):
+        pool = ConversionPool(FakeConverter, 1, 4, 5, 1, {'script': list(script), 'log': {}})
+        self.addCleanup(pool.shutdown)
+        return mock.patch('documents.batches.get_conversion_pool', return_value=pool)
+
+    def test_zip_of_documents(self):
+        batch = self.run_batch(['Ada', 'Grace', 'Alan'], filename_field='name')
+        self.assertEqual((batch.status, batch.processed_rows, batch.failed_rows), ('done', 3, 0))
+        self.assertFalse(batch.rows_file)  # The uploaded values are not kept
+        self.assertTrue(batches.batch_status(batch)['download_url'])
+        with batch.archive.open('rb') as archive, zipfile.ZipFile(archive) as zipped:
+            self.assertEqual(zipped.namelist(), ['00001_ada.docx', '00002_grace.docx', '00003_alan.docx'])
+            document = Document(BytesIO(zipped.read('00002_grace.docx')))
+        self.assertEqual(document.paragraphs[0].text, 'Dear Grace,')
+
+    def test_row_errors_do_not_stop_the_batch(self):
+        fill_row = batches.fill_row
+
+        def fill(values):
+            if values['name'] == 'Bad':
+                raise ValueError('Unusable row')
+            return fill_row(values)
+
+        with mock.patch('documents.batches.fill_row', side_effect=fill):
+            batch = self.run_batch(['Ada', 'Bad', 'Alan'])
+        self.assertEqual((batch.status, batch.processed_rows, batch.failed_rows), ('done', 2, 1))
+        self.assertEqual(batch.errors, [{'row': 2, 'error': 'Unusable row'}])
+        with batch.archive.open('rb') as archive, zipfile.ZipFile(archive) as zipped:
+            self.assertEqual(zipped.namelist(), ['invite_00001.docx', 'invite_00003.docx'])
+
+    def test_pdf_records_converted_in_the_parent(self):
+        # Row 2 fails both conversion attempts
+        with self.fake_pool(['ok', 'fail', 'fail']), \
+                mock.patch('documents.converters.get_conversion_pool', side_effect=AssertionError('worker pool')):
+            batch = self.run_batch(['Ada', 'Grace', 'Alan'], format='pdf', output='records')
+        self.assertEqual((batch.status, batch.processed_rows, batch.failed_rows), ('done', 2, 1))
+        self.assertEqual([error['row'] for error in batch.errors], [2])
+        documents = list(batch.documents.order_by('pk'))
+        self.assertEqual(batches.batch_status(batch)['document_ids'], [document.pk for document in documents])
+        self.assertEqual([document.file.name.rsplit('.', 1)[1] for document in documents], ['pdf', 'pdf'])
+        with documents[1].file.open('rb') as f:
+            pdf = f.read()
+        self.assertTrue(pdf.startswith(b'PDF:PK'))  # FakeConverter's "PDF" of the filled DOCX
+        self.assertIn('Dear Alan,', Document(BytesIO(pdf[4:])).paragraphs[0].text)
+
+    def test_waits_when_conversion_queue_is_full(self):
+        with self.fake_pool() as get_pool, mock.patch('documents.batches.time.sleep') as sleep:
+            pool = get_pool.return_value
+            submit = pool.submit
+            pool.submit = mock.Mock(side_effect=[ConversionQueueFull('busy'), submit(b'one')])
+            batch = self.run_batch(['Ada'], format='pdf')
+        sleep.assert_called_once()
+        self.assertEqual((batch.processed_rows, batch.failed_rows), (1, 0))
+
+    def test_stale_batch_requeued_without_its_documents(self):
+        with self.fake_pool():
+            batch = self.run_batch(['Ada', 'Grace'], format='pdf', output='records')
+        GenerationBatch.objects.filter(pk=batch.pk).update(
+            status='running', heartbeat_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(batches.requeue_stale_batches(), 1)
+        batch.refresh_from_db()
+        self.assertEqual((batch.status, batch.processed_rows, batch.failed_rows, batch.errors), ('queued', 0, 0, []))
+        self.assertFalse(batch.documents.exists())
+        # A batch still reporting progress is left alone
+        GenerationBatch.objects.filter(pk=batch.pk).update(status='running', heartbeat_at=timezone.now())
+        self.assertEqual(batches.requeue_stale_batches(), 0)
+
+
+@override_settings(CACHES=TEST_CACHES)
+@mock.patch.dict(tasks.PIPELINE_SETTINGS, {'RUNNER': 'command', 'MAX_ATTEMPTS': 3, 'RETRY_DELAY': 30, 'MAX_RETRY_DELAY': 600})
+class SubmissionPipelineTests(TempMediaMixin, TestCase):
+    """The SubmissionJob queue (documents/tasks.py) and the status endpoint polled while it runs."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pipeline', password='x')
+        cls.hod = User.objects.create_user('pipeline-hod', password='x')
+        cls.hod.groups.add(Group.objects.get_or_create(name='HOD')[0])
+        cls.template = DocumentTemplate(name='Claim')
+        cls.template.file.save('claim.docx', ContentFile(make_docx('Claimant: <NAME>')))
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+
+    def enqueue(self, name='Ada'):
+        return tasks.enqueue_submission(self.user, self.template, {'name': name, 'is_staff': '1'}, ['name'])
+
+    def status(self, submission, user=None):
+        client = APIClient()
+        client.force_authenticate(user or self.user)
+        return client.get(reverse('documents:submission-status', args=[submission.pk]))
+
+    def test_enqueue_and_run(self):
+        submission = self.enqueue()
+        self.assertEqual(submission.status, 'Rendering')
+        self.assertEqual(submission.job.payload, {'values': {'name': 'Ada'}, 'format': 'docx'})
+        self.assertEqual(self.status(submission).data['job_status'], 'queued')
+
+        self.assertEqual(tasks.process_pending_jobs(), 1)
+        submission.refresh_from_db()
+        self.assertEqual((submission.status, submission.job.status), ('Pending', 'done'))
+        with submission.document.open('rb') as f:
+            self.assertEqual(Document(f).paragraphs[0].text, 'Claimant: Ada')
+        self.assertEqual(list(Notification.objects.values_list('recipient', flat=True)), [self.hod.pk])
+        data = self.status(submission).data
+        self.assertEqual((data['status'], data['document_ready'], data['attempts']), ('Pending', True, 1))
+
+    def test_claim_oldest_due_job(self):
+        first, second, later = self.enqueue('A'), self.enqueue('B'), self.enqueue('C')
+        SubmissionJob.objects.filter(submission=first).update(run_after=timezone.now() + timedelta(minutes=1))
+        SubmissionJob.objects.filter(submission=later).update(run_after=timezone.now() - timedelta(seconds=1))
+
+        job = tasks.claim_next_job()
+        self.assertEqual((job.submission_id, job.status, job.attempts), (second.pk, 'running', 1))
+        self.assertEqual(tasks.claim_next_job().submission_id, later.pk)
+        self.assertIsNone(tasks.claim_next_job())  # `first` is not due yet
+
+    def test_retried_with_backoff_then_failed(self):
+        submission = self.enqueue()
+        with mock.patch('documents.tasks.render_submission', side_effect=RuntimeError('Converter down')):
+            for attempt, delay in ((1, 30), (2, 60)):
+                job = tasks.claim_next_job()
+                self.assertEqual(job.attempts, attempt)
+                self.assertFalse(tasks.run_job(job))
+                job.refresh_from_db()
+                self.assertEqual(job.status, 'queued')
+                self.assertEqual(job.run_after - job.finished_at, timedelta(seconds=delay))
+                self.assertIsNone(tasks.claim_next_job())
+                self.assertEqual(self.status(submission).data['retry_at'], job.run_after)
+                SubmissionJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+
+            self.assertFalse(tasks.run_job(tasks.claim_next_job()))
+        job.refresh_from_db()
+        submission.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, submission.status), ('failed', 3, 'Failed'))
+        data = self.status(submission).data
+        self.assertEqual((data['error'], data['retry_at']), ('Converter down', None))
+
+    def test_retry_delay_capped(self):
+        self.assertEqual([tasks.retry_delay(attempts) for attempts in (1, 2, 3, 6, 10)], [30, 60, 120, 600, 600])
+
+    def test_stale_jobs_requeued(self):
+        stale, running = self.enqueue('A'), self.enqueue('B')
+        tasks.claim_next_job()
+        tasks.claim_next_job()
+        SubmissionJob.objects.filter(submission=stale).update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(tasks.requeue_stale_jobs(), 1)
+        self.assertEqual(SubmissionJob.objects.get(submission=stale).status, 'queued')
+        self.assertEqual(SubmissionJob.objects.get(submission=running).status, 'running')
+
+    def test_status_visible_to_submitter_and_hods_only(self):
+        submission = self.enqueue()
+        stranger = User.objects.create_user('stranger', password='x')
+        self.assertEqual(self.status(submission, self.hod).status_code, 200)
+        self.assertEqual(self.status(submission, stranger).status_code, 404)
+
+
+def table_xref_pdf(pages=2):
+    """PDF bytes with a classic cross-reference table (as ReportLab writes it)."""
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for number in range(1, pages + 1):
+        pdf.drawString(72, 720, f'Page {number}')
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def stream_xref_pdf():
+    """One-page PDF whose cross-reference section is a stream (PDF 1.5+ writers)."""
+    content = b'BT /F1 12 Tf 72 720 Td (Stream xref) Tj ET'
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R'
+        b' /Resources << /Font << /F1 5 0 R >> >> >>',
+        b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    out = BytesIO()
+    out.write(b'%PDF-1.5\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+    xref_offset = out.tell()
+    offsets.append(xref_offset)  # The stream itself is the last object
+    rows = b'\x00' + bytes(4) + b'\xff\xff' + b''.join(b'\x01' + offset.to_bytes(4, 'big') + bytes(2) for offset in offsets)
+    out.write(
+        b'%d 0 obj\n<< /Type /XRef /Size %d /W [1 4 2] /Root 1 0 R /Length %d >>\nstream\n'
+        % (len(offsets), len(offsets) + 1, len(rows))
+    )
+    out.write(rows + b'\nendstream\nendobj\n')
+    out.write(b'startxref\n%d\n%%%%EOF\n' % xref_offset)
+    return out.getvalue()
+
+
+class IncrementalSigningTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        signature = BytesIO()
+        Image.new('RGBA', (60, 20), (0, 0, 128, 255)).save(signature, 'PNG')
+        cls.overlays = SignatureOverlays(signature.getvalue())
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='fillmate-signing-')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def sign(self, path):
+        signed = sign_pdf(path, self.overlays)
+        self.assertEqual(signed.original_path, path)  # Appended to, not rewritten
+        data = signed.read()
+        signed.close()
+        with open(path, 'rb') as f:
+            self.assertTrue(data.startswith(f.read()))
+        return data
+
+    def assertSigned(self, data, pages, names=('/FillMateSignature',)):
+        reader = PdfReader(BytesIO(data), strict=True)  # No recovery from damaged cross-references
+        self.assertEqual(len(reader.pages), pages)
+        last = reader.pages[-1]
+        xobjects = last['/Resources']['/XObject']
+        for name in names:
+            self.assertEqual(xobjects[name].get_object()['/Subtype'], '/Form')
+            contents = b''.join(stream.get_object().get_data() for stream in last['/Contents'])
+            self.assertIn(f'{name} Do'.encode(), contents)
+        # Earlier pages are left alone
+        for page in reader.pages[:-1]:
+            self.assertNotIn('/XObject', page['/Resources'])
+        return reader
+
+    def test_table_xref(self):
+        data = self.sign(self.write('table.pdf', table_xref_pdf(pages=2)))
+        self.assertSigned(data, pages=2)
+        self.assertIn(b'\ntrailer\n', data[-400:])
+        self.assertIn(b'Page 1', PdfReader(BytesIO(data)).pages[0].extract_text().encode())
+
+    def test_stream_xref(self):
+        original = stream_xref_pdf()
+        self.assertEqual(len(PdfReader(BytesIO(original)).pages), 1)
+        data = self.sign(self.write('stream.pdf', original))
+        self.assertIn(b'/XRef', data[len(original):])
+        self.assertNotIn(b'trailer', data[len(original):])
+        self.assertSigned(data, pages=1)
+
+    def test_signed_twice(self):
+        once = self.sign(self.write('table.pdf', table_xref_pdf(pages=3)))
+        twice = self.sign(self.write('once.pdf', once))
+        self.assertIn(b'/Prev', twice[len(once):])
+        self.assertSigned(twice, pages=3, names=('/FillMateSignature', '/FillMateSignature_'))
+
+    def test_unexpected_file_end_rewritten(self):
+        # Readers accept junk after %%EOF; the incremental writer does not guess where the file ends
+        damaged = self.write('damaged.pdf', table_xref_pdf(pages=2) + b'junk\n')
+        with self.assertLogs('documents.signing', 'WARNING'):
+            signed = sign_pdf(damaged, self.overlays)
+        self.assertIsNone(signed.original_path)
+        self.assertEqual(len(PdfReader(BytesIO(signed.read())).pages), 2)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BulkReviewTests(TempMediaMixin, TestCase):
+    """bulk_approve / bulk_reject (documents/approvals.py): per-item results and the locked re-checks."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hod = User.objects.create_user('bulk-hod', password='x')
+        signature = BytesIO()
+        Image.new('RGBA', (60, 20), (0, 0, 128, 255)).save(signature, 'PNG')
+        cls.hod.userprofile.digital_signature.save('signature.png', ContentFile(signature.getvalue()))
+        cls.submitter = User.objects.create_user('bulk-submitter', password='x')
+        cls.template = DocumentTemplate(name='Leave')
+        cls.template.file.save('leave.docx', ContentFile(make_docx('Name: <NAME>')))
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+
+    def submit(self, status='Pending', pdf=None):
+        submission = SubmittedDocument(user=self.submitter, template=self.template, status=status)
+        submission.document.save('leave.pdf', ContentFile(pdf or table_xref_pdf(1)))
+        return submission
+
+    def approve(self, ids):
+        with self.captureOnCommitCallbacks(execute=True):
+            return approvals.bulk_approve(ids, self.hod, self.hod.userprofile)
+
+    def test_approve_reports_each_item(self):
+        good, damaged, done, missing = self.submit(), self.submit(pdf=b'not a pdf'), self.submit('Approved'), self.submit()
+        os.remove(missing.document.path)
+        results = self.approve([good.pk, damaged.pk, done.pk, missing.pk, 0])
+        self.assertEqual([(result['id'], result['status']) for result in results], [
+            (good.pk, 'approved'), (damaged.pk, 'error'), (done.pk, 'error'), (missing.pk, 'error'), (0, 'error'),
+        ])
+        self.assertIn('PDF signing failed', results[1]['error'])
+        self.assertEqual(results[2]['error'], 'Submission is already Approved.')
+        self.assertEqual(results[4]['error'], 'Submission not found.')
+
+        good.refresh_from_db()
+        self.assertEqual(good.status, 'Approved')
+        self.assertEqual(SubmittedDocument.objects.get(pk=damaged.pk).status, 'Pending')
+        approved = ApprovedDocument.objects.get()
+        self.assertEqual((approved.original_submission_id, approved.approved_by), (good.pk, self.hod))
+        with approved.signed_file.open('rb') as f:
+            self.assertEqual(len(PdfReader(f).pages), 1)
+        self.assertEqual(Notification.objects.filter(recipient=self.submitter).count(), 1)
+
+    def test_approve_rechecks_under_lock(self):
+        first, second = self.submit(), self.submit()
+        sign_all = approvals._sign_all
+
+        def reviewed_meanwhile(items, overlays):
+            sign_all(items, overlays)
+            SubmittedDocument.objects.filter(pk=second.pk).update(status='Rejected')
+
+        with mock.patch('documents.approvals._sign_all', side_effect=reviewed_meanwhile):
+            results = self.approve([first.pk, second.pk])
+        self.assertEqual(results[1], {'id': second.pk, 'status': 'error', 'error': 'Submission was reviewed by someone else.'})
+        self.assertEqual(results[0]['status'], 'approved')
+        self.assertEqual(SubmittedDocument.objects.get(pk=second.pk).status, 'Rejected')
+        # Only the approved submission's signed file is kept
+        self.assertEqual(ApprovedDocument.objects.count(), 1)
+        signed_files = os.listdir(os.path.dirname(ApprovedDocument.objects.get().signed_file.path))
+        self.assertEqual(len(signed_files), 1)
+
+    def test_reject_rechecks_under_lock(self):
+        first, second, done = self.submit(), self.submit(), self.submit('Approved')
+        load_items = approvals._load_items
+
+        def reviewed_meanwhile(ids):
+            items = load_items(ids)
+            SubmittedDocument.objects.filter(pk=first.pk).update(status='Approved')
+            return items
+
+        with mock.patch('documents.approvals._load_items', side_effect=reviewed_meanwhile):
+            results = approvals.bulk_reject([first.pk, second.pk, done.pk], self.hod, 'Incomplete')
+        self.assertEqual([result['status'] for result in results], ['error', 'rejected', 'error'])
+        self.assertEqual(results[0]['error'], 'Submission was reviewed by someone else.')
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.rejection_reason), ('Rejected', 'Incomplete'))
+        self.assertEqual(SubmittedDocument.objects.get(pk=first.pk).status, 'Approved')
+        self.assertEqual(
+            list(Notification.objects.values_list('object_id', flat=True)), [second.pk]
+        )
+
+    @mock.patch.dict(approvals.BULK_REVIEW_SETTINGS, {'WORKERS': 2})
+    def test_signing_pool_shared_between_requests(self):
+        self.addCleanup(lambda: approvals._signing_pool and approvals._discard_signing_pool(approvals._signing_pool))
+        first = self.approve([self.submit().pk, self.submit().pk])
+        pool = approvals.get_signing_pool()
+        second = self.approve([self.submit().pk, self.submit().pk])
+        self.assertIs(approvals.get_signing_pool(), pool)
+        self.assertEqual([result['status'] for result in first + second], ['approved'] * 4)
+
+
+class DocxXmlFillTests(SimpleTestCase):
+    """The 'xml' fill mode (documents/docx_xml.py) edits only the runs holding placeholders."""
+
+    def fill(self, source, values):
+        template, placeholders = DocxXmlTemplate.compile(source)
+        docx_bytes, replaced = template.render(values)
+        return Document(BytesIO(docx_bytes)), placeholders, replaced
+
+    def test_split_runs_gathered_into_first_run(self):
+        document = Document()
+        paragraph = document.add_paragraph('Dear ')
+        paragraph.add_run('<FIRST').bold = True
+        paragraph.add_run('_NAME>').italic = True
+        paragraph.add_run(', welcome')
+        source = BytesIO()
+        document.save(source)
+
+        filled, placeholders, replaced = self.fill(source.getvalue(), {'<FIRST_NAME>': 'Ada'})
+        self.assertEqual(placeholders, ['<FIRST_NAME>'])
+        self.assertEqual(replaced, 1)
+        runs = filled.paragraphs[0].runs
+        self.assertEqual(filled.paragraphs[0].text, 'Dear Ada, welcome')
+        # The value takes the formatting of the run the placeholder started in
+        self.assertEqual([(run.text, run.bold, run.italic) for run in runs], [
+            ('Dear ', None, None), ('Ada', True, None), ('', None, True), (', welcome', None, None),
+        ])
+
+    def test_headers_footers_and_tables(self):
+        document = Document()
+        document.add_paragraph('Body <BODY>')
+        section = document.sections[0]
+        section.header.paragraphs[0].text = 'Header <HEADER>'
+        section.footer.paragraphs[0].text = 'Footer <FOOTER>'
+        table = document.add_table(rows=1, cols=2)
+        table.cell(0, 0).text = '<LEFT>'
+        table.cell(0, 1).text = 'Unchanged <MISSING>'
+        source = BytesIO()
+        document.save(source)
+
+        values = {'<BODY>': 'b', '<HEADER>': 'h', '<FOOTER>': 'f', '<LEFT>': 'l'}
+        filled, placeholders, replaced = self.fill(source.getvalue(), values)
+        self.assertEqual(set(placeholders), set(values) | {'<MISSING>'})
+        self.assertEqual(replaced, 4)
+        self.assertEqual(filled.paragraphs[0].text, 'Body b')
+        self.assertEqual(filled.sections[0].header.paragraphs[0].text, 'Header h')
+        self.assertEqual(filled.sections[0].footer.paragraphs[0].text, 'Footer f')
+        self.assertEqual([cell.text for cell in filled.tables[0].rows[0].cells], ['l', 'Unchanged <MISSING>'])
+
+    def test_values_escaped(self):
+        source = make_docx('To: <NAME>')
+        filled, _, _ = self.fill(source, {'<NAME>': 'O\'Brien & <Sons> "Ltd"\x07'})
+        self.assertEqual(filled.paragraphs[0].text, 'To: O\'Brien & <Sons> "Ltd"')
+
+    def test_attributes_and_field_codes_left_alone(self):
+        document = Document()
+        paragraph = document.add_paragraph('Name: <NAME>')
+        paragraph._p.insert(0, parse_xml(f'<w:bookmarkStart {nsdecls("w")} w:id="0" w:name="&lt;NAME&gt;"/>'))
+        paragraph._p.append(parse_xml(
+            f'<w:r {nsdecls("w")}><w:instrText xml:space="preserve"> MERGEFIELD &lt;NAME&gt; </w:instrText></w:r>'
+        ))
+        source = BytesIO()
+        document.save(source)
+
+        template, _ = DocxXmlTemplate.compile(source.getvalue())
+        docx_bytes, replaced = template.render({'<NAME>': 'Say "hi" & go'})
+        self.assertEqual(replaced, 1)
+        filled = Document(BytesIO(docx_bytes))  # Still well-formed
+        paragraph = filled.paragraphs[0]._p
+        self.assertEqual(paragraph.xpath('string(.//w:t)'), 'Name: Say "hi" & go')
+        self.assertEqual(paragraph.xpath('string(.//w:instrText)'), ' MERGEFIELD <NAME> ')
+        self.assertEqual(paragraph.xpath('string(w:bookmarkStart/@w:name)'), '<NAME>')
+
+
+class BlobStorageTests(TempMediaMixin, TestCase):
+    """Deduplicated document storage and its garbage collection (documents/storage.py)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('blobs', password='x')
+
+    def generate(self, content, name='letter.docx'):
+        document = GeneratedDocument(user=self.user)
+        document.file.save(name, ContentFile(content))
+        return document
+
+    def refcount(self, name):
+        return StoredBlob.objects.get(name=name).refcount
+
+    def age(self, name, hours=48):
+        StoredBlob.objects.filter(name=name).update(updated_at=timezone.now() - timedelta(hours=hours))
+
+    def test_identical_content_stored_once(self):
+        first = self.generate(b'same content', 'first.docx')
+        second = self.generate(b'same content', 'second.docx')
+        other = self.generate(b'other content', 'first.docx')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertNotEqual(first.file.name, other.file.name)
+        self.assertTrue(first.file.name.startswith('blobs/'))
+        self.assertEqual(self.refcount(first.file.name), 2)
+        self.assertEqual(self.refcount(other.file.name), 1)
+        with first.file.open('rb') as f:
+            self.assertEqual(f.read(), b'same content')
+
+    def test_delete_and_replace_release_references(self):
+        first = self.generate(b'shared')
+        second = self.generate(b'shared')
+        name = first.file.name
+
+        first.delete()
+        self.assertEqual(self.refcount(name), 1)
+        # Replacing a file drops the old reference first (as render_submission does)
+        second.file.delete(save=False)
+        second.file.save('new.docx', ContentFile(b'replacement'))
+        self.assertEqual(self.refcount(name), 0)
+        self.assertTrue(document_storage.exists(name))  # Removed by collect_blobs, never inline
+
+    def test_collect_garbage_after_grace_period(self):
+        unused = self.generate(b'unused')
+        used = self.generate(b'used')
+        name = unused.file.name
+        unused.delete()
+
+        self.assertEqual(collect_garbage(grace_hours=24), (0, 0))  # Released just now
+        self.age(name)
+        self.age(used.file.name)
+        self.assertEqual(collect_garbage(grace_hours=24, dry_run=True), (1, len(b'unused')))
+        self.assertTrue(document_storage.exists(name))
+        self.assertTrue(StoredBlob.objects.filter(name=name).exists())
+
+        self.assertEqual(collect_garbage(grace_hours=24), (1, len(b'unused')))
+        self.assertFalse(document_storage.exists(name))
+        self.assertFalse(StoredBlob.objects.filter(name=name).exists())
+        self.assertTrue(document_storage.exists(used.file.name))
+
+        # Saved again later: row and file come back
+        again = self.generate(b'unused')
+        self.assertEqual(again.file.name, name)
+        self.assertEqual(self.refcount(name), 1)
+        self.assertTrue(document_storage.exists(name))
+
+    def test_collect_garbage_removes_old_files_without_row(self):
+        # Left behind by saves that failed after writing the file
+        directory = document_storage.path('blobs/ab')
+        os.makedirs(directory, exist_ok=True)
+        for file_name, content in (('old.docx', b'orphan'), ('young.docx', b'young')):
+            with open(os.path.join(directory, file_name), 'wb') as f:
+                f.write(content)
+        day_ago = time.time() - 48 * 60 * 60
+        os.utime(os.path.join(directory, 'old.docx'), (day_ago, day_ago))
+
+        self.assertEqual(collect_garbage(grace_hours=24), (1, len(b'orphan')))
+        self.assertFalse(document_storage.exists('blobs/ab/old.docx'))
+        self.assertTrue(document_storage.exists('blobs/ab/young.docx'))
+
+    def test_recount_fixes_drift(self):
+        document = self.generate(b'drifted')
+        name = document.file.name
+        StoredBlob.objects.filter(name=name).update(refcount=5)
+        self.assertEqual(recount_references(), 1)
+        self.assertEqual(self.refcount(name), 1)
+        self.assertEqual(recount_references(), 0)
+
+        StoredBlob.objects.filter(name=name).delete()  # Referenced, but the row is missing
+        self.assertEqual(recount_references(), 1)
+        self.assertEqual(self.refcount(name), 1)
+
+
+class ServeFileTests(TempMediaMixin, TestCase):
+    """Conditional, Range and offloaded downloads (documents/downloads.py)."""
+
+    CONTENT = b'0123456789abcdef'
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('downloads', password='x')
+        cls.document = GeneratedDocument(user=user)
+        cls.document.file.save('report.pdf', ContentFile(cls.CONTENT))
+
+    def get(self, file=None, **headers):
+        request = RequestFactory().get('/download/', headers=headers)
+        response = serve_file(request, file or self.document.file, filename='report.pdf')
+        self.addCleanup(response.close)
+        return response
+
+    def body(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.CONTENT)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response['ETag'].startswith('"'))
+
+    def test_ranges(self):
+        for header, expected, content_range in (
+            ('bytes=2-5', b'2345', 'bytes 2-5/16'),
+            ('bytes=10-', b'abcdef', 'bytes 10-15/16'),
+            ('bytes=-4', b'cdef', 'bytes 12-15/16'),
+            ('bytes=-100', self.CONTENT, 'bytes 0-15/16'),
+            ('bytes=14-100', b'ef', 'bytes 14-15/16'),
+        ):
+            with self.subTest(header):
+                response = self.get(Range=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(self.body(response), expected)
+                self.assertEqual(response['Content-Range'], content_range)
+                self.assertEqual(response['Content-Length'], str(len(expected)))
+
+    def test_unsupported_ranges_send_whole_file(self):
+        for header in ('bytes=0-1,4-5', 'bytes=5-2', 'items=0-1', 'bytes=-'):
+            with self.subTest(header):
+                response = self.get(Range=header)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.body(response), self.CONTENT)
+
+    def test_unsatisfiable_range(self):
+        for header in ('bytes=16-', 'bytes=-0'):
+            with self.subTest(header):
+                response = self.get(Range=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], 'bytes */16')
+
+    def test_if_range(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(Range='bytes=0-1', If_Range=etag).status_code, 206)
+        # The file changed since the client's copy: the whole file instead of a range
+        response = self.get(Range='bytes=0-1', If_Range='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.CONTENT)
+
+    def test_not_modified(self):
+        etag = self.get()['ETag']
+        response = self.get(If_None_Match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_offloaded_to_web_server(self):
+        name = self.document.file.name
+        with mock.patch.dict(DOWNLOAD_SETTINGS, {'OFFLOAD': 'x-accel-redirect', 'ACCEL_PREFIX': '/protected/'}):
+            response = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{name}')
+        self.assertEqual(response.content, b'')
+        with mock.patch.dict(DOWNLOAD_SETTINGS, {'OFFLOAD': 'x-sendfile'}):
+            response = self.get()
+        self.assertEqual(response['X-Sendfile'], self.document.file.storage.path(name))
+        self.assertIn('report.pdf', response['Content-Disposition'])
+
+    def test_read_through_the_fields_storage(self):
+        location = tempfile.mkdtemp(prefix='fillmate-other-storage-')
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        storage = FileSystemStorage(location=location)
+        name = storage.save('elsewhere.pdf', ContentFile(b'not in MEDIA_ROOT'))
+        response = self.get(FieldFile(None, FileField(storage=storage), name))
+        self.assertEqual(self.body(response), b'not in MEDIA_ROOT')
+        with self.assertRaises(Http404):
+            self.get(FieldFile(None, FileField(storage=storage), 'missing.pdf'))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RenditionTests(TempMediaMixin, TestCase):
+    """Stored PDF renditions (documents/renditions.py) and how previews serve them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.template = DocumentTemplate(name='Memo')
+        cls.template.file.save('memo.docx', ContentFile(make_docx('To <NAME>')))
+
+    def test_rendered_once_per_key(self):
+        render = mock.Mock(return_value=table_xref_pdf(1))
+        name = renditions.get_rendition('review', 'a' * 64, render)
+        self.assertEqual(renditions.get_rendition('review', 'a' * 64, render), name)
+        render.assert_called_once()
+        self.assertNotEqual(renditions.get_rendition('review', 'b' * 64, render), name)
+        self.assertEqual(render.call_count, 2)
+
+    def test_concurrent_requests_render_once(self):
+        started = threading.Event()
+
+        def render():
+            started.set()
+            time.sleep(0.1)
+            return table_xref_pdf(1)
+
+        render = mock.Mock(side_effect=render)
+        names = []
+        threads = [
+            threading.Thread(target=lambda: names.append(renditions.get_rendition('review', 'c' * 64, render)))
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        render.assert_called_once()
+        self.assertEqual(len(set(names)), 1)
+
+    def test_locks_do_not_grow(self):
+        for number in range(500):
+            renditions._lock_for(renditions.rendition_name('review', str(number)))
+        self.assertEqual(len(renditions._render_locks), renditions._RENDER_LOCK_STRIPES)
+        name = renditions.rendition_name('review', 'd' * 64)
+        self.assertIs(renditions._lock_for(name), renditions._lock_for(name))
+
+    def test_preview_etag_and_not_modified(self):
+        url = reverse('documents:preview_template', args=[self.template.pk])
+        pdf = table_xref_pdf(1)
+        with mock.patch('documents.views.render_template_preview', return_value=pdf) as render:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b''.join(response.streaming_content), pdf)
+            etag = response['ETag']
+
+            cached = self.client.get(url)
+            self.assertEqual(cached['ETag'], etag)
+            self.assertEqual(b''.join(cached.streaming_content), pdf)
+            not_modified = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(not_modified['ETag'], etag)
+            other = self.client.get(url, headers={'If-None-Match': '"other"'})
+            self.assertEqual(other.status_code, 200)
+            self.assertEqual(b''.join(other.streaming_content), pdf)
+        render.assert_called_once()
+
+        # A changed template gets a new rendition and a new ETag
+        self.template.file.save('memo.docx', ContentFile(make_docx('Dear <NAME>')))
+        with mock.patch('documents.views.render_template_preview', return_value=table_xref_pdf(2)):
+            changed = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertEqual(len(PdfReader(BytesIO(b''.join(changed.streaming_content))).pages), 2)
+
+
+class PlaceholderIngestionTests(TempMediaMixin, TestCase):
+    """Placeholders are read from every text part, whatever their case, and kept across re-uploads."""
+
+    def template_docx(self):
+        document = Document()
+        paragraph = document.add_paragraph('Dear ')
+        paragraph.add_run('<FIRST').bold = True
+        paragraph.add_run('_NAME>, re: <OFFENCE_SECTION (e.g., U/s 126)>')
+        document.sections[0].header.paragraphs[0].text = 'Dated <Issue date (e.g., 01/01/2025)>'
+        table = document.add_table(rows=1, cols=2)
+        table.cell(0, 0).text = 'Officer'
+        table.cell(0, 1).text = '<officer2>'
+        source = BytesIO()
+        document.save(source)
+        return source.getvalue()
+
+    def placeholders(self, template):
+        return {
+            p.placeholder_text: (p.pk, p.name, p.type, p.example)
+            for p in template.placeholders.all()
+        }
+
+    def test_ingestion(self):
+        template = DocumentTemplate(name='Notice')
+        template.file.save('notice.docx', ContentFile(self.template_docx()))
+        found = self.placeholders(template)
+        self.assertEqual({text: values[1:] for text, values in found.items()}, {
+            '<FIRST_NAME>': ('first_name', 'text', None),
+            '<OFFENCE_SECTION>': ('offence_section', 'text', 'U/s 126'),
+            '<Issue date>': ('issue_date', 'date', '01/01/2025'),
+            '<officer2>': ('officer2', 'text', None),
+        })
+
+        # Re-uploading the same file keeps every row
+        template.file.save('notice.docx', ContentFile(self.template_docx()))
+        self.assertEqual(self.placeholders(template), found)
+
+        # Every ingested placeholder is filled, in the body, header and table
+        bindings = {p.placeholder_text: p.name for p in template.placeholders.all()}
+        values = {'first_name': 'Ada', 'offence_section': '126', 'issue_date': '2 May', 'officer2': 'Lee'}
+        docx_bytes, replaced = get_compiled_template(template).render(bindings, values)
+        self.assertEqual(replaced, 4)
+        filled = Document(BytesIO(docx_bytes))
+        self.assertEqual(filled.paragraphs[0].text, 'Dear Ada, re: 126')
+        self.assertEqual(filled.sections[0].header.paragraphs[0].text, 'Dated 2 May')
+        self.assertEqual(filled.tables[0].cell(0, 1).text, 'Lee')
@@ -2,19 +2,31 @@ from django.urls import path
 from .views import DocumentTemplateListCreateView, DocumentTemplateDetailView, SubmissionDetailView, DocumentReviewView
 from .views import PlaceholderListView
 from documents import views
-from .views import my_documents, SubmitDocumentView
+from .views import my_documents, SubmitDocumentView, SubmissionStatusView, SubmissionListAPIView, BulkReviewView
+from .views import BatchGenerateView, BatchStatusView, ApprovedExportView, TemplateCatalogView
 
 app_name = 'documents'
 
 urlpatterns = [
     path('templates/', DocumentTemplateListCreateView.as_view(), name='document-templates'),
+    path('templates/catalog/', TemplateCatalogView.as_view(), name='template-catalog'),
     path('templates/<int:template_id>/placeholders/', PlaceholderListView.as_view(), name='template-placeholders'),
     path('templates/<int:pk>/', DocumentTemplateDetailView.as_view(), name='document-template-detail'),
     path('templates/<int:template_id>/preview/', views.preview_template, name='preview_template'),
     path('templates/<int:template_id>/generate/', views.generate_document, name='generate_document'),
+    path('templates/<int:template_id>/batch/', BatchGenerateView.as_view(), name='batch-generate'),
+    path('batches/<int:batch_id>/', BatchStatusView.as_view(), name='batch-status'),
+    path('batches/<int:batch_id>/download/', views.download_batch, name='batch-download'),
     path('my-documents/', my_documents, name='my_documents'),
+    path('generated/<int:document_id>/download/', views.download_generated_document, name='generated-download'),
     path('templates/<int:template_id>/submit/', SubmitDocumentView.as_view(), name='submit-document'),
+    path('submissions/', SubmissionListAPIView.as_view(), name='submission-list'),
+    path('submissions/bulk-review/', BulkReviewView.as_view(), name='submission-bulk-review'),
+    path('approved/export/', ApprovedExportView.as_view(), name='approved-export'),
     path('submissions/<int:submission_id>/', SubmissionDetailView.as_view(), name='submission-detail'),
+    path('submissions/<int:submission_id>/status/', SubmissionStatusView.as_view(), name='submission-status'),
+    path('submissions/<int:submission_id>/download/', views.download_submission, name='submission-download'),
+    path('submissions/<int:submission_id>/signed/', views.download_signed_document, name='signed-download'),
     path(
         'submissions/<int:submission_id>/review/',
         DocumentReviewView.as_view(),
@@ -1,14 +1,21 @@
+import logging
 import re
+from django.db import transaction
 from docx import Document
 from documents.models import Placeholder
+from documents.catalog import invalidate_template_catalog
 from io import BytesIO
 import tempfile  # Import tempfile for temporary file creation
 import os
+import threading
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.pdfgen import canvas  # Import canvas for PDF generation
 from PyPDF2 import PdfReader, PdfWriter
+from documents.signing import SignatureOverlays, sign_pdf
+
+logger = logging.getLogger(__name__)
 
 def determine_placeholder_type(placeholder_text):
     """Determine if a placeholder is a date or text type."""
@@ -20,187 +27,140 @@ def determine_placeholder_type(placeholder_text):
 
 def extract_example_from_placeholder(placeholder_text):
     """Extract example values from placeholders like <field (eg: example)> or <field (e.g., example)>."""
-    match = re.search(r"\((?:e\.g\.|eg:)\s*(.*?)\)", placeholder_text, re.IGNORECASE)
+    match = re.search(r"\((?:e\.g\.,?|eg:)\s*(.*?)\)", placeholder_text, re.IGNORECASE)
     return match.group(1).strip() if match else None
 
-def extract_placeholders_from_docx(template):
+# Placeholders as they appear in a template: any text in angle brackets, with an
+# optional "(e.g., ...)" / "(eg: ...)" example. Group 1 is the field, group 2 the example.
+# Same matching as template ingestion has always used, so re-uploading a template
+# keeps every placeholder it had.
+PLACEHOLDER_PATTERN = re.compile(r"<(.*?)(?:\s*\((?:e\.g\.|eg:)\s*(.*?)\))?>", re.IGNORECASE)
+
+def find_placeholders(text):
+    """Raw placeholders in `text`, in order (repeats included)."""
+    return [match.group(0) for match in PLACEHOLDER_PATTERN.finditer(text)]
+
+def clean_placeholder(text):
     """
-    Extracts placeholders from a DOCX template and saves them in the database.
-    Preserves original placeholder text while storing standardized names.
+    Cleans placeholders by removing example text inside parentheses.
+    Example: 
+    "<OFFICER_DESIGNATION (e.g., SHO)>" → "<OFFICER_DESIGNATION>"
+    "<ISSUING_AUTHORITY (e.g., Sub Divisional Magistrate)>" → "<ISSUING_AUTHORITY>"
+    "<OFFENCE_SECTION (e.g., U/s 126/129 BNSS)>" → "<OFFENCE_SECTION>"
     """
-    print(f"🔍 Extracting placeholders from: {template.file.path}")
+    match = PLACEHOLDER_PATTERN.fullmatch(text)
+    return f"<{match.group(1).strip()}>" if match else text
 
-    doc = Document(template.file.path)
-    placeholders = set()
-
-    # Regex pattern to match placeholders and optional examples
-    placeholder_pattern = re.compile(r"<(.*?)(?:\s*\((?:e\.g\.|eg:)\s*(.*?)\))?>", re.IGNORECASE)
+def extract_placeholders(doc):
+    """
+    Extracts all placeholders from the document text, including placeholders with apostrophes.
+    """
+    placeholders_found = set()
 
     for para in doc.paragraphs:
-        matches = placeholder_pattern.findall(para.text)
-        for match in matches:
-            original_text = match[0].strip()
-            example_value = match[1].strip() if match[1] else None
-            
-            # Create standardized name for database
-            standardized_name = original_text.lower()
-            standardized_name = re.sub(r'[^\w\s]', '', standardized_name)
-            standardized_name = standardized_name.replace(' ', '_')
-            
-            placeholder_type = determine_placeholder_type(standardized_name)
-            
-            # Store both original and standardized versions
-            placeholders.add((
-                standardized_name,
-                f"<{original_text}>",  # Preserve original formatting
-                placeholder_type,
-                example_value
-            ))
-
-    # Store extracted placeholders in the database
-    for name, placeholder_text, p_type, example in placeholders:
-        print(f"✅ Saving placeholder: {name} (Text: {placeholder_text}, Type: {p_type}, Example: {example})")
-        Placeholder.objects.get_or_create(
+        placeholders_found.update(find_placeholders(para.text))
+    
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                placeholders_found.update(find_placeholders(cell.text))
+
+    return placeholders_found
+
+def extract_placeholders_from_docx(template):
+    """
+    Sync a template's Placeholder rows with the placeholders in its DOCX.
+    The file is scanned in one streaming pass over every text part (see
+    docx_xml.scan_placeholders) and new rows are written with one bulk_create;
+    running it again for the same file changes nothing.
+    """
+    from documents.docx_xml import scan_placeholders
+    from documents.models import DocumentTemplate
+
+    with template.file.open('rb') as docx_file:
+        raw_placeholders = scan_placeholders(docx_file)
+
+    placeholders = {}
+    for raw in raw_placeholders:
+        # Stored as the fill code looks them up (see template_cache.py), without the example
+        placeholder_text = clean_placeholder(raw)
+        if placeholder_text in placeholders:
+            continue  # Same field written with different examples
+        original_text = placeholder_text[1:-1]
+
+        # Create standardized name for database
+        standardized_name = re.sub(r'[^\w\s]', '', original_text.lower()).replace(' ', '_')
+        placeholders[placeholder_text] = Placeholder(
             template=template,
-            name=name,
-            placeholder_text=placeholder_text,  # Original format
-            type=p_type,
-            example=example
+            name=standardized_name,
+            placeholder_text=placeholder_text,
+            type=determine_placeholder_type(standardized_name),
+            example=extract_example_from_placeholder(raw),
         )
-# def convert_docx_to_pdf(docx_file):
-#     """
-#     Converts DOCX (BytesIO) to PDF (BytesIO) using docx2pdf
-#     Preserves ALL original formatting (tables, styles, etc.)
-#     """
-#     import tempfile
-#     import os
-#     from docx2pdf import convert
-
-#     try:
-#         # 1. Save DOCX to temp file
-#         temp_dir = tempfile.gettempdir()
-#         temp_docx = os.path.join(temp_dir, f"temp_{os.getpid()}.docx")
-#         temp_pdf = temp_docx.replace('.docx', '.pdf')
-        
-#         with open(temp_docx, 'wb') as f:
-#             f.write(docx_file.getvalue())
-
-#         # 2. Convert to PDF
-#         convert(temp_docx, temp_pdf)
-
-#         # 3. Read PDF into memory
-#         with open(temp_pdf, 'rb') as f:
-#             pdf_buffer = BytesIO(f.read())
-        
-#         return pdf_buffer
-
-#     except Exception as e:
-#         raise Exception(f"PDF conversion failed: {str(e)}")
-    
-#     finally:
-#         # 4. Cleanup temp files
-#         for fpath in [temp_docx, temp_pdf]:
-#             try:
-#                 if os.path.exists(fpath):
-#                     os.unlink(fpath)
-#             except:
-#                 pass
-##############working code below - convert to pdf
-# from docx2pdf import convert
-# from io import BytesIO
-
-# def convert_docx_to_pdf(docx_buffer):
-#     """Convert a DOCX buffer to a PDF buffer using docx2pdf."""
-#     temp_docx_path = "temp.docx"
-#     temp_pdf_path = "temp.pdf"
-
-#     # Save DOCX to a temporary file
-#     with open(temp_docx_path, "wb") as f:
-#         f.write(docx_buffer.getvalue())
-
-#     # Convert DOCX to PDF
-#     convert(temp_docx_path, temp_pdf_path)
-
-#     # Read the PDF back into a buffer
-#     pdf_buffer = BytesIO()
-#     with open(temp_pdf_path, "rb") as f:
-#         pdf_buffer.write(f.read())
-
-#     pdf_buffer.seek(0)
-#     return pdf_buffer
-####convert docx to pdf -keerthi. its below
-import pythoncom  # Import for COM initialization
-from docx2pdf import convert
-from io import BytesIO
 
-def convert_docx_to_pdf(docx_buffer):
-    """Convert a DOCX buffer to a PDF buffer using docx2pdf with COM initialization."""
-    temp_docx_path = "temp.docx"
-    temp_pdf_path = "temp.pdf"
+    with transaction.atomic():
+        # Concurrent ingestions of one template run one after the other
+        list(DocumentTemplate.objects.select_for_update().filter(pk=template.pk).values_list('pk'))
+        stale = template.placeholders.exclude(placeholder_text__in=list(placeholders))
+        stale.delete()  # Gone from a replaced file
+        existing = set(template.placeholders.values_list('placeholder_text', flat=True))
+        created = Placeholder.objects.bulk_create(
+            [placeholder for text, placeholder in placeholders.items() if text not in existing]
+        )
+        # bulk_create sends no post_save, so the catalog's placeholder counts are refreshed here
+        invalidate_template_catalog()
 
-    # Save DOCX to a temporary file
-    with open(temp_docx_path, "wb") as f:
-        f.write(docx_buffer.getvalue())
+    logger.info(f"Template {template.id}: {len(placeholders)} placeholders, {len(created)} new")
+    return created
 
-    try:
-        pythoncom.CoInitialize()  # ✅ Initialize COM to prevent errors
-        convert(temp_docx_path, temp_pdf_path)  # Convert DOCX to PDF
-    finally:
-        pythoncom.CoUninitialize()  # ✅ Uninitialize COM after conversion
+def convert_docx_to_pdf(docx_buffer):
+    """
+    Convert a DOCX buffer to a PDF buffer.
+    Runs on the shared conversion pool (see documents/converters.py), each job
+    in its own temporary directory, with the backend set by DOCUMENT_CONVERTER.
+    """
+    from documents.converters import convert_docx_bytes
 
-    # Read the PDF back into a buffer
-    pdf_buffer = BytesIO()
-    with open(temp_pdf_path, "rb") as f:
-        pdf_buffer.write(f.read())
+    return convert_docx_bytes(docx_buffer.getvalue())
 
-    pdf_buffer.seek(0)
-    return pdf_buffer
+# Signature overlays per user id: (cache key, SignatureOverlays)
+_signature_overlays = {}
+_signature_overlays_lock = threading.Lock()
 
-def generate_signed_pdf(original_pdf_path, signature_path):
+def get_signature_overlays(profile):
+    """
+    Cached overlays for a UserProfile's signature, keyed on the signature file
+    and signature_uploaded_at, so a newly uploaded signature is never served stale.
+    """
+    key = (profile.digital_signature.name, profile.signature_uploaded_at)
+    entry = _signature_overlays.get(profile.user_id)
+    if entry is not None and entry[0] == key:
+        return entry[1]
+    overlays = SignatureOverlays.from_path(profile.digital_signature.path)
+    with _signature_overlays_lock:
+        _signature_overlays[profile.user_id] = (key, overlays)
+    return overlays
+
+def invalidate_signature_overlays(user_id):
+    """Drop a user's cached overlays (called when they upload a new signature)."""
+    with _signature_overlays_lock:
+        _signature_overlays.pop(user_id, None)
+
+def generate_signed_pdf(original_pdf_path, signature_path, overlays=None):
     """
     Professional PDF signing with:
-    - PyPDF2 for perfect document preservation
-    - Reportlab for precise signature placement
-    - Proper resource cleanup
+    - PyPDF2 for perfect document preservation (an incremental update, see documents/signing.py)
+    - Reportlab for precise signature placement, sized to the signed page
+    Pass overlays=get_signature_overlays(profile) to reuse the drawn signature.
+    Returns a SignedPdf, a file object to hand to storage.
     """
-    output_buffer = BytesIO()
-    temp_overlay = None  # Track temp files for cleanup
-    
     try:
-        # 1. Create signature overlay (Reportlab)
-        overlay_packet = BytesIO()
-        can = canvas.Canvas(overlay_packet, pagesize=letter)
-        
-        # Signature placement (adjust these values as needed)
-        can.drawImage(
-            signature_path,
-            x=400, y=30,               # Bottom-right coordinates
-            width=150, height=50,      # Reasonable signature size
-            preserveAspectRatio=True,
-            mask='auto'                # Handles transparent PNGs
-        )
-        can.save()
-        
-        # 2. Merge with original PDF (PyPDF2)
-        original = PdfReader(original_pdf_path)
-        signature_overlay = PdfReader(BytesIO(overlay_packet.getvalue())).pages[0]
-        output = PdfWriter()
-        
-        # Add signature only to last page
-        for i, page in enumerate(original.pages):
-            if i == len(original.pages) - 1:
-                page.merge_page(signature_overlay)
-            output.add_page(page)
-        
-        # 3. Output to buffer
-        output.write(output_buffer)
-        output_buffer.seek(0)
-        return output_buffer
-        
+        # 1. Signature overlay (Reportlab), drawn once per page size
+        if overlays is None:
+            overlays = SignatureOverlays.from_path(signature_path)
+
+        # 2. Append the signature to the last page; the original bytes are streamed, not loaded
+        return sign_pdf(original_pdf_path, overlays)
+
     except Exception as e:
         raise Exception(f"PDF signing failed: {str(e)}")
-    finally:
-        # Proper cleanup
-        overlay_packet.close() if 'overlay_packet' in locals() else None
-        if temp_overlay and os.path.exists(temp_overlay):
-            os.unlink(temp_overlay)
\ No newline at end of file
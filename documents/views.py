@@ -3,12 +3,24 @@ from rest_framework import status
 from rest_framework.generics import ListCreateAPIView, RetrieveAPIView, ListAPIView
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from .permissions import IsHODUser
+from fillmate.pagination import KeysetPagination
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .models import DocumentTemplate, Placeholder, SubmittedDocument, GeneratedDocument
-from .serializers import DocumentTemplateSerializer, PlaceholderSerializer, SubmittedDocumentSerializer, DocumentReviewSerializer
-from .utils import extract_placeholders_from_docx, convert_docx_to_pdf, generate_signed_pdf
-from django.http import HttpResponse, JsonResponse, FileResponse
+from .models import DocumentTemplate, Placeholder, SubmittedDocument, GeneratedDocument, GenerationBatch, file_checksum
+from .serializers import DocumentTemplateSerializer, PlaceholderSerializer, SubmissionDetailSerializer, DocumentReviewSerializer, SubmissionListSerializer, BulkReviewSerializer, BatchGenerationSerializer, ApprovedExportSerializer
+from .utils import generate_signed_pdf, get_signature_overlays
+from .template_cache import get_compiled_template
+from .tasks import enqueue_submission
+from .renditions import content_key, get_rendition, get_review_rendition, serve_rendition
+from .approvals import bulk_approve, bulk_reject
+from .batches import BatchRowsError, batch_status, enqueue_batch
+from .exports import approved_documents, iter_approved_zip
+from .catalog import CATALOG_FIELDS, CATALOG_SETTINGS, catalog_page, get_catalog, page_etag
+from .downloads import serve_file
+from django.http import Http404, HttpResponse, JsonResponse, FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, quote_etag
+from rest_framework.utils.urls import replace_query_param
 from docx import Document
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
@@ -21,7 +33,8 @@ import tempfile
 import json
 import os
 import logging
-from django.core.files.base import ContentFile
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
 from documents.models import GeneratedDocument, ApprovedDocument
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import Group
@@ -33,7 +46,8 @@ from django.dispatch import receiver
 from rest_framework.exceptions import ValidationError
 from django.contrib.contenttypes.models import ContentType
 from django.views.decorators.clickjacking import xframe_options_exempt
-from notifications.utils import notify_document_submission
+from notifications.utils import notify_submission_reviewed
+from users.roles import is_hod
 
 
 
@@ -44,7 +58,7 @@ logger = logging.getLogger(__name__)
 class DocumentTemplateListCreateView(ListCreateAPIView):
     """API to list all document templates (for authenticated users) & upload templates (only for admins)"""
     
-    queryset = DocumentTemplate.objects.all()
+    queryset = DocumentTemplate.objects.prefetch_related('placeholders')
     serializer_class = DocumentTemplateSerializer
 
     def get_permissions(self):
@@ -54,9 +68,48 @@ class DocumentTemplateListCreateView(ListCreateAPIView):
         return [IsAuthenticated()]  # Normal users can list templates
 
     def perform_create(self, serializer):
-        """Extract placeholders after saving the template (Admin Only)"""
-        template = serializer.save()  # Save uploaded template to DB
-        extract_placeholders_from_docx(template)  # Extract placeholders
+        """Save the uploaded template (Admin Only); the post_save signal extracts its placeholders"""
+        serializer.save()
+
+class TemplateCatalogView(APIView):
+    """
+    Cached template catalog (documents/catalog.py): ?page=, ?page_size=, ?fields=id,name;
+    answers If-None-Match with 304. Placeholders are fetched per template from placeholders_url.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        fields = [field for field in params.get('fields', '').split(',') if field] or CATALOG_FIELDS
+        unknown = [field for field in fields if field not in CATALOG_FIELDS]
+        if unknown:
+            return Response({'error': f"Unknown fields: {', '.join(unknown)}", 'fields': CATALOG_FIELDS},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = int(params.get('page', 1))
+            page_size = min(int(params.get('page_size', CATALOG_SETTINGS['PAGE_SIZE'])), CATALOG_SETTINGS['MAX_PAGE_SIZE'])
+        except ValueError:
+            return Response({'error': "page and page_size must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        if page < 1 or page_size < 1:
+            return Response({'error': "page and page_size must be positive"}, status=status.HTTP_400_BAD_REQUEST)
+
+        catalog = get_catalog()
+        etag = quote_etag(page_etag(catalog, page, page_size, fields))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            results, count = catalog_page(catalog, page, page_size, fields)
+            url = request.build_absolute_uri()
+            response = Response({
+                'version': catalog['etag'],
+                'count': count,
+                'next': replace_query_param(url, 'page', page + 1) if page * page_size < count else None,
+                'previous': replace_query_param(url, 'page', page - 1) if page > 1 else None,
+                'results': results,
+            })
+        response['ETag'] = etag
+        # Every page load revalidates; unchanged catalogs cost a 304
+        response['Cache-Control'] = 'private, no-cache'
+        return response
 
 # ✅ API to Fetch a Single Template & Its Placeholders
 class DocumentTemplateDetailView(RetrieveAPIView):
@@ -78,72 +131,75 @@ class PlaceholderListView(ListAPIView):
         template_id = self.kwargs['template_id']
         return Placeholder.objects.filter(template_id=template_id)
 
+def render_template_preview(template_name, source):
+    """Build the highlighted-placeholder preview PDF of a template's DOCX bytes."""
+    # Create PDF buffer
+    buffer = BytesIO()
+    
+    # Create PDF document
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+    story = []
+    
+    # Add title
+    story.append(Paragraph(f"Template Preview: {template_name}", styles['Title']))
+    story.append(Spacer(1, 12))
+    
+    # Process DOCX content
+    word_doc = Document(BytesIO(source))
+    
+    # Process paragraphs
+    for para in word_doc.paragraphs:
+        if para.text.strip():
+            # Highlight placeholders
+            text = re.sub(r'<([^>]+)>', r'<font color="orange">&lt;\1&gt;</font>', para.text)
+            p = Paragraph(text, styles['Normal'])
+            story.append(p)
+            story.append(Spacer(1, 8))
+    
+    # Process tables
+    for table in word_doc.tables:
+        data = []
+        for row in table.rows:
+            row_data = []
+            for cell in row.cells:
+                cell_text = re.sub(r'<([^>]+)>', r'<font color="orange">&lt;\1&gt;</font>', cell.text)
+                row_data.append(Paragraph(cell_text, styles['Normal']))
+            data.append(row_data)
+        
+        tbl = Table(data)
+        tbl.setStyle(TableStyle([
+            ('GRID', (0,0), (-1,-1), 1, colors.grey),
+            ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
+        ]))
+        story.append(tbl)
+        story.append(Spacer(1, 12))
+    
+    # Build PDF
+    doc.build(story)
+    return buffer.getvalue()
+
 def preview_template(request, template_id):
     template = get_object_or_404(DocumentTemplate, pk=template_id)
     
     try:
-        # Debugging - log that we're starting preview generation
-        logger.info(f"Starting preview generation for template: {template.name}")
-        
-        # Create PDF buffer
-        buffer = BytesIO()
-        
-        # Create PDF document
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        styles = getSampleStyleSheet()
-        story = []
-        
-        # Add title
-        story.append(Paragraph(f"Template Preview: {template.name}", styles['Title']))
-        story.append(Spacer(1, 12))
-        
         try:
-            # Process DOCX content
-            word_doc = Document(BytesIO(template.file.read()))
-            
-            # Process paragraphs
-            for para in word_doc.paragraphs:
-                if para.text.strip():
-                    # Highlight placeholders
-                    text = re.sub(r'<([^>]+)>', r'<font color="orange">&lt;\1&gt;</font>', para.text)
-                    p = Paragraph(text, styles['Normal'])
-                    story.append(p)
-                    story.append(Spacer(1, 8))
-            
-            # Process tables
-            for table in word_doc.tables:
-                data = []
-                for row in table.rows:
-                    row_data = []
-                    for cell in row.cells:
-                        cell_text = re.sub(r'<([^>]+)>', r'<font color="orange">&lt;\1&gt;</font>', cell.text)
-                        row_data.append(Paragraph(cell_text, styles['Normal']))
-                    data.append(row_data)
-                
-                tbl = Table(data)
-                tbl.setStyle(TableStyle([
-                    ('GRID', (0,0), (-1,-1), 1, colors.grey),
-                    ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
-                ]))
-                story.append(tbl)
-                story.append(Spacer(1, 12))
-            
-            # Build PDF
-            doc.build(story)
-            
-            # Return PDF response
-            buffer.seek(0)
-            response = HttpResponse(buffer, content_type='application/pdf')
-            response['Content-Disposition'] = f'inline; filename="{template.name}_preview.pdf"'
-            logger.info("Successfully generated PDF preview")
-            return response
-            
+            def render():
+                with template.file.open('rb') as f:
+                    return render_template_preview(template.name, f.read())
+
+            # The checksum identifies the file (no read needed); the preview title shows the name
+            key = content_key(template.checksum or file_checksum(template.file), template.name)
+            name = get_rendition('template-preview', key, render)
         except Exception as e:
             logger.error(f"Error processing DOCX content: {str(e)}", exc_info=True)
             return JsonResponse({
                 'error': 'Failed to process template content',
                 'details': str(e)
             }, status=500)
+        
+        # Return the stored PDF (304 when the browser already has it)
+        return serve_rendition(request, name, filename=f"{template.name}_preview.pdf")
             
     except Exception as e:
         logger.error(f"Preview generation failed: {str(e)}", exc_info=True)
@@ -152,125 +208,56 @@ def preview_template(request, template_id):
             'details': str(e)
         }, status=500)
     
-def clean_placeholder(text):
-    """
-    Cleans placeholders by removing example text inside parentheses.
-    Example: 
-    "<OFFICER_DESIGNATION (e.g., SHO)>" → "<OFFICER_DESIGNATION>"
-    "<ISSUING_AUTHORITY (e.g., Sub Divisional Magistrate)>" → "<ISSUING_AUTHORITY>"
-    "<OFFENCE_SECTION (e.g., U/s 126/129 BNSS)>" → "<OFFENCE_SECTION>"
-    """
-    return re.sub(r'(<[A-Z_]+)\s*\(.*?\)>', r'\1>', text)
-
-def extract_placeholders(doc):
+def generate_document(request, template_id):
     """
-    Extracts all placeholders from the document text, including placeholders with apostrophes.
+    Generate a document by replacing placeholders with user-provided values.
+    DOCX is returned right away; PDF is queued (202) as a one-row batch.
     """
-    placeholders_found = set()
-    
-    # Updated regex to include apostrophes inside placeholders
-    placeholder_pattern = r'<[A-Z_\'-]+(?:\s*\(.*?\))?>'
-
-    for para in doc.paragraphs:
-        matches = re.findall(placeholder_pattern, para.text)
-        placeholders_found.update(matches)
-    
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                matches = re.findall(placeholder_pattern, cell.text)
-                placeholders_found.update(matches)
-
-    return placeholders_found
-
-def generate_document(request, template_id):
-    """Generate a document by replacing placeholders with user-provided values."""
     template = get_object_or_404(DocumentTemplate, pk=template_id)
 
     try:
-        # 1. Load template
-        doc = Document(BytesIO(template.file.read()))
+        # 1. Load the compiled template (parsed once, cached by checksum)
+        compiled = get_compiled_template(template)
 
         # 2. Get all placeholders from database (Map to user inputs)
         db_placeholders = {p.placeholder_text: p.name for p in template.placeholders.all()}
 
-        # 3. Extract placeholders from document and clean them
-        doc_placeholders = {ph: clean_placeholder(ph) for ph in extract_placeholders(doc)}
-
-        # 🔍 DEBUG: Show extracted & cleaned placeholders
-        print("📌 Placeholders in Document (Raw):", list(doc_placeholders.keys()))
-        print("📌 Cleaned Placeholders for Matching:", list(doc_placeholders.values()))
-        print("📌 Database Placeholders:", list(db_placeholders.keys()))
-
-        # 4. Replace placeholders
-        replacements_made = 0
-
-        def replace_placeholders_in_text(text):
-            modified_text = text
-            for raw_placeholder, cleaned_placeholder in doc_placeholders.items():
-                if cleaned_placeholder in db_placeholders:
-                    field_name = db_placeholders[cleaned_placeholder]
-                    user_value = request.POST.get(field_name, "").strip()
-                    if user_value:
-                        modified_text = modified_text.replace(raw_placeholder, user_value)
-            return modified_text
-
-        # Replace in paragraphs
-        for para in doc.paragraphs:
-            original_text = para.text
-            para.text = replace_placeholders_in_text(para.text)
-            if para.text != original_text:
-                replacements_made += 1
-
-        # Replace in tables
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    original_text = cell.text
-                    cell.text = replace_placeholders_in_text(cell.text)
-                    if cell.text != original_text:
-                        replacements_made += 1
-
-        # 🔍 DEBUG: Check if replacements happened
-        print(f"✅ Total Replacements Made: {replacements_made}")
+        # 3. Replace placeholders (only the runs that contain them are rewritten)
+        docx_bytes, replacements_made = compiled.render(db_placeholders, request.POST)
+
+        logger.debug(f"Replacements made in template {template.id}: {replacements_made}")
         if replacements_made == 0:
             raise ValueError("No placeholders were replaced! Check if document placeholders match database.")
 
-        # 5. Save and return the document
-        output_format = request.POST.get('format', 'docx')
-        buffer = BytesIO()
-
-        if output_format == 'pdf':
-            docx_buffer = BytesIO()
-            doc.save(docx_buffer)
-            docx_buffer.seek(0)
-            pdf_buffer = convert_docx_to_pdf(docx_buffer)
-            buffer = pdf_buffer
-            content_type = 'application/pdf'
-            file_extension = 'pdf'
-        else:
-            doc.save(buffer)
-            content_type = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-            file_extension = 'docx'
-
-        # Ensure buffer is at the beginning before saving
-        buffer.seek(0)
+        # 4. Save and return the document
+        if request.POST.get('format', 'docx') == 'pdf':
+            # PDF conversion never runs in the request: queue a one-row batch (documents/batches.py)
+            # and let the client poll its status for the generated document
+            values = {name: request.POST.get(name, '') for name in db_placeholders.values()}
+            rows = ContentFile(json.dumps(values).encode() + b'\n', name='row.jsonl')
+            batch = enqueue_batch(request.user, template, rows, 'jsonl', format='pdf', output='records')
+            return JsonResponse({
+                'batch_id': batch.id,
+                'status': batch.status,
+                'status_url': reverse('documents:batch-status', args=[batch.id]),
+            }, status=202)
 
-        # Save generated document in database
+        # Save generated document in database (streamed from memory, saves the record too)
         generated_doc = GeneratedDocument(user=request.user)
-        file_name = f"{template.name}_{request.user.first_name}.{file_extension}"
-        generated_doc.file.save(file_name, ContentFile(buffer.read()))
-        generated_doc.save()  # Save the record in the database
-
-        # Return response
-        return HttpResponse(
-            buffer.getvalue(),
-            content_type=content_type,
-            headers={'Content-Disposition': f'attachment; filename="{template.name}.{file_extension}"'}
+        file_name = f"{template.name}_{request.user.first_name}.docx"
+        generated_doc.file.save(file_name, ContentFile(docx_bytes))
+
+        # Return response: served from storage, not copied out of the buffer again
+        return serve_file(
+            request,
+            generated_doc.file,
+            filename=f"{template.name}.docx",
+            as_attachment=True,
+            content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
         )
 
     except Exception as e:
-        print(f"❌ ERROR: {str(e)}")
+        logger.error(f"Document generation failed for template {template_id}: {e}", exc_info=True)
         return JsonResponse({'error': str(e)}, status=500)
 
 
@@ -301,6 +288,49 @@ def my_documents(request):
 
 
 
+def _can_view_submission(user, submission):
+    """Submitters see their own documents, HODs see all of them."""
+    return submission.user_id == user.id or is_hod(user)
+
+
+def _submission_filename(submission, prefix, extension=None):
+    """Download name; stored names are content hashes (documents/storage.py)."""
+    extension = extension or os.path.splitext(submission.document.name)[1]
+    return f"{prefix}_{submission.template.name}_{submission.user.username}{extension}"
+
+
+@login_required
+def download_generated_document(request, document_id):
+    """A document the user generated, for that user only."""
+    generated_doc = get_object_or_404(GeneratedDocument, pk=document_id, user=request.user)
+    extension = os.path.splitext(generated_doc.file.name)[1]
+    return serve_file(request, generated_doc.file, filename=f"document_{generated_doc.id}{extension}", as_attachment=True)
+
+
+@login_required
+def download_submission(request, submission_id):
+    """Original submitted document, for its submitter and HODs."""
+    submission = get_object_or_404(SubmittedDocument.objects.select_related('template', 'user'), pk=submission_id)
+    if not submission.document or not _can_view_submission(request.user, submission):
+        raise Http404("Document not found.")
+    return serve_file(request, submission.document, filename=_submission_filename(submission, 'submitted'), as_attachment=True)
+
+
+@login_required
+def download_signed_document(request, submission_id):
+    """Signed PDF of an approved submission, for its submitter and HODs."""
+    approved_doc = get_object_or_404(
+        ApprovedDocument.objects.select_related('original_submission__template', 'original_submission__user'),
+        original_submission_id=submission_id,
+    )
+    submission = approved_doc.original_submission
+    if not approved_doc.signed_file or not _can_view_submission(request.user, submission):
+        raise Http404("Document not found.")
+    return serve_file(
+        request, approved_doc.signed_file, filename=_submission_filename(submission, 'signed', '.pdf'), as_attachment=True
+    )
+
+
 class SubmitDocumentView(APIView):
 
     
@@ -316,68 +346,21 @@ class SubmitDocumentView(APIView):
             if not request.META.get('HTTP_X_CSRFTOKEN') == request.COOKIES.get('csrftoken'):
                 return Response({"error": "CSRF verification failed"}, status=status.HTTP_403_FORBIDDEN)
             
-            # Generate document
-            doc = Document(BytesIO(template.file.read()))
-            
-            # Get all placeholders from database
-            db_placeholders = {p.placeholder_text: p.name for p in template.placeholders.all()}
-            doc_placeholders = {ph: clean_placeholder(ph) for ph in extract_placeholders(doc)}
-
             # Handle both form-data and JSON input
             post_data = request.POST if request.POST else json.loads(request.body)
-            
-            # Replace placeholders with form data
-            for para in doc.paragraphs:
-                para.text = replace_placeholders_in_text(para.text, doc_placeholders, db_placeholders, request.POST)
-            
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        cell.text = replace_placeholders_in_text(cell.text, doc_placeholders, db_placeholders, request.POST)
-            
-            # Save to buffer based on format
-            output_format = request.POST.get('format', 'docx')
-            buffer = BytesIO()
-            
-            if output_format == 'pdf':
-                docx_buffer = BytesIO()
-                doc.save(docx_buffer)
-                docx_buffer.seek(0)
-                pdf_buffer = convert_docx_to_pdf(docx_buffer)
-                buffer = pdf_buffer
-                file_extension = 'pdf'
-                content_type = 'application/pdf'
-            else:
-                doc.save(buffer)
-                file_extension = 'docx'
-                content_type = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-            
-            buffer.seek(0)
-            
-            # Create SubmittedDocument record
-            submitted_doc = SubmittedDocument.objects.create(
-                user=request.user,
-                template=template,
-                status='Pending'
-            )
-            
-            # Save the generated file
-            file_name = f"submitted_{template.name}_{request.user.username}.{file_extension}"
-            submitted_doc.document.save(file_name, ContentFile(buffer.read()))
+            field_names = template.placeholders.values_list('name', flat=True)
 
-            # ✅ REPLACE WITH THIS CALL to the utility function:
-            try:
-                notify_document_submission(submitted_doc, request.user)
-                logger.info(f"HOD notification process initiated for submission {submitted_doc.id}")
-            except Exception as notify_error:
-                logger.error(f"Failed to initiate HOD notifications for submission {submitted_doc.id}: {notify_error}", exc_info=True)
-            # ✅ --- END HOD NOTIFICATION --- ✅
+            # Accept right away; rendering, PDF conversion and HOD notifications
+            # run in the background (documents/tasks.py)
+            submitted_doc = enqueue_submission(request.user, template, post_data, field_names)
             
             return Response({
-                "status": "success",
+                "status": "accepted",
                 "submission_id": submitted_doc.id,
+                "submission_status": submitted_doc.status,
+                "status_url": reverse('documents:submission-status', args=[submitted_doc.id]),
                 "redirect_url": reverse('documents:my_documents') # Redirect to the actual page URL
-            }, status=status.HTTP_201_CREATED)
+            }, status=status.HTTP_202_ACCEPTED)
 
         except Exception as e:
             # Log error details
@@ -388,28 +371,169 @@ class SubmitDocumentView(APIView):
                 "error": f"An error occurred during submission: {e}"
             }, status=status.HTTP_400_BAD_REQUEST)
 
-# Helper function
-def replace_placeholders_in_text(text, doc_placeholders, db_placeholders, post_data):
-    for raw_placeholder, cleaned_placeholder in doc_placeholders.items():
-        if cleaned_placeholder in db_placeholders:
-            field_name = db_placeholders[cleaned_placeholder]
-            user_value = post_data.get(field_name, "").strip()
-            if user_value:
-                text = text.replace(raw_placeholder, user_value)
-    return text
+class SubmissionStatusView(APIView):
+    """Lightweight status endpoint polled by the frontend while a submission renders"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, submission_id):
+        submissions = SubmittedDocument.objects.select_related('job')
+        # Only allow HODs or the original submitter to view
+        if not is_hod(request.user):
+            submissions = submissions.filter(user=request.user)
+        submission = get_object_or_404(submissions, pk=submission_id)
+
+        job = getattr(submission, 'job', None)
+        return Response({
+            'submission_id': submission.id,
+            'status': submission.status,
+            'job_status': job.status if job else None,
+            'attempts': job.attempts if job else 0,
+            'retry_at': job.run_after if job and job.status == 'queued' else None,
+            'error': job.last_error if job and submission.status == 'Failed' else None,
+            'document_ready': bool(submission.document),
+            'redirect_url': reverse('documents:my_documents'),
+        })
+
+class BatchGenerateView(APIView):
+    """Queue a mail-merge batch: the template filled once per row of an uploaded CSV/JSONL file"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, template_id):
+        template = get_object_or_404(DocumentTemplate, id=template_id)
+        serializer = BatchGenerationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            batch = enqueue_batch(
+                request.user, template, data['rows'], data['rows_format'],
+                format=data['format'], output=data['output'], filename_field=data['filename_field'],
+            )
+        except BatchRowsError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'batch_id': batch.id,
+            'status': batch.status,
+            'total_rows': batch.total_rows,
+            'status_url': reverse('documents:batch-status', args=[batch.id]),
+        }, status=status.HTTP_202_ACCEPTED)
+
+class BatchStatusView(APIView):
+    """Progress of a mail-merge batch, polled by its owner"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, batch_id):
+        batch = get_object_or_404(GenerationBatch, pk=batch_id, user=request.user)
+        return Response(batch_status(batch))
+
+@login_required
+def download_batch(request, batch_id):
+    """ZIP archive of a finished batch, for its owner."""
+    batch = get_object_or_404(GenerationBatch.objects.select_related('template'), pk=batch_id, user=request.user)
+    if batch.status != 'done' or not batch.archive:
+        raise Http404("Archive not found.")
+    return serve_file(request, batch.archive, filename=f"{batch.template.name}_batch_{batch.id}.zip", as_attachment=True)
+
+class SubmissionCursorPagination(KeysetPagination):
+    date_field = 'submitted_at'
+    page_size = 15
+
+
+class SubmissionListAPIView(ListAPIView):
+    """HOD submission list as JSON, newest first (?status=pending|approved|rejected, ?cursor=...)"""
+    permission_classes = [IsAuthenticated, IsHODUser]
+    serializer_class = SubmissionListSerializer
+    pagination_class = SubmissionCursorPagination
+
+    def get_queryset(self):
+        queryset = SubmittedDocument.objects.select_related('user', 'template')
+        status_filter = self.request.query_params.get('status')
+        if status_filter:
+            queryset = queryset.filter(status=status_filter.capitalize())
+        return queryset
+
+class BulkReviewView(APIView):
+    """Approve or reject many submissions at once; returns a result per submission id"""
+    permission_classes = [IsAuthenticated, IsHODUser]
+
+    def post(self, request):
+        serializer = BulkReviewSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+
+        if serializer.validated_data['action'] == 'reject':
+            results = bulk_reject(ids, request.user, serializer.validated_data['reason'].strip())
+        else:
+            # The signature is checked once for the whole batch
+            profile, created = UserProfile.objects.get_or_create(user=request.user)
+            if not profile.digital_signature:
+                return Response({'error': "Approval failed: Please upload your digital signature first via the 'Upload Signature' link."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if not os.path.exists(profile.digital_signature.path):
+                return Response({'error': "Approval failed: Your signature file cannot be found. Please re-upload it."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            try:
+                results = bulk_approve(ids, request.user, profile)
+            except Exception as e:
+                logger.error(f"Bulk approval by {request.user.username} failed: {e}", exc_info=True)
+                return Response({'error': f'An unexpected error occurred during approval: {e}'},
+                                status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response({
+            'results': results,
+            'succeeded': sum(1 for r in results if r['status'] != 'error'),
+            'failed': sum(1 for r in results if r['status'] == 'error'),
+        })
+
+class ApprovedExportView(APIView):
+    """
+    Signed PDFs of approved documents as a ZIP with a manifest.csv, streamed as it is built
+    (?date_from=YYYY-MM-DD&date_to=YYYY-MM-DD&template=<id>&user=<id>)
+    """
+    permission_classes = [IsAuthenticated, IsHODUser | IsAdminUser]
+
+    def get(self, request):
+        serializer = ApprovedExportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        filters = serializer.validated_data
+        queryset = approved_documents(
+            date_from=filters.get('date_from'), date_to=filters.get('date_to'),
+            template_id=filters.get('template'), user_id=filters.get('user'),
+        )
+
+        period = '_'.join(str(filters[key]) for key in ('date_from', 'date_to') if key in filters)
+        filename = f"approved_documents{'_' + period if period else ''}.zip"
+        response = StreamingHttpResponse(iter_approved_zip(queryset), content_type='application/zip')
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        response['X-Accel-Buffering'] = 'no'  # Let nginx pass chunks on as they are produced
+        response['Cache-Control'] = 'private, no-store'
+        logger.info(f"Approved documents export by {request.user.username}: {request.GET.urlencode() or 'all'}")
+        return response
 
 class SubmissionDetailView(RetrieveAPIView):
-    queryset = SubmittedDocument.objects.all()
-    serializer_class = SubmittedDocumentSerializer
+    """One submission for the review modal (?include=placeholders adds the template's fields)"""
+    serializer_class = SubmissionDetailSerializer
     permission_classes = [IsAuthenticated]
-    lookup_field = 'submission_id'  # Use 'submission_id' to match the URL pattern
+    lookup_field = 'id'
+    lookup_url_kwarg = 'submission_id'
+
+    def include_placeholders(self):
+        return 'placeholders' in self.request.query_params.get('include', '').split(',')
 
     def get_queryset(self):
+        # Submission, user, template and approval (with its approver) in one query
+        queryset = SubmittedDocument.objects.select_related(
+            'user', 'template', 'approved_version__approved_by'
+        )
+        if self.include_placeholders():
+            queryset = queryset.prefetch_related('template__placeholders')
         # Only allow HODs or the original submitter to view
-        if self.request.user.groups.filter(name='HOD').exists():
-            return super().get_queryset()
-        return super().get_queryset().filter(user=self.request.user)
-    
+        if is_hod(self.request.user):
+            return queryset
+        return queryset.filter(user=self.request.user)
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'include_placeholders': self.include_placeholders()}
 
 # documents/views.py
 class DocumentReviewView(APIView):
@@ -422,36 +546,25 @@ class DocumentReviewView(APIView):
         if not submission.document:
              return Response({'error': 'Submitted document file not found.'}, status=404)
 
-        file_path = submission.document.path
-        content_type = 'application/octet-stream' # Default
         file_name = submission.document.name
 
         if file_name.lower().endswith('.pdf'):
-             content_type = 'application/pdf'
+            # Already a PDF: serve the submitted file itself, tagged by name/size/mtime (never read here)
+            return serve_file(request, submission.document, content_type='application/pdf')
         elif file_name.lower().endswith('.docx'):
-            # Option 1: Convert to PDF on the fly for viewing (can be slow)
+            # Converted once per document content and cached (usually pre-warmed at submit time)
             try:
-                with open(file_path, 'rb') as docx_file:
-                    docx_buffer = BytesIO(docx_file.read())
-                pdf_buffer = convert_docx_to_pdf(docx_buffer) # Your existing util function
-                response = HttpResponse(pdf_buffer.getvalue(), content_type='application/pdf')
-                # Optional: Set filename for inline view
-                # response['Content-Disposition'] = f'inline; filename="preview_{os.path.basename(file_name)}.pdf"'
-                return response
+                name = get_review_rendition(submission.document)
+            except FileNotFoundError:
+                return Response({'error': 'Document file not found on server.'}, status=404)
             except Exception as e:
                  logger.error(f"Error converting DOCX to PDF for review: {e}", exc_info=True)
                  return Response({'error': f'Could not convert document to PDF for preview: {e}'}, status=500)
-            # Option 2: Tell the frontend it's DOCX (iframe won't work)
-            # return Response({'error': 'Preview not available for DOCX. Please download.'}, status=400)
         else:
              # Handle other file types or return error
              return Response({'error': 'Unsupported document type for preview.'}, status=400)
 
-        # If it was already PDF:
-        try:
-            return FileResponse(open(file_path, 'rb'), content_type=content_type)
-        except FileNotFoundError:
-            return Response({'error': 'Document file not found on server.'}, status=404)
+        return serve_rendition(request, name)
         # --- END: Suggestion for GET logic ---
 
 
@@ -498,27 +611,22 @@ class DocumentReviewView(APIView):
         try:
             # --- Determine input path and convert if necessary ---
             input_path_for_signing = submission.document.path
-            temp_pdf_buffer = None # To hold converted PDF if needed
 
             if not submission.document.name.lower().endswith('.pdf'):
                  # Convert DOCX to PDF first
                  logger.info(f"Converting DOCX to PDF for signing: {submission.document.path}")
-                 with open(submission.document.path, 'rb') as docx_file:
-                     docx_buffer = BytesIO(docx_file.read())
-                 temp_pdf_buffer = convert_docx_to_pdf(docx_buffer) # Your util function
-                 # We need to pass the *content* of the PDF buffer to generate_signed_pdf,
-                 # or save it temporarily and pass the path. Passing buffer is better.
-                 # Let's modify generate_signed_pdf slightly if needed, or use the buffer directly.
-                 # Assuming generate_signed_pdf can take a file-like object (BytesIO) for the original PDF:
-                 input_path_for_signing = temp_pdf_buffer # Use the buffer directly
-                 input_path_for_signing.seek(0) # Reset buffer position
+                 # Same PDF the HOD reviewed; normally already in the rendition cache
+                 review_pdf = get_review_rendition(submission.document)
+                 # Sign the rendition file itself: a path lets the signer append to it instead of loading it
+                 input_path_for_signing = default_storage.path(review_pdf)
                  logger.info("Conversion successful.")
             # --- End Conversion ---
 
 
-            signed_pdf_buffer = generate_signed_pdf(
-                input_path_for_signing, # This is now either the original PDF path or the BytesIO buffer of the converted PDF
-                profile.digital_signature.path
+            signed_pdf = generate_signed_pdf(
+                input_path_for_signing, # Either the original PDF or the DOCX's review rendition
+                profile.digital_signature.path,
+                overlays=get_signature_overlays(profile), # Cached per signature upload
             )
 
             # Create the ApprovedDocument record
@@ -532,12 +640,15 @@ class DocumentReviewView(APIView):
             base_name = os.path.splitext(os.path.basename(submission.document.name))[0]
             signed_file_name = f'signed_{base_name}.pdf' # Always PDF now
 
-            # Save the signed PDF buffer to the ApprovedDocument
-            approved_doc.signed_file.save(
-                 signed_file_name,
-                 ContentFile(signed_pdf_buffer.read()),
-                 save=True # Save the model instance after file save
-            )
+            # Stream the signed PDF to the ApprovedDocument's storage in chunks
+            try:
+                approved_doc.signed_file.save(
+                     signed_file_name,
+                     File(signed_pdf),
+                     save=True # Save the model instance after file save
+                )
+            finally:
+                signed_pdf.close()
 
             # Update the original submission status
             submission.status = 'Approved'
@@ -546,17 +657,11 @@ class DocumentReviewView(APIView):
 
             # ✅ --- CREATE NOTIFICATION FOR SUBMITTING USER --- ✅
             try:
-                content_type = ContentType.objects.get_for_model(SubmittedDocument)
                 submitting_user = submission.user # Get the user who submitted
-                hod_user = request.user # The HOD performing the action
-
-                Notification.objects.create(
-                    recipient=submitting_user, # <<< Notify the original user
-                    sender=hod_user,
-                    message=f"Your submission '{submission.template.name}' (ID: {submission.id}) has been approved.",
-                    content_type=content_type,
-                    object_id=submission.id,
-                    is_read=False # Ensure it starts as unread
+                notify_submission_reviewed(
+                    submission,
+                    request.user, # The HOD performing the action
+                    f"Your submission '{submission.template.name}' (ID: {submission.id}) has been approved.",
                 )
                 logger.info(f"Approval notification created for user {submitting_user.username} for submission {submission.id}")
             except Exception as notify_error:
@@ -574,10 +679,6 @@ class DocumentReviewView(APIView):
             logger.error(f"Unexpected error during approval of submission {submission.id} by {request.user.username}: {e}", exc_info=True)
             # Provide a generic error to the user
             return Response({'error': f'An unexpected error occurred during approval: {e}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        finally:
-             # Clean up temporary buffer if created
-             if temp_pdf_buffer:
-                  temp_pdf_buffer.close()
         
         
 
@@ -594,20 +695,15 @@ class DocumentReviewView(APIView):
 
             # ✅ --- CREATE NOTIFICATION FOR SUBMITTING USER --- ✅
             try:
-                content_type = ContentType.objects.get_for_model(SubmittedDocument)
                 submitting_user = submission.user # Get the user who submitted
-                hod_user = request.user # The HOD performing the action
 
                 # Truncate reason for notification message if too long
                 truncated_reason = (reason[:75] + '...') if len(reason) > 75 else reason
 
-                Notification.objects.create(
-                    recipient=submitting_user, # <<< Notify the original user
-                    sender=hod_user,
-                    message=f"Your submission '{submission.template.name}' (ID: {submission.id}) was rejected. Reason: {truncated_reason}",
-                    content_type=content_type,
-                    object_id=submission.id,
-                    is_read=False # Ensure it starts as unread
+                notify_submission_reviewed(
+                    submission,
+                    request.user, # The HOD performing the action
+                    f"Your submission '{submission.template.name}' (ID: {submission.id}) was rejected. Reason: {truncated_reason}",
                 )
                 logger.info(f"Rejection notification created for user {submitting_user.username} for submission {submission.id}")
             except Exception as notify_error:
@@ -616,8 +712,6 @@ class DocumentReviewView(APIView):
 
             logger.info(f"Document {submission.id} rejected by {request.user.username}. Reason: {reason}")
 
-            # TODO: Optionally send a notification back to the submitting user about the rejection
-
             return Response({'status': 'rejected', 'message': 'Document rejected.'}, status=status.HTTP_200_OK)
 
         except Exception as e:
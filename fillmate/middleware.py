@@ -1,9 +1,39 @@
-from django.contrib.sessions.backends.db import SessionStore
+from importlib import import_module
 
-from django.contrib.auth.models import Group, AnonymousUser, User
+from django.contrib.auth import HASH_SESSION_KEY
 from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import caches
 from django.http import HttpResponseRedirect
 from django.conf import settings
+from django.utils.crypto import constant_time_compare
+
+# Same engine as SessionMiddleware (cached_db): admin sessions load from the cache, not the DB
+SessionStore = import_module(settings.SESSION_ENGINE).SessionStore
+
+ADMIN_USER_CACHE_TIMEOUT = getattr(settings, 'ADMIN_USER_CACHE_TIMEOUT', 300)  # Seconds
+
+
+def _admin_user_cache_key(user_id):
+    return f"admin-user:{user_id}"
+
+
+def get_cached_user(user_id):
+    """User for an admin session, through the session cache; None if it does not exist."""
+    cache = caches[settings.SESSION_CACHE_ALIAS]
+    key = _admin_user_cache_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = User.objects.filter(pk=user_id).first()
+        if user is None:
+            return None
+        cache.set(key, user, ADMIN_USER_CACHE_TIMEOUT)
+    return user
+
+
+def invalidate_cached_user(user_id):
+    """Drop a cached user (users/models.py calls this whenever a user is saved or deleted)."""
+    caches[settings.SESSION_CACHE_ALIAS].delete(_admin_user_cache_key(user_id))
+
 
 # Keep AdminSessionMiddleware if you need strict session isolation for /admin/
 class AdminSessionMiddleware:
@@ -18,6 +48,32 @@ class AdminSessionMiddleware:
         self.admin_cookie_path = getattr(settings, 'SESSION_COOKIE_ADMIN_PATH', '/admin/')
         self.login_url = '/admin/login/' # Consider using reverse('admin:login') if urls are namespaced
 
+    def resolve_admin_user(self, request, admin_session_key):
+        """
+        (user, admin session) for the admin cookie, memoized on the request.
+        The session and the user both come from the cache; the user must be staff,
+        the session flagged 'is_admin' and its password hash still valid.
+        """
+        memo = getattr(request, '_admin_session_memo', None)
+        if memo is not None and memo[0] == admin_session_key:
+            return memo[1]
+
+        resolved = (AnonymousUser(), None)
+        if admin_session_key:
+            admin_session = SessionStore(session_key=admin_session_key)
+            user_id = admin_session.get('_auth_user_id')
+            # 'is_admin' flag set in AdminLoginView
+            if user_id and admin_session.get('is_admin'):
+                user = get_cached_user(user_id)
+                session_hash = admin_session.get(HASH_SESSION_KEY)
+                if (
+                    user is not None and user.is_staff and user.is_active
+                    and session_hash and constant_time_compare(session_hash, user.get_session_auth_hash())
+                ):
+                    resolved = (user, admin_session)
+        request._admin_session_memo = (admin_session_key, resolved)
+        return resolved
+
     def __call__(self, request):
         # Only process requests for the admin path
         if not request.path.startswith(self.admin_cookie_path):
@@ -38,30 +94,13 @@ class AdminSessionMiddleware:
 
         # Try to authenticate using the admin session cookie
         admin_session_key = request.COOKIES.get(self.admin_cookie_name)
-        if admin_session_key:
-            try:
-                admin_session = SessionStore(session_key=admin_session_key)
-                user_id = admin_session.get('_auth_user_id')
-                # Check if session is considered 'admin' (set during login)
-                # and if the user ID exists
-                if user_id and admin_session.get('is_admin'): # 'is_admin' flag set in AdminLoginView
-                    user = User.objects.get(pk=user_id)
-                    # Attach user to request ONLY if they are staff
-                    if user.is_staff:
-                        request.user = user
-                        request.session = admin_session # Use the admin session
-                    else:
-                         # User is not staff, treat as anonymous for admin path
-                        request.user = AnonymousUser()
-                else:
-                     # Invalid or expired admin session
-                    request.user = AnonymousUser()
-            except (SessionStore.DoesNotExist, User.DoesNotExist):
-                request.user = AnonymousUser()
-        else:
-            # No admin session cookie
-            request.user = AnonymousUser()
-
+        user, admin_session = self.resolve_admin_user(request, admin_session_key)
+        request.user = user
+        if admin_session is not None:
+            request.session = admin_session # Use the admin session
+        # AuthenticationMiddleware runs after this one; reuse the resolved user instead
+        # of loading it again from the session
+        request._cached_user = user
 
         # If after processing, the user is not authenticated staff, redirect to admin login
         # This relies on AuthenticationMiddleware potentially overriding request.user if standard session is also present
@@ -0,0 +1,171 @@
+"""
+Keyset (cursor) pagination over (timestamp, id), newest first.
+
+Page links carry an opaque cursor holding the (timestamp, id) of the last (or
+first) row shown, and the next page is fetched with
+
+    WHERE (ts, id) < (cursor_ts, cursor_id) ORDER BY ts DESC, id DESC LIMIT n + 1
+
+so every page costs the same index range scan no matter how deep it is, and no
+COUNT(*) is needed. The trade-off is that pages have no numbers: only
+newest / newer / older navigation.
+
+KeysetPaginator is used by the HTML list views; KeysetPagination wraps it for
+DRF views.
+"""
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(position, reverse=False):
+    timestamp, pk = position
+    data = {'t': timestamp.isoformat(), 'i': pk}
+    if reverse:
+        data['r'] = 1
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns ((timestamp, id), reverse); raises InvalidCursor for anything malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        timestamp = parse_datetime(data['t'])
+        pk = int(data['i'])
+    except (TypeError, ValueError, KeyError, json.JSONDecodeError):
+        raise InvalidCursor(cursor)
+    # Cursors are only ever written with aware timestamps and real ids; anything else
+    # was edited, and could fail in the query (e.g. an id too large for the column)
+    if timestamp is None or timestamp.tzinfo is None or not 0 < pk < 2 ** 63:
+        raise InvalidCursor(cursor)
+    return (timestamp, pk), bool(data.get('r'))
+
+
+class KeysetPage:
+    """One page of results plus the cursors of its neighbours (None when there is none)."""
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Paginates a queryset newest first by (date_field, id)."""
+
+    def __init__(self, queryset, per_page, date_field):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.date_field = date_field
+
+    def _position(self, obj):
+        return getattr(obj, self.date_field), obj.pk
+
+    def page(self, cursor=None, strict=False):
+        """
+        Page after/before `cursor`, or the newest page. A bad cursor also gives
+        the newest page, or raises InvalidCursor when strict.
+        """
+        position, reverse = None, False
+        if cursor:
+            try:
+                position, reverse = decode_cursor(cursor)
+            except InvalidCursor:
+                if strict:
+                    raise
+
+        queryset = self.queryset
+        field = self.date_field
+        if position is None:
+            queryset = queryset.order_by(f'-{field}', '-pk')
+        elif reverse:
+            # Newer rows: walk up from the cursor, then flip back to newest first
+            timestamp, pk = position
+            queryset = queryset.filter(
+                Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'pk__gt': pk})
+            ).order_by(field, 'pk')
+        else:
+            timestamp, pk = position
+            queryset = queryset.filter(
+                Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'pk__lt': pk})
+            ).order_by(f'-{field}', '-pk')
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        if not rows:
+            return KeysetPage([], None, None)
+        if reverse:
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+        return KeysetPage(
+            rows,
+            encode_cursor(self._position(rows[-1])) if has_next else None,
+            encode_cursor(self._position(rows[0]), reverse=True) if has_previous else None,
+        )
+
+
+class KeysetPagination(BasePagination):
+    """
+    DRF pagination class over KeysetPaginator; responses carry next/previous links.
+    Subclass to set date_field/page_size for a view.
+    """
+    page_size = 25
+    date_field = 'created_at'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            self.keyset_page = KeysetPaginator(queryset, self.page_size, self.date_field).page(
+                request.query_params.get(self.cursor_query_param), strict=True
+            )
+        except InvalidCursor:
+            # As DRF's CursorPagination: 404 rather than silently restarting
+            raise NotFound(self.invalid_cursor_message)
+        return list(self.keyset_page)
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self._link(self.keyset_page.next_cursor),
+            'previous': self._link(self.keyset_page.previous_cursor),
+            'newest': remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param),
+            'results': data,
+        })
@@ -1,6 +1,7 @@
 from pathlib import Path
 from datetime import timedelta
 import os
+import sys
 
 # Build paths inside the project
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -23,6 +24,7 @@ INSTALLED_APPS = [
     'rest_framework',
     'django_bootstrap5',
     'rest_framework_simplejwt',
+    'rest_framework_simplejwt.token_blacklist',  # Rotated refresh tokens (see TOKEN_REVOCATION)
     'rest_framework.authtoken',
     #'corsheaders',
     'channels',
@@ -39,7 +41,7 @@ SIMPLE_JWT = {
     
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
-    'ROTATE-REFRESH_TOKENS': True,
+    'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
@@ -48,6 +50,8 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+    # Refreshed access tokens carry the user's current role claims (users/tokens.py)
+    'TOKEN_REFRESH_SERIALIZER': 'users.tokens.FillMateTokenRefreshSerializer',
 
     # --- REMOVED JWT Cookie specific settings ---
     # We will rely on standard sessions for web and Authorization header for APIs
@@ -60,7 +64,8 @@ SIMPLE_JWT = {
 # Django REST Framework Settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication that serves reads from the token's claims (no user query)
+        'users.authentication.ClaimsJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.TokenAuthentication',
         
@@ -72,7 +77,34 @@ REST_FRAMEWORK = {
 }
 
 # Session settings
-SESSION_ENGINE = 'django.contrib.sessions.backends.db' # Or cache, etc.
+# Sessions are written to the DB and read through the cache; AdminSessionMiddleware
+# also caches the admin user there (ADMIN_USER_CACHE_TIMEOUT seconds, cleared when the user is saved).
+# The file cache is shared by the worker processes of one host; use Redis/Memcached across hosts.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
+ADMIN_USER_CACHE_TIMEOUT = 300
+
+# Token version cache for ClaimsJWTAuthentication (users/tokens.py, users/authentication.py)
+JWT_CLAIMS = {
+    'CACHE_ALIAS': 'sessions',
+    'VERSION_CACHE_TIMEOUT': 24 * 60 * 60,  # Seconds; bumps clear it
+}
+
+# Group membership checks (users/roles.py): memoized per request and cached in the
+# shared 'sessions' cache; membership changes clear a user's entry.
+USER_ROLES = {
+    'CACHE_ALIAS': 'sessions',
+    'CACHE_TIMEOUT': 300,  # Seconds
+}
+
+# Refresh token blacklist checks (users/revocation.py): each process keeps the unexpired
+# blacklisted jtis in memory and re-reads only new rows when the marker in the shared
+# cache moves. `manage.py purge_tokens` deletes expired outstanding/blacklisted rows.
+TOKEN_REVOCATION = {
+    'CACHE_ALIAS': 'sessions',
+    'SYNC_OVERLAP': 60,  # Seconds re-read before the last sync
+    'FULL_SYNC_INTERVAL': 60 * 60,  # Seconds
+}
 SESSION_COOKIE_NAME = 'sessionid' # Use the standard Django session cookie name
 SESSION_COOKIE_AGE = 1209600 # 2 weeks, default
 SESSION_SAVE_EVERY_REQUEST = False # Default, saves only on modification
@@ -131,6 +163,19 @@ TEMPLATES = [
 
 # WSGI Application
 WSGI_APPLICATION = 'fillmate.wsgi.application'
+ASGI_APPLICATION = 'fillmate.asgi.application'  # WebSocket notification push (notifications/consumers.py)
+
+# Notifications are created in web processes and in the process_submissions worker,
+# and pushed to sockets held by the ASGI processes, so the layer must be shared
+# between processes (Redis). The in-memory layer only reaches sockets of the same
+# process: notifications/apps.py refuses it while USE_WEBSOCKETS is on (tests
+# override it per test case).
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {'hosts': [os.environ.get('CHANNEL_REDIS_URL', 'redis://127.0.0.1:6379/0')]},
+    },
+}
 
 # Database Configuration (PostgreSQL)
 DATABASES = {
@@ -169,6 +214,112 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Cache Configuration
+# 'templates' is the shared tier of the compiled template cache (documents/template_cache.py)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'templates': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'templates'),
+    },
+    # Not LocMemCache: a session deleted by one worker must not stay valid in another
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'sessions'),
+        'TIMEOUT': SESSION_COOKIE_AGE,
+    },
+}
+
+DOCUMENT_TEMPLATE_CACHE = {
+    'MAX_ENTRIES': 32,  # Compiled templates kept in memory per worker process
+    'CACHE_ALIAS': 'templates',  # Shared tier across workers (None disables it)
+    'TIMEOUT': 60 * 60 * 24,
+}
+
+# How placeholders are filled: 'xml' edits the DOCX XML in place and keeps run
+# formatting; 'docx' goes through python-docx (flattens the formatting of edited runs)
+DOCUMENT_FILL_MODE = 'xml'
+
+# DOCX -> PDF conversion pool (documents/converters.py)
+DOCUMENT_CONVERTER = {
+    # Word over COM on Windows, headless LibreOffice elsewhere.
+    # 'documents.converters.UnoserverConverter' keeps LibreOffice running per worker;
+    # 'documents.converters.ReportLabConverter' needs no office suite (dev/tests).
+    'BACKEND': (
+        'documents.converters.Docx2PdfConverter' if sys.platform == 'win32'
+        else 'documents.converters.LibreOfficeConverter'
+    ),
+    'WORKERS': 2,  # Parallel conversions per web process
+    'QUEUE_SIZE': 32,  # Jobs allowed to wait before new ones are rejected
+    'TIMEOUT': 120,  # Seconds per attempt
+    'RETRIES': 1,
+    'OPTIONS': {},  # Passed to the backend, e.g. {'soffice_path': '/usr/bin/soffice'}
+}
+
+# Cached PDF previews in MEDIA_ROOT (documents/renditions.py)
+DOCUMENT_RENDITIONS = {
+    'LOCATION': 'renditions',
+    'VERSION': 1,  # Bump after changing how previews are rendered
+}
+
+# Document downloads (documents/downloads.py). Views check permissions, then either
+# stream the file themselves or let the web server send it:
+#   'x-accel-redirect' - nginx:  location /protected-media/ { internal; alias <MEDIA_ROOT>/; }
+#   'x-sendfile'       - Apache mod_xsendfile / lighttpd
+# Documents must not also be reachable through a public /media/ location.
+DOCUMENT_DOWNLOADS = {
+    'OFFLOAD': None,
+    'ACCEL_PREFIX': '/protected-media/',
+}
+
+# Generated, submitted and approved documents are stored once per content
+# (documents/storage.py); run `manage.py collect_blobs` periodically to free unused ones
+DOCUMENT_BLOB_STORAGE = {
+    'LOCATION': 'blobs',
+    'GC_GRACE_HOURS': 24,
+}
+
+# POST /api/documents/submissions/bulk-review/ (documents/approvals.py)
+BULK_REVIEW = {
+    'MAX_ITEMS': 500,  # Submission ids per request
+    'WORKERS': 4,  # Processes signing PDFs in parallel
+}
+
+# Background submission rendering (documents/tasks.py)
+SUBMISSION_PIPELINE = {
+    # 'command': run `python manage.py process_submissions` next to the web server;
+    # 'thread': drain the queue in a thread of the web process (development).
+    'RUNNER': 'command',
+    'MAX_ATTEMPTS': 3,
+    'POLL_INTERVAL': 1.0,  # Seconds between polls of an empty queue
+    'STALE_AFTER': 600,  # Seconds before a running job is assumed dead and requeued
+}
+
+# Mail-merge batches: POST /api/documents/templates/<id>/batch/ (documents/batches.py).
+# Run by the same runner as SUBMISSION_PIPELINE.
+BATCH_GENERATION = {
+    'MAX_ROWS': 5000,  # Rows per uploaded CSV/JSONL file
+    'WORKERS': 4,  # Processes filling rows in parallel (1 = in the runner process)
+    'PROGRESS_EVERY': 25,  # Rows between progress updates
+    'MAX_ERRORS': 50,  # Failed rows reported in detail
+}
+
+# GET /api/documents/templates/catalog/ (documents/catalog.py)
+TEMPLATE_CATALOG = {
+    'CACHE_ALIAS': 'templates',  # Must be shared by all workers: template changes invalidate it
+    'CACHE_TIMEOUT': 24 * 60 * 60,  # Seconds
+    'PAGE_SIZE': 50,
+    'MAX_PAGE_SIZE': 200,
+}
+
+# ZIP export of approved documents: GET /api/documents/approved/export/ and
+# `python manage.py export_approved_documents` (documents/exports.py)
+APPROVED_EXPORT = {
+    'CHUNK_SIZE': 64 * 1024,  # Bytes read and sent at a time
+}
+
 # Default Auto Field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -212,7 +363,7 @@ LOGGING = {
 
 # Add this at the bottom of settings.py
 SIMPLE_NOTIFICATION_SETTINGS = {
-    'USE_WEBSOCKETS': False,  # Set to True if you want real-time updates
+    'USE_WEBSOCKETS': True,  # Push new notifications to open pages over /ws/notifications/
     'DEFAULT_EXPIRY_DAYS': 30,
     'receive_handler_path': 'custom_module.custom_py_file.custom_receive_handler',
 }
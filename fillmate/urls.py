@@ -14,10 +14,12 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+from django.views.static import serve
 from django.shortcuts import render
 from django.shortcuts import redirect
 from users.views import admin_logout
@@ -80,4 +82,13 @@ urlpatterns = [
     
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Development only: uploaded signatures (shown on the upload page). Documents, templates,
+# batches and approved files are only served by the permission-checked views in
+# documents/urls.py, never from /media/.
+if settings.DEBUG:
+    urlpatterns += [
+        re_path(
+            rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<path>signatures/.+)$',
+            serve, {'document_root': settings.MEDIA_ROOT},
+        ),
+    ]
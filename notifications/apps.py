@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
 
 class NotificationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'notifications'
+
+    def ready(self):
+        # Pushes sent from another process (e.g. process_submissions) would silently go nowhere
+        push_enabled = getattr(settings, 'SIMPLE_NOTIFICATION_SETTINGS', {}).get('USE_WEBSOCKETS', False)
+        backend = getattr(settings, 'CHANNEL_LAYERS', {}).get('default', {}).get('BACKEND')
+        if push_enabled and backend == 'channels.layers.InMemoryChannelLayer':
+            raise ImproperlyConfigured(
+                "USE_WEBSOCKETS needs a channel layer shared between processes "
+                "(e.g. channels_redis.core.RedisChannelLayer), not InMemoryChannelLayer."
+            )
@@ -0,0 +1,26 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .utils import user_group_name
+
+
+class NotificationConsumer(AsyncJsonWebsocketConsumer):
+    """Pushes a user's new notifications to their open pages (see static/js/notifications.js)"""
+
+    group_name = None
+
+    async def connect(self):
+        user = self.scope.get('user')
+        await self.accept()
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)  # Client stops reconnecting on this code
+            return
+        self.group_name = user_group_name(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+
+    async def disconnect(self, code):
+        if self.group_name:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def notification_created(self, event):
+        """Handler for the 'notification.created' messages sent by push_notifications()"""
+        await self.send_json({'type': 'notification', 'notification': event['notification']})
@@ -1,29 +1,52 @@
 # notifications/context_processors.py
-from .models import Notification
+from django.conf import settings
 
+from users.roles import is_hod
+
+from .models import Notification, UnreadNotificationCounter
+
+
+def lazy_value(func):
+    """
+    Defer a context value until a template actually uses it. The template
+    engine calls callables on lookup; the result is kept for later lookups.
+    """
+    result = []
+
+    def value():
+        if not result:
+            result.append(func())
+        return result[0]
+
+    return value
 
 
 def user_context(request):
     context = {}
     if request.user.is_authenticated:
-        # --- Existing Notification Logic ---
-        unread_notifications_qs = Notification.objects.filter(
-            recipient=request.user,
-            is_read=False
-        )
-        context['unread_notifications'] = unread_notifications_qs.order_by('-created_at')[:10]
-        context['unread_count'] = unread_notifications_qs.count() # Count efficiently
+        user = request.user
+        # Counter row instead of COUNT(*); nothing runs unless a template reads it
+        unread_count = lazy_value(lambda: UnreadNotificationCounter.get_count(user))
+
+        def recent_unread():
+            if not unread_count():
+                return []  # Skip the list query when there is nothing unread
+            return list(Notification.objects.filter(
+                recipient=user,
+                is_read=False
+            ).order_by('-created_at')[:10])
+
+        context['unread_notifications'] = lazy_value(recent_unread)
+        context['unread_count'] = unread_count
 
         # --- ADD HOD Check ---
-        try:
-            # Check if the user is in the 'HOD' group
-            context['is_hod_user'] = request.user.groups.filter(name='HOD').exists()
-        except AttributeError:
-             # Handle AnonymousUser or other cases where 'groups' might not exist
-             context['is_hod_user'] = False
+        # Check if the user is in the 'HOD' group
+        context['is_hod_user'] = lazy_value(lambda: is_hod(user))
+        context['notification_push_enabled'] = getattr(settings, 'SIMPLE_NOTIFICATION_SETTINGS', {}).get('USE_WEBSOCKETS', False)
     else:
         context['unread_notifications'] = []
         context['unread_count'] = 0
         context['is_hod_user'] = False
+        context['notification_push_enabled'] = False
 
-    return context
\ No newline at end of file
+    return context
@@ -1,5 +1,9 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 
@@ -34,6 +38,139 @@ class Notification(models.Model):
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Document Submission Alert'
+        indexes = [
+            # Unread lists/counts per recipient, newest first
+            models.Index(fields=['recipient', 'is_read', '-created_at'], name='notif_recipient_unread_idx'),
+            # Keyset-paginated notification history
+            models.Index(fields=['recipient', '-created_at', '-id'], name='notif_recipient_keyset_idx'),
+        ]
 
     def __str__(self):
-        return f"New doc from {self.sender} to {self.recipient}"
\ No newline at end of file
+        return f"New doc from {self.sender} to {self.recipient}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the post_save receiver tell whether is_read changed
+        instance._loaded_is_read = instance.__dict__.get('is_read')
+        return instance
+
+    def mark_read(self):
+        """Mark as read; returns False when it already was (e.g. a double click)."""
+        if not Notification.objects.filter(pk=self.pk, is_read=False).update(is_read=True):
+            return False
+        self.is_read = self._loaded_is_read = True
+        UnreadNotificationCounter.adjust({self.recipient_id: -1})
+        return True
+
+
+class UnreadNotificationCounter(models.Model):
+    """
+    Denormalized number of unread notifications per user, so page renders read
+    one row instead of running COUNT(*). A missing row means "not known yet"
+    and is rebuilt from the notifications table on the next read or adjust().
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='unread_notification_counter')
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user}: {self.count} unread"
+
+    @classmethod
+    def _backfill(cls, user_id):
+        """
+        Create a missing counter from the notifications table; returns the count,
+        or None when another transaction created the row first.
+        """
+        # The COUNT sees this transaction's own changes, so they must not be added again;
+        # a concurrent creator's changes are added by it when its insert conflicts with ours
+        count = Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+        try:
+            with transaction.atomic():
+                cls.objects.create(user_id=user_id, count=count)
+        except IntegrityError:
+            return None
+        return count
+
+    @classmethod
+    def get_count(cls, user):
+        count = cls.objects.filter(user=user).values_list('count', flat=True).first()
+        if count is None:
+            count = cls._backfill(user.pk)
+            if count is None:
+                count = cls.objects.filter(user=user).values_list('count', flat=True).first() or 0
+        return count
+
+    @classmethod
+    def adjust(cls, deltas):
+        """
+        Apply {user_id: delta}; one UPDATE per distinct delta. Missing counters are
+        created for increments only: a decrement is counted by the next read's
+        rebuild anyway, and may come from a user's cascade delete (post_delete),
+        where a new row would point at the user being removed.
+        """
+        by_delta = {}
+        for user_id, delta in deltas.items():
+            if delta:
+                by_delta.setdefault(delta, []).append(user_id)
+        if not by_delta:
+            return
+        with transaction.atomic():
+            # Locked, so the rows cannot change between this check and the UPDATE
+            existing = set(
+                cls.objects.select_for_update().filter(user_id__in=list(deltas)).values_list('user_id', flat=True)
+            )
+            for delta, user_ids in by_delta.items():
+                cls._apply(delta, [user_id for user_id in user_ids if user_id in existing])
+                if delta < 0:
+                    continue
+                for user_id in user_ids:
+                    if user_id not in existing and cls._backfill(user_id) is None:
+                        # Created meanwhile by a transaction that cannot have counted this change
+                        cls._apply(delta, [user_id])
+
+    @classmethod
+    def _apply(cls, delta, user_ids):
+        if not user_ids:
+            return
+        counters = cls.objects.filter(user_id__in=user_ids)
+        if delta < 0:
+            counters = counters.filter(count__gte=-delta)  # Never below zero
+        counters.update(count=F('count') + delta)
+
+
+# Keep unread counters in step with single-row saves/deletes and push new rows
+# (bulk_create callers do both themselves, see notifications/utils.py)
+@receiver(post_save, sender=Notification)
+def update_unread_counter_on_save(sender, instance, created, **kwargs):
+    if created:
+        delta = 0 if instance.is_read else 1
+    else:
+        previous = getattr(instance, '_loaded_is_read', None)
+        # +1 when marked unread, -1 when marked read
+        delta = 0 if previous is None else int(previous) - int(instance.is_read)
+    instance._loaded_is_read = instance.is_read
+    UnreadNotificationCounter.adjust({instance.recipient_id: delta})
+    if created:
+        from .utils import push_notifications
+        push_notifications([instance])
+
+@receiver(post_delete, sender=Notification)
+def update_unread_counter_on_delete(sender, instance, **kwargs):
+    if not instance.is_read:
+        UnreadNotificationCounter.adjust({instance.recipient_id: -1})
+
+# Keep the cached group member ids used for notification fan-out current
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_group_members_on_membership_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        from .utils import invalidate_group_members
+        invalidate_group_members()
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=User)
+def invalidate_group_members_on_change(sender, **kwargs):
+    """Renamed/deleted groups and deleted users drop out of the cached member lists"""
+    from .utils import invalidate_group_members
+    invalidate_group_members()
@@ -1,3 +1,247 @@
-from django.test import TestCase
+import base64
+import json
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.apps import apps
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from fillmate.pagination import InvalidCursor, KeysetPaginator, encode_cursor
+
+from .consumers import NotificationConsumer
+from .models import Notification, UnreadNotificationCounter
+from .utils import NOTIFICATION_SETTINGS, dispatch_notifications, get_group_member_ids, notify_document_submission
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+@mock.patch.dict(NOTIFICATION_SETTINGS, {'PUSH': True})
+class NotificationPushTests(TransactionTestCase):
+    """New notifications reach the recipient's open sockets, and only theirs."""
+    # Not TestCase: consumers close old database connections, which would end its transaction
+
+    def setUp(self):
+        self.sender = User.objects.create_user('sender', password='x')
+        self.recipient = User.objects.create_user('recipient', password='x')
+        self.bystander = User.objects.create_user('bystander', password='x')
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), '/ws/notifications/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def notify(self, recipient, message):
+        # Autocommit here, so the on_commit push is sent right away
+        return dispatch_notifications([recipient.id], self.sender, self.sender, message)
+
+    async def test_anonymous_socket_closed(self):
+        communicator = await self.connect(AnonymousUser())
+        self.assertEqual(await communicator.receive_output(), {'type': 'websocket.close', 'code': 4401})
+
+    async def test_push_reaches_recipient_only(self):
+        recipient = await self.connect(self.recipient)
+        bystander = await self.connect(self.bystander)
+
+        notifications = await sync_to_async(self.notify)(self.recipient, 'Document submitted')
+
+        message = await recipient.receive_json_from(timeout=1)
+        self.assertEqual(message['type'], 'notification')
+        self.assertEqual(message['notification']['id'], notifications[0].id)
+        self.assertEqual(message['notification']['message'], 'Document submitted')
+        self.assertEqual(message['notification']['sender'], 'sender')
+        self.assertTrue(await bystander.receive_nothing())
+
+        await recipient.disconnect()
+        await bystander.disconnect()
+
+    async def test_no_push_after_disconnect(self):
+        recipient = await self.connect(self.recipient)
+        await recipient.disconnect()
+        # Nothing left in the user's group to send to
+        await sync_to_async(self.notify)(self.recipient, 'After close')
+        self.assertTrue(await recipient.receive_nothing())
+
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'missing_package.layers.RedisChannelLayer'}})
+    def test_broken_channel_layer_does_not_fail_request(self):
+        with self.assertLogs('notifications.utils', 'ERROR'):
+            notifications = self.notify(self.recipient, 'Stored anyway')
+        self.assertEqual(len(notifications), 1)
+        self.assertEqual(UnreadNotificationCounter.get_count(self.recipient), 1)
+
+
+class ChannelLayerConfigTests(SimpleTestCase):
+    IN_MEMORY = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+    def test_push_refuses_in_memory_layer(self):
+        config = apps.get_app_config('notifications')
+        with override_settings(CHANNEL_LAYERS=self.IN_MEMORY, SIMPLE_NOTIFICATION_SETTINGS={'USE_WEBSOCKETS': True}):
+            with self.assertRaises(ImproperlyConfigured):
+                config.ready()
+        with override_settings(CHANNEL_LAYERS=self.IN_MEMORY, SIMPLE_NOTIFICATION_SETTINGS={'USE_WEBSOCKETS': False}):
+            config.ready()
+
+
+class UnreadCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender = User.objects.create_user('sender', password='x')
+        cls.recipient = User.objects.create_user('recipient', password='x')
+
+    def test_missing_counter_created_by_adjust(self):
+        # No counter row yet: the notifications must still be counted, once
+        dispatch_notifications([self.recipient.id], self.sender, self.sender, 'First')
+        self.assertEqual(UnreadNotificationCounter.objects.get(user=self.recipient).count, 1)
+        notification = dispatch_notifications([self.recipient.id], self.sender, self.sender, 'Second')[0]
+        self.assertEqual(UnreadNotificationCounter.get_count(self.recipient), 2)
+
+        UnreadNotificationCounter.objects.filter(user=self.recipient).delete()
+        notification.mark_read()
+        self.assertEqual(UnreadNotificationCounter.get_count(self.recipient), 1)
+
+    def test_deleting_user_with_unread_notifications(self):
+        dispatch_notifications([self.recipient.id], self.sender, self.sender, 'Unread')
+        UnreadNotificationCounter.objects.filter(user=self.recipient).delete()
+        self.recipient.delete()
+        # The cascade's post_delete decrements must not recreate the deleted user's counter
+        self.assertFalse(UnreadNotificationCounter.objects.filter(user_id=self.recipient.id).exists())
+        connection.check_constraints()
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages over (created_at, id), including rows sharing a timestamp across a page boundary."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender = User.objects.create_user('sender', password='x')
+        cls.recipient = User.objects.create_user('recipient', password='x')
+        notifications = []
+        for _ in range(7):
+            notifications += dispatch_notifications([cls.recipient.id], cls.sender, cls.sender, 'n')
+        # Three rows per timestamp, so pages of two split the groups
+        now = timezone.now()
+        for i, notification in enumerate(notifications):
+            Notification.objects.filter(pk=notification.pk).update(created_at=now - timedelta(minutes=i // 3))
+        cls.expected = list(
+            Notification.objects.order_by('-created_at', '-pk').values_list('pk', flat=True)
+        )
+
+    def paginator(self):
+        return KeysetPaginator(Notification.objects.all(), 2, 'created_at')
+
+    def ids(self, page):
+        return [notification.pk for notification in page]
+
+    def test_forward_and_back(self):
+        pages = [self.paginator().page()]
+        self.assertFalse(pages[0].has_previous())
+        while pages[-1].has_next():
+            pages.append(self.paginator().page(pages[-1].next_cursor))
+        self.assertEqual([pk for page in pages for pk in self.ids(page)], self.expected)
+        self.assertEqual(len(pages[-1]), 1)
+
+        # Back from the last page through the previous links: the same pages, in reverse
+        page = pages[-1]
+        for expected in reversed(pages[:-1]):
+            page = self.paginator().page(page.previous_cursor)
+            self.assertEqual(self.ids(page), self.ids(expected))
+        self.assertFalse(page.has_previous())
+        self.assertTrue(page.has_next())
+
+    def test_malformed_cursors(self):
+        def encoded(data):
+            return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+        timestamp = timezone.now().isoformat()
+        for cursor in (
+            'not-a-cursor', '%%%', encoded([1, 2]), encoded({'t': timestamp}), encoded({'t': 'yesterday', 'i': 1}),
+            encoded({'t': timestamp, 'i': 2 ** 70}), encoded({'t': '2024-01-01T00:00:00', 'i': 1}),
+        ):
+            with self.subTest(cursor):
+                # HTML pages fall back to the newest page; the API refuses the cursor
+                self.assertEqual(self.ids(self.paginator().page(cursor)), self.expected[:2])
+                with self.assertRaises(InvalidCursor):
+                    self.paginator().page(cursor, strict=True)
+
+    def test_api_rejects_malformed_cursor(self):
+        client = APIClient()
+        client.force_authenticate(self.recipient)
+        url = reverse('notifications:notification-feed')
+        first = client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual([n['id'] for n in first.data['results']], self.expected)
+        self.assertIsNone(first.data['next'])
+
+        self.assertEqual(client.get(url, {'cursor': 'not-a-cursor'}).status_code, 404)
+        cursor = encode_cursor((timezone.now(), self.expected[0]))
+        self.assertEqual(client.get(url, {'cursor': cursor}).status_code, 200)
+
+
+@override_settings(CACHES={
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'notifications-tests-{alias}'}
+    for alias in ('default', 'sessions', 'templates')
+})
+class FanOutTests(TestCase):
+    """One INSERT per fan-out, and cached group members that follow membership changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender = User.objects.create_user('submitter', password='x')
+        cls.hod_group = Group.objects.create(name='HOD')
+        cls.hods = [User.objects.create_user(f'hod{number}', password='x') for number in range(3)]
+        cls.hod_group.user_set.add(*cls.hods)
+
+    def setUp(self):
+        for alias in ('default', 'sessions', 'templates'):
+            caches[alias].clear()
+
+    def fan_out_queries(self):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks():
+            notifications = notify_document_submission(self.sender, self.sender)
+        self.assertCountEqual([n.recipient_id for n in notifications], get_group_member_ids('HOD'))
+        self.assertTrue(all(n.pk for n in notifications))
+        return [query['sql'] for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+
+    def test_fan_out_in_one_insert(self):
+        notify_document_submission(self.sender, self.sender)  # Creates the unread counters
+        few = self.fan_out_queries()
+        self.hod_group.user_set.add(*[User.objects.create_user(f'extra{number}', password='x') for number in range(5)])
+        notify_document_submission(self.sender, self.sender)
+        many = self.fan_out_queries()
+        # Same statements for 3 and 8 recipients: one INSERT of the notifications, one counter UPDATE
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(sum(sql.startswith('INSERT INTO "notifications_notification"') for sql in many), 1)
+        self.assertEqual(sum(sql.startswith('UPDATE "notifications_unreadnotificationcounter"') for sql in many), 1)
+        self.assertEqual({hod.id: UnreadNotificationCounter.get_count(hod) for hod in self.hods}, {
+            hod.id: 4 for hod in self.hods
+        })
+        # Duplicate recipients get one notification
+        recipient_ids = [hod.id for hod in self.hods]
+        self.assertEqual(len(dispatch_notifications(recipient_ids * 2, self.sender, self.sender, 'Once')), 3)
+
+    def test_group_members_cached_until_membership_changes(self):
+        self.assertCountEqual(get_group_member_ids('HOD'), [hod.id for hod in self.hods])
+        with self.assertNumQueries(0):
+            get_group_member_ids('HOD')
+
+        newcomer = User.objects.create_user('newcomer', password='x')
+        newcomer.groups.add(self.hod_group)
+        self.assertIn(newcomer.id, get_group_member_ids('HOD'))
+        self.hod_group.user_set.remove(self.hods[0])
+        self.assertNotIn(self.hods[0].id, get_group_member_ids('HOD'))
+        self.hods[1].delete()
+        self.assertNotIn(self.hods[1].id, get_group_member_ids('HOD'))
+        self.hod_group.name = 'Heads'
+        self.hod_group.save()
+        self.assertEqual(get_group_member_ids('HOD'), [])
@@ -1,9 +1,10 @@
 from django.urls import path
-from .views import mark_notification_read, AllNotificationsView
+from .views import mark_notification_read, AllNotificationsView, NotificationListAPIView
 
 app_name = 'notifications'
 
 urlpatterns = [
     path('<int:pk>/read/', mark_notification_read, name='mark_read'),
     path('', AllNotificationsView.as_view(), name='all-notifications'),
+    path('feed/', NotificationListAPIView.as_view(), name='notification-feed'),
 ]
\ No newline at end of file
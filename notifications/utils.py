@@ -1,20 +1,154 @@
+import logging
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
-from .models import Notification
+from django.core.cache import caches
+from django.db import transaction
+from django.urls import reverse
+
+from .models import Notification, UnreadNotificationCounter
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_SETTINGS = {
+    # Shared by the web processes and the process_submissions worker (which notifies HODs),
+    # so a membership change made in one process reaches the others
+    'GROUP_CACHE_ALIAS': 'sessions',
+    'GROUP_CACHE_TIMEOUT': 300,  # Seconds a group's member ids stay cached
+    'PUSH': getattr(settings, 'SIMPLE_NOTIFICATION_SETTINGS', {}).get('USE_WEBSOCKETS', False),
+    **getattr(settings, 'NOTIFICATIONS', {}),
+}
+
+MESSAGE_MAX_LENGTH = Notification._meta.get_field('message').max_length
+
+GROUP_MEMBERS_VERSION_KEY = 'notifications:group-members:version'
+
+
+def _group_cache():
+    return caches[NOTIFICATION_SETTINGS['GROUP_CACHE_ALIAS']]
+
+
+def get_group_member_ids(group_name):
+    """Ids of the users in a group, cached; dropped whenever memberships change (see models.py)."""
+    cache = _group_cache()
+    version = cache.get_or_set(GROUP_MEMBERS_VERSION_KEY, time.time_ns, None)
+    key = f'notifications:group-members:{version}:{group_name}'
+    member_ids = cache.get(key)
+    if member_ids is None:
+        member_ids = list(
+            get_user_model().objects.filter(groups__name=group_name).values_list('id', flat=True)
+        )
+        cache.set(key, member_ids, NOTIFICATION_SETTINGS['GROUP_CACHE_TIMEOUT'])
+    return member_ids
+
+
+def invalidate_group_members():
+    """Forget every cached member list (memberships change rarely, so no finer tracking)."""
+    cache = _group_cache()
+    try:
+        cache.incr(GROUP_MEMBERS_VERSION_KEY)
+    except ValueError:
+        # Evicted: start from a fresh value so no older entry can match
+        cache.set(GROUP_MEMBERS_VERSION_KEY, time.time_ns(), None)
+
+
+def create_notifications(sender, items):
+    """
+    Create notifications from (recipient_id, target, message) items in a single
+    INSERT, bump the unread counters and push them to open pages.
+    """
+    if not items:
+        return []
+    with transaction.atomic():
+        notifications = Notification.objects.bulk_create([
+            Notification(
+                recipient_id=recipient_id,
+                sender=sender,
+                # get_for_model is served from ContentType's in-process cache after the first call
+                content_type=ContentType.objects.get_for_model(target),
+                object_id=target.pk,
+                message=message[:MESSAGE_MAX_LENGTH],
+            )
+            for recipient_id, target, message in items
+        ])
+        # bulk_create skips post_save, so bump the unread counters and push here
+        deltas = {}
+        for notification in notifications:
+            deltas[notification.recipient_id] = deltas.get(notification.recipient_id, 0) + 1
+        UnreadNotificationCounter.adjust(deltas)
+        push_notifications(notifications)
+    return notifications
+
+
+def dispatch_notifications(recipient_ids, sender, target, message):
+    """Create one notification per recipient about `target` in a single INSERT."""
+    return create_notifications(
+        sender, [(recipient_id, target, message) for recipient_id in dict.fromkeys(recipient_ids)]
+    )
+
+
+def user_group_name(user_id):
+    """Channel layer group holding every open notification socket of one user."""
+    return f'notifications.user.{user_id}'
+
+
+def serialize_notification(notification):
+    return {
+        'id': notification.id,
+        'message': notification.message,
+        'sender': notification.sender.username if notification.sender_id else None,
+        'created_at': notification.created_at.isoformat() if notification.created_at else None,
+        'is_read': notification.is_read,
+        'url': reverse('notifications:mark_read', args=[notification.id]) if notification.id else None,
+    }
+
+
+def push_notifications(notifications):
+    """Send new notifications to their recipients' open sockets once the transaction commits."""
+    if not NOTIFICATION_SETTINGS['PUSH'] or not notifications:
+        return
+    messages = [(n.recipient_id, serialize_notification(n)) for n in notifications]
+
+    def send():
+        # Runs after the commit, in the request that created the notifications: never raise
+        try:
+            channel_layer = get_channel_layer()
+        except Exception as e:
+            # e.g. channels_redis missing or CHANNEL_LAYERS misconfigured
+            logger.error(f"Could not push {len(messages)} notification(s): no channel layer: {e}", exc_info=True)
+            return
+        if channel_layer is None:
+            return
+        for recipient_id, payload in messages:
+            try:
+                async_to_sync(channel_layer.group_send)(
+                    user_group_name(recipient_id),
+                    {'type': 'notification.created', 'notification': payload},
+                )
+            except Exception as e:
+                # Push is best effort; the notification is already stored
+                logger.warning(f"Could not push notification {payload['id']} to user {recipient_id}: {e}")
+
+    transaction.on_commit(send)
+
 
 def notify_document_submission(submitted_doc, sender):
     """Create notifications for HODs when docs are submitted"""
-    from django.contrib.auth.models import Group
-    
-    # Get the document's content type
-    doc_type = ContentType.objects.get_for_model(submitted_doc)
-    
-    # Notify all HODs
-    hod_group = Group.objects.get(name='HOD')
-    for hod in hod_group.user_set.all():
-        Notification.objects.create(
-            recipient=hod,
-            sender=sender,
-            content_type=doc_type,
-            object_id=submitted_doc.id,
-            message=f"New {submitted_doc.__class__.__name__} submitted by {sender.username}"
-        )
\ No newline at end of file
+    hod_ids = get_group_member_ids('HOD')
+    if not hod_ids:
+        logger.warning(f"No HOD users to notify about submission {submitted_doc.id}")
+    return dispatch_notifications(
+        hod_ids,
+        sender,
+        submitted_doc,
+        f"New {submitted_doc.__class__.__name__} submitted by {sender.username}",
+    )
+
+
+def notify_submission_reviewed(submission, reviewer, message):
+    """Tell the submitting user that an HOD approved or rejected their submission."""
+    return dispatch_notifications([submission.user_id], reviewer, submission, message)
@@ -1,11 +1,15 @@
 from django.shortcuts import get_object_or_404, redirect
 from django.views.generic import ListView
-from .models import Notification
+from rest_framework.generics import ListAPIView
+from rest_framework.permissions import IsAuthenticated
+
+from fillmate.pagination import KeysetPagination, KeysetPaginator
+from .models import Notification, UnreadNotificationCounter
+from .utils import serialize_notification
 
 def mark_notification_read(request, pk):
     notification = get_object_or_404(Notification, pk=pk, recipient=request.user)
-    notification.is_read = True
-    notification.save()
+    notification.mark_read()
     
     # Redirect to the document if linked, or to a default URL
     if notification.content_object:
@@ -16,6 +20,11 @@ class AllNotificationsView(ListView):
     template_name = 'all_notifications.html'
     context_object_name = 'notifications'
     paginate_by = 10
+
+    def paginate_queryset(self, queryset, page_size):
+        """Keyset pagination over (created_at, id) instead of COUNT(*) + OFFSET."""
+        page = KeysetPaginator(queryset, page_size, 'created_at').page(self.request.GET.get('cursor'))
+        return None, page, page.object_list, page.has_other_pages()
     
     def get_queryset(self):
         # Get all notifications for the current user (as recipient)
@@ -35,8 +44,26 @@ class AllNotificationsView(ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Add any additional context data
-        context['unread_count'] = Notification.objects.filter(
-            recipient=self.request.user,
-            is_read=False
-        ).count()
-        return context
\ No newline at end of file
+        context['unread_count'] = UnreadNotificationCounter.get_count(self.request.user)
+        return context
+
+
+class NotificationCursorPagination(KeysetPagination):
+    date_field = 'created_at'
+    page_size = 20
+
+
+class NotificationListAPIView(ListAPIView):
+    """JSON notification history for the current user, newest first (?filter=unread, ?cursor=...)"""
+    permission_classes = [IsAuthenticated]
+    pagination_class = NotificationCursorPagination
+
+    def get_queryset(self):
+        queryset = Notification.objects.filter(recipient=self.request.user).select_related('sender')
+        if self.request.query_params.get('filter') == 'unread':
+            queryset = queryset.filter(is_read=False)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        return self.get_paginated_response([serialize_notification(n) for n in page])
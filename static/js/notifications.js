@@ -0,0 +1,68 @@
+// Live notifications over /ws/notifications/ (notifications/consumers.py)
+// Updates the unread badges and the navbar dropdown without reloading the page,
+// and fires a 'fillmate:notification' event pages can listen to.
+(function() {
+    const SOCKET_PATH = '/ws/notifications/';
+    const MAX_RETRY_DELAY_MS = 30000;
+    const MAX_FAILURES = 5; // Attempts in a row without an open socket (e.g. no ASGI server)
+    const UNAUTHORIZED = 4401; // Sent by the server for anonymous sockets
+    let retryDelay = 1000;
+    let failures = 0;
+
+    function updateUnreadCount(delta) {
+        document.querySelectorAll('[data-unread-count]').forEach(el => {
+            const count = Math.max(0, (parseInt(el.textContent, 10) || 0) + delta);
+            el.textContent = count;
+            el.closest('[data-unread-badge]')?.classList.toggle('d-none', count === 0);
+        });
+    }
+
+    function prependToDropdown(notification) {
+        const list = document.querySelector('.notification-content');
+        if (!list) return;
+        list.querySelector('.notification-empty')?.remove();
+
+        // Same markup as the server-rendered items in navbar.html
+        const item = document.createElement('a');
+        item.href = notification.url || '#';
+        item.className = 'dropdown-item notification-item unread py-2 px-3 d-block';
+        const wrapper = document.createElement('div');
+        wrapper.className = 'notification-message';
+        const text = document.createElement('p');
+        text.className = 'mb-1 notification-text small fw-bold';
+        text.textContent = notification.message; // textContent: messages contain user input
+        const time = document.createElement('small');
+        time.className = 'text-muted notification-time';
+        time.textContent = 'just now' + (notification.sender ? ` - By: ${notification.sender}` : '');
+        wrapper.append(text, time);
+        item.append(wrapper);
+        list.prepend(item);
+    }
+
+    function connect() {
+        const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        const socket = new WebSocket(`${scheme}://${window.location.host}${SOCKET_PATH}`);
+
+        socket.onopen = () => { retryDelay = 1000; failures = 0; };
+
+        socket.onmessage = (event) => {
+            const data = JSON.parse(event.data);
+            if (data.type !== 'notification') return;
+            updateUnreadCount(1);
+            prependToDropdown(data.notification);
+            document.dispatchEvent(new CustomEvent('fillmate:notification', { detail: data.notification }));
+        };
+
+        socket.onclose = (event) => {
+            if (event.code === UNAUTHORIZED) return;
+            // Server restart: back off and try again; no ASGI server at all: give up
+            if (++failures >= MAX_FAILURES) return;
+            setTimeout(connect, retryDelay);
+            retryDelay = Math.min(retryDelay * 2, MAX_RETRY_DELAY_MS);
+        };
+    }
+
+    if ('WebSocket' in window) {
+        connect();
+    }
+})();
@@ -142,12 +142,26 @@ document.addEventListener('DOMContentLoaded', function() {
     // 4. Template Management
     // ----------------------
     async function loadTemplates() {
-        const templates = await makeAuthenticatedRequest('/api/documents/templates/');
-        if (!templates) return;
+        // Cached catalog (revalidated with ETags); placeholders are fetched when a template is opened
+        const templates = [];
+        let url = '/api/documents/templates/catalog/?fields=id,name,placeholder_count,placeholders_url&page_size=200';
+        while (url) {
+            const page = await makeAuthenticatedRequest(url);
+            if (!page) return;
+            templates.push(...page.results);
+            url = page.next;
+        }
 
         renderTemplates(templates);
     }
 
+    async function loadPlaceholders(template) {
+        if (!template.placeholders) {
+            template.placeholders = await makeAuthenticatedRequest(template.placeholders_url) || [];
+        }
+        return template.placeholders;
+    }
+
     function renderTemplates(templates) {
         const container = document.getElementById('templateContainer');
         if (!container) return;
@@ -170,7 +184,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     </div>
                     <div class="card-body">
                         <h5 class="card-title">${template.name}</h5>
-                        <p class="card-text">${template.placeholders.length} fields</p>
+                        <p class="card-text">${template.placeholder_count} fields</p>
                         ${template.user ? `<small class="text-muted">Uploaded by ${template.user.username}</small>` : ''}
                     </div>
                 </div>
@@ -200,13 +214,14 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // 5. Document Operations
     // ----------------------
-    window.openTemplateForm = function(templateId) {
+    window.openTemplateForm = async function(templateId) {
         const form = document.getElementById('documentForm');
         form.innerHTML = '';
 
         document.getElementById('templateModalLabel').textContent = window.currentTemplate.name;
 
-        window.currentTemplate.placeholders.forEach(placeholder => {
+        const placeholders = await loadPlaceholders(window.currentTemplate);
+        placeholders.forEach(placeholder => {
             const formGroup = document.createElement('div');
             formGroup.className = 'form-group mb-3';
 
@@ -226,6 +241,25 @@ document.addEventListener('DOMContentLoaded', function() {
     };
 
     // --- MODIFY THIS FUNCTION ---
+// Poll a submission's status until it leaves 'Rendering'; throws if rendering failed
+async function waitForSubmission(statusUrl, intervalMs = 1000, maxWaitMs = 120000) {
+    const deadline = Date.now() + maxWaitMs;
+    while (Date.now() < deadline) {
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+        const response = await fetch(statusUrl, {
+            headers: { 'Authorization': `Bearer ${await getValidToken()}` }
+        });
+        if (!response.ok) continue; // Transient error, keep polling
+        const result = await response.json();
+        if (result.status === 'Failed') {
+            throw new Error(result.error || 'The document could not be generated.');
+        }
+        if (result.status !== 'Rendering') return result;
+    }
+    // Still rendering; it will show up on My Documents once ready
+    return null;
+}
+
 window.handleFormSubmission = async function() {
     const submitBtn = document.getElementById('submitForApprovalBtn');
     const form = document.getElementById('documentForm');
@@ -314,8 +348,13 @@ window.handleFormSubmission = async function() {
             throw new Error(result.error || `Submission failed with status: ${response.status}`);
         }
 
+        // Accepted - the document is rendered in the background, wait for it
+        if (response.status === 202 && result.status_url) {
+            submitBtn.innerHTML = '<span class="spinner-border spinner-border-sm"></span> Preparing document...';
+            await waitForSubmission(result.status_url);
+        }
+
         // Success - Redirect
-        // Maybe show a success message briefly before redirecting?
         window.location.href = result.redirect_url || '/documents/my-documents/'; // Redirect to My Docs page
 
     } catch (error) {
@@ -0,0 +1,64 @@
+"""
+Stateless JWT authentication for read-only API calls.
+
+ClaimsJWTAuthentication (first in REST_FRAMEWORK's authentication classes)
+validates the token like JWTAuthentication, then:
+- for safe methods (GET/HEAD/OPTIONS) with a token whose version is current
+  (users/tokens.py), builds request.user from the token claims: a User
+  instance that is never saved or fetched, with its roles pre-resolved, so
+  neither the user row nor its groups are queried;
+- for writes, tokens without claims or with an outdated version, loads the
+  user from the database exactly as JWTAuthentication does (inactive and
+  deleted users are rejected there).
+
+A view that needs the full user row on a GET can set `fresh_user = True`.
+"""
+from django.contrib.auth.models import User
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from .tokens import TOKEN_VERSION_CLAIM, get_token_version
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+
+        view = request.parser_context.get('view') if request.parser_context else None
+        if request.method in SAFE_METHODS and not getattr(view, 'fresh_user', False):
+            user = self.get_claims_user(validated_token)
+            if user is not None:
+                return user, validated_token
+        return self.get_user(validated_token), validated_token
+
+    def get_claims_user(self, validated_token):
+        """User built from the token, or None when its claims cannot be trusted."""
+        try:
+            user_id = int(validated_token[api_settings.USER_ID_CLAIM])
+            version = validated_token[TOKEN_VERSION_CLAIM]
+        except (KeyError, TypeError, ValueError):
+            return None  # Issued before claims were added
+        if version != get_token_version(user_id):
+            return None
+
+        user = User(
+            id=user_id,
+            username=validated_token.get('username', ''),
+            is_staff=validated_token.get('is_staff', False),
+            is_superuser=validated_token.get('is_superuser', False),
+            is_active=True,  # Deactivating a user bumps the token version
+        )
+        user._state.adding = False
+        user._role_cache = frozenset(validated_token.get('roles', []))  # Used by users/roles.py
+        user.from_token_claims = True
+        return user
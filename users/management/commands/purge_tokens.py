@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from users.revocation import REVOCATION_SETTINGS, purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = "Delete expired refresh tokens from the outstanding and blacklisted token tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=REVOCATION_SETTINGS['PURGE_BATCH_SIZE'],
+            help="Tokens deleted per statement.",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be deleted.")
+
+    def handle(self, *args, **options):
+        count = purge_expired_tokens(options['batch_size'], dry_run=options['dry_run'])
+        verb = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(f"{verb} {count} expired token(s)")
@@ -1,7 +1,8 @@
 # users/models.py
 from django.db import models
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.utils import timezone # <-- Add this import
 
@@ -19,6 +20,8 @@ class UserProfile(models.Model):
     )
     # ✅ ADD THIS FIELD:
     signature_uploaded_at = models.DateTimeField(null=True, blank=True)
+    # Bumped when JWT claims (groups, staff flags, password, active) may be stale; see users/tokens.py
+    token_version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"{self.user.username}'s Profile"
@@ -29,4 +32,72 @@ def create_or_update_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
     # If you want profile updates on user save (e.g., email change), uncomment below
-    # instance.userprofile.save()
\ No newline at end of file
+    # instance.userprofile.save()
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user_signal(sender, instance, created=False, update_fields=None, **kwargs):
+    # AdminSessionMiddleware caches admin users; staff flag or password may have changed
+    from fillmate.middleware import invalidate_cached_user
+    from .roles import invalidate_user_roles
+    from .tokens import bump_token_version
+
+    invalidate_cached_user(instance.pk)
+    invalidate_user_roles([instance.pk])  # Nothing stale may apply to a new or deleted user
+    # Logging in only touches last_login, which no token claims
+    if not created and set(update_fields or ()) != {'last_login'}:
+        bump_token_version([instance.pk])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_user_roles_signal(sender, instance, action, reverse, pk_set, **kwargs):
+    """Group membership changed: drop the cached roles of the users involved (users/roles.py)."""
+    from .roles import invalidate_user_roles
+    from .tokens import bump_token_version
+
+    if action == 'pre_clear' and reverse:
+        # group.user_set.clear() does not say which users it removed
+        instance._cleared_user_ids = list(instance.user_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        instance.__dict__.pop('_role_cache', None)
+        user_ids = [instance.pk]
+    elif action == 'post_clear':
+        user_ids = instance.__dict__.pop('_cleared_user_ids', [])
+    else:
+        user_ids = pk_set
+    invalidate_user_roles(user_ids)
+    bump_token_version(user_ids)  # Role claims in issued JWTs are outdated
+
+
+@receiver(pre_delete, sender=Group)
+def remember_group_members_signal(sender, instance, **kwargs):
+    instance._member_ids = list(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_member_roles_signal(sender, instance, **kwargs):
+    """A renamed or deleted group changes its members' roles."""
+    from .roles import invalidate_user_roles
+    from .tokens import bump_token_version
+
+    member_ids = getattr(instance, '_member_ids', None)
+    if member_ids is None:
+        member_ids = list(instance.user_set.values_list('pk', flat=True))
+    invalidate_user_roles(member_ids)
+    bump_token_version(member_ids)
+
+
+@receiver(post_save, sender='token_blacklist.BlacklistedToken')
+def mark_blacklist_changed_signal(sender, instance, created, **kwargs):
+    """New blacklist row: make every process's revocation filter re-sync (users/revocation.py)."""
+    from django.db import transaction
+    from .revocation import mark_blacklist_changed
+
+    # No delete receiver on purpose: it would stop purge_tokens' cascades from being bulk deletes.
+    # Un-blacklisted rows are dropped from the filters at the next full sync.
+    if created:
+        transaction.on_commit(mark_blacklist_changed)
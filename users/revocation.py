@@ -0,0 +1,140 @@
+"""
+In-process copy of the simplejwt refresh token blacklist.
+
+With ROTATE_REFRESH_TOKENS and BLACKLIST_AFTER_ROTATION every refresh
+blacklists the token it used, and simplejwt checks each presented refresh
+token with a JOIN on the outstanding/blacklisted tables. Instead,
+FillMateRefreshToken (users/tokens.py) asks revocation_filter, which keeps
+the jti of every unexpired blacklisted token in memory (16 bytes each):
+
+- blacklisting a token updates a marker in the shared cache (models.py);
+- a check first compares that marker with the one seen at the last sync, and
+  only when it moved reads the rows blacklisted since then (plus an overlap
+  for transactions that committed late) - otherwise no query at all;
+- expired jtis are dropped as they go, since expired tokens fail anyway.
+
+`manage.py purge_tokens` deletes expired outstanding/blacklisted rows in
+batches, so the tables stay bounded too.
+"""
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+REVOCATION_SETTINGS = {
+    'CACHE_ALIAS': 'sessions',  # Shared by all workers: carries the "blacklist changed" marker
+    'SYNC_OVERLAP': 60,  # Seconds re-read before the last sync (late-committing transactions)
+    'FULL_SYNC_INTERVAL': 60 * 60,  # Seconds between complete reloads, as a safety net
+    'PURGE_BATCH_SIZE': 1000,  # Outstanding tokens deleted per statement by purge_tokens
+    **getattr(settings, 'TOKEN_REVOCATION', {}),
+}
+
+BLACKLIST_MARKER_KEY = 'token-blacklist:marker'
+
+
+def _cache():
+    return caches[REVOCATION_SETTINGS['CACHE_ALIAS']]
+
+
+def _jti_key(jti):
+    # simplejwt jtis are uuid4 hex strings; anything else is kept as text
+    try:
+        return uuid.UUID(hex=jti).bytes
+    except ValueError:
+        return jti
+
+
+def mark_blacklist_changed():
+    """Tell every process that the blacklist has new rows (called after a blacklist insert commits)."""
+    _cache().set(BLACKLIST_MARKER_KEY, uuid.uuid4().hex, None)
+
+
+class RevocationFilter:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._revoked = {}  # jti key -> expiry (epoch seconds)
+        self._marker = None
+        self._synced_through = None  # Time the last sync's query started
+        self._full_sync_at = 0.0
+
+    def _marker_value(self):
+        marker = _cache().get(BLACKLIST_MARKER_KEY)
+        if marker is None:
+            # Evicted or never set: start a new one, and reload to be safe
+            _cache().add(BLACKLIST_MARKER_KEY, uuid.uuid4().hex, None)
+            marker = _cache().get(BLACKLIST_MARKER_KEY)
+        return marker
+
+    def _load(self, since=None):
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+        now = timezone.now()
+        rows = BlacklistedToken.objects.filter(token__expires_at__gt=now)
+        if since is not None:
+            rows = rows.filter(blacklisted_at__gte=since - timedelta(seconds=REVOCATION_SETTINGS['SYNC_OVERLAP']))
+        revoked = {} if since is None else self._revoked
+        for jti, expires_at in rows.values_list('token__jti', 'token__expires_at').iterator():
+            revoked[_jti_key(jti)] = expires_at.timestamp()
+        self._revoked = revoked
+        self._synced_through = now
+
+    def _prune(self):
+        now = time.time()
+        expired = [key for key, expires in self._revoked.items() if expires <= now]
+        for key in expired:
+            del self._revoked[key]
+
+    def sync(self):
+        """Bring the filter up to date if the blacklist changed since the last sync."""
+        with self._lock:
+            marker = self._marker_value()
+            full = self._synced_through is None or time.monotonic() - self._full_sync_at > REVOCATION_SETTINGS['FULL_SYNC_INTERVAL']
+            if not full and marker == self._marker:
+                return
+            # Marker read before the query: a blacklist landing meanwhile moves it again
+            self._marker = marker
+            if full:
+                self._load()
+                self._full_sync_at = time.monotonic()
+            else:
+                self._load(since=self._synced_through)
+                self._prune()
+
+    def is_revoked(self, jti):
+        self.sync()
+        expires = self._revoked.get(_jti_key(jti))
+        return expires is not None and expires > time.time()
+
+    def add(self, jti, expires_at):
+        """Record a token this process just blacklisted."""
+        with self._lock:
+            self._revoked[_jti_key(jti)] = expires_at.timestamp()
+
+    def __len__(self):
+        return len(self._revoked)
+
+
+revocation_filter = RevocationFilter()
+
+
+def purge_expired_tokens(batch_size=None, dry_run=False):
+    """Delete expired outstanding tokens (and their blacklist rows) in batches; returns the count."""
+    from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+    batch_size = batch_size or REVOCATION_SETTINGS['PURGE_BATCH_SIZE']
+    expired = OutstandingToken.objects.filter(expires_at__lte=timezone.now())
+    if dry_run:
+        return expired.count()
+    deleted = 0
+    while True:
+        # Short transactions: a batch of ids at a time rather than one huge DELETE
+        ids = list(expired.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        OutstandingToken.objects.filter(id__in=ids).delete()  # Cascades to BlacklistedToken
+        deleted += len(ids)
@@ -0,0 +1,60 @@
+"""
+Role (group membership) checks without a query per check.
+
+A user's group names are loaded once and kept:
+- on the user object, for the rest of the request (request.user and DRF's
+  request.user live for one request),
+- in a cache shared by the worker processes, across requests; models.py drops
+  a user's entry once a change to their groups (m2m_changed), or a rename or
+  deletion of a group, commits, and CACHE_TIMEOUT bounds anything missed
+  (e.g. raw SQL).
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+ROLE_SETTINGS = {
+    'CACHE_ALIAS': 'sessions',  # Shared by all workers, so invalidation reaches every process
+    'CACHE_TIMEOUT': 300,  # Seconds
+    **getattr(settings, 'USER_ROLES', {}),
+}
+
+HOD_GROUP = 'HOD'
+
+
+def _cache():
+    return caches[ROLE_SETTINGS['CACHE_ALIAS']]
+
+
+def _cache_key(user_id):
+    return f"user-roles:{user_id}"
+
+
+def get_user_roles(user):
+    """Frozenset of the user's group names (empty for anonymous users)."""
+    if user is None or not user.is_authenticated:
+        return frozenset()
+    roles = getattr(user, '_role_cache', None)
+    if roles is None:
+        key = _cache_key(user.pk)
+        roles = _cache().get(key)
+        if roles is None:
+            roles = frozenset(user.groups.values_list('name', flat=True))
+            _cache().set(key, roles, ROLE_SETTINGS['CACHE_TIMEOUT'])
+        user._role_cache = roles
+    return roles
+
+
+def has_role(user, group_name):
+    return group_name in get_user_roles(user)
+
+
+def is_hod(user):
+    """Check if the user is authenticated and in the HOD group."""
+    return has_role(user, HOD_GROUP)
+
+
+def invalidate_user_roles(user_ids):
+    # After commit: until then other requests still read (and may re-cache) the old groups
+    keys = [_cache_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: _cache().delete_many(keys))
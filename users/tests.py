@@ -1,3 +1,166 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group, User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from .authentication import ClaimsJWTAuthentication
+from .revocation import RevocationFilter
+from .tokens import FillMateRefreshToken, FillMateTokenRefreshSerializer, bump_token_version, get_token_version
+
+# Token versions, roles and the blacklist marker live in the shared 'sessions' cache:
+# give the tests their own, empty one
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'users-tests-default'},
+    'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'users-tests-sessions'},
+    'templates': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'users-tests-templates'},
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ClaimsAuthenticationTests(TestCase):
+    """Read-only calls trust the token's claims only while its version is current."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hod_group = Group.objects.create(name='HOD')
+        cls.user = User.objects.create_user('claims', password='x')
+
+    def setUp(self):
+        # Cached versions would outlive the rollback of the previous test's changes
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+
+    def authenticate(self, access_token, method='get'):
+        request = getattr(APIRequestFactory(), method)('/api/users/protected/', HTTP_AUTHORIZATION=f'Bearer {access_token}')
+        return ClaimsJWTAuthentication().authenticate(Request(request))[0]
+
+    def access_token(self):
+        return str(FillMateRefreshToken.for_user(User.objects.get(pk=self.user.pk)).access_token)
+
+    def test_current_claims_need_no_query(self):
+        token = self.access_token()
+        self.authenticate(token)  # Caches the token version
+        with self.assertNumQueries(0):
+            user = self.authenticate(token)
+        self.assertTrue(user.from_token_claims)
+        self.assertEqual((user.pk, user.username), (self.user.pk, 'claims'))
+
+    def test_writes_load_the_user(self):
+        user = self.authenticate(self.access_token(), method='post')
+        self.assertFalse(getattr(user, 'from_token_claims', False))
+
+    def test_stale_version_falls_back_to_database(self):
+        token = self.access_token()
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_token_version([self.user.pk])
+        user = self.authenticate(token)
+        self.assertFalse(getattr(user, 'from_token_claims', False))
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_deactivated_user_rejected(self):
+        token = self.access_token()
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_version_cache_cleared_after_commit(self):
+        version = get_token_version(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                bump_token_version([self.user.pk])
+                # Before the commit, readers (other requests) still get the committed version;
+                # whatever they cache meanwhile must not outlive the commit
+                self.assertEqual(get_token_version(self.user.pk), version)
+        self.assertEqual(get_token_version(self.user.pk), version + 1)
+
+    def test_group_change_invalidates_role_claims(self):
+        refresh = FillMateRefreshToken.for_user(User.objects.get(pk=self.user.pk))
+        self.assertEqual(refresh.access_token['roles'], [])
+        token = str(refresh.access_token)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(self.hod_group)
+        self.assertFalse(getattr(self.authenticate(token), 'from_token_claims', False))
+
+        # Refreshing embeds the current roles, which are trusted again
+        serializer = FillMateTokenRefreshSerializer(data={'refresh': str(refresh)})
+        serializer.is_valid(raise_exception=True)
+        user = self.authenticate(serializer.validated_data['access'])
+        self.assertTrue(user.from_token_claims)
+        self.assertEqual(user._role_cache, frozenset({'HOD'}))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RevocationTests(TestCase):
+    """Rotated refresh tokens are rejected, in this process and in others, without a query per check."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('rotating', password='x')
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+
+    def rotate(self, refresh):
+        # The blacklist marker moves once the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            serializer = FillMateTokenRefreshSerializer(data={'refresh': str(refresh)})
+            serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['refresh']
+
+    def test_rotated_token_rejected_in_other_process(self):
+        refresh = FillMateRefreshToken.for_user(self.user)
+        other_process = RevocationFilter()
+        other_process.sync()
+
+        rotated = self.rotate(refresh)
+
+        with mock.patch('users.tokens.revocation_filter', other_process):
+            with self.assertNumQueries(1):  # The marker moved: read the newly blacklisted rows
+                with self.assertRaisesMessage(TokenError, 'blacklisted'):
+                    FillMateRefreshToken(str(refresh))
+            with self.assertNumQueries(0):  # Unchanged marker: no query
+                FillMateRefreshToken(rotated)
+                with self.assertRaises(TokenError):
+                    FillMateRefreshToken(str(refresh))
+
+    def test_rotated_token_rejected_in_same_process(self):
+        refresh = FillMateRefreshToken.for_user(self.user)
+        self.rotate(refresh)
+        with self.assertRaisesMessage(TokenError, 'blacklisted'):
+            self.rotate(refresh)
+
+    def test_purge_tokens(self):
+        now = timezone.now()
+        expired = [
+            OutstandingToken.objects.create(jti=f'expired-{i}', token='x', expires_at=now - timedelta(days=1))
+            for i in range(3)
+        ]
+        BlacklistedToken.objects.create(token=expired[0])
+        current = OutstandingToken.objects.create(jti='current', token='x', expires_at=now + timedelta(days=1))
+        BlacklistedToken.objects.create(token=current)
+
+        out = StringIO()
+        call_command('purge_tokens', '--dry-run', stdout=out)
+        self.assertIn('Would delete 3 expired token(s)', out.getvalue())
+        self.assertEqual(OutstandingToken.objects.count(), 4)
+
+        out = StringIO()
+        call_command('purge_tokens', '--batch-size', '2', stdout=out)
+        self.assertIn('Deleted 3 expired token(s)', out.getvalue())
+        self.assertQuerySetEqual(OutstandingToken.objects.all(), [current])
+        self.assertQuerySetEqual(BlacklistedToken.objects.values_list('token_id', flat=True), [current.pk])
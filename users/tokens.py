@@ -0,0 +1,125 @@
+"""
+JWTs that carry what read-only API calls need to know about the user.
+
+Tokens issued by FillMateRefreshToken.for_user (login, registration) and the
+access tokens derived from them include the username, staff flags, group
+names and the user's token version. ClaimsJWTAuthentication
+(users/authentication.py) trusts these claims instead of loading the user.
+
+The token version (UserProfile.token_version) is bumped whenever any of the
+claimed data may have changed (groups, staff flags, password, deactivation;
+see models.py). Tokens carrying an older version are not trusted: the user is
+loaded from the database until the client refreshes, and refreshing embeds
+the current claims again. The version is read through the shared cache, so
+checking it normally costs no query.
+
+Refresh tokens are checked against the blacklist through revocation_filter
+(users/revocation.py) rather than a query per refresh.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .revocation import revocation_filter
+from .roles import get_user_roles
+
+TOKEN_CLAIMS_SETTINGS = {
+    'CACHE_ALIAS': 'sessions',  # Shared by all workers, so version bumps reach every process
+    'VERSION_CACHE_TIMEOUT': 24 * 60 * 60,  # Seconds
+    **getattr(settings, 'JWT_CLAIMS', {}),
+}
+
+TOKEN_VERSION_CLAIM = 'ver'
+
+
+def _cache():
+    return caches[TOKEN_CLAIMS_SETTINGS['CACHE_ALIAS']]
+
+
+def _version_cache_key(user_id):
+    return f"token-version:{user_id}"
+
+
+def get_token_version(user_id):
+    key = _version_cache_key(user_id)
+    version = _cache().get(key)
+    if version is None:
+        from .models import UserProfile
+
+        version = UserProfile.objects.filter(user_id=user_id).values_list('token_version', flat=True).first()
+        if version is None:
+            version = -1  # Deleted user: matches no token
+        _cache().set(key, version, TOKEN_CLAIMS_SETTINGS['VERSION_CACHE_TIMEOUT'])
+    return version
+
+
+def bump_token_version(user_ids):
+    """Stop trusting the claims of every token issued so far to these users."""
+    from .models import UserProfile
+
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    UserProfile.objects.filter(user_id__in=user_ids).update(token_version=F('token_version') + 1)
+    # After commit: until then other requests still read (and may re-cache) the old version
+    keys = [_version_cache_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: _cache().delete_many(keys))
+
+
+def user_claims(user):
+    claims = {
+        'username': user.get_username(),
+        'is_staff': user.is_staff,
+        'is_superuser': user.is_superuser,
+        'roles': sorted(get_user_roles(user)),
+    }
+    version = get_token_version(user.pk)
+    if version >= 0:  # Users without a profile get no version: their tokens are always checked
+        claims[TOKEN_VERSION_CLAIM] = version
+    return claims
+
+
+class FillMateRefreshToken(RefreshToken):
+    """Refresh token whose access tokens carry the user's claims (see module docstring)."""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim, value in user_claims(user).items():
+            token[claim] = value
+        return token
+
+    @property
+    def access_token(self):
+        user_id = self.payload.get(api_settings.USER_ID_CLAIM)
+        if user_id is not None and self.payload.get(TOKEN_VERSION_CLAIM) != get_token_version(user_id):
+            # Issued before a change (or before claims existed): embed the current values,
+            # also in the rotated refresh token
+            user = User.objects.filter(pk=user_id).first()
+            if user is None:
+                raise TokenError("User not found")
+            for claim, value in user_claims(user).items():
+                self[claim] = value
+        return super().access_token
+
+    def check_blacklist(self):
+        if revocation_filter.is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        blacklisted = super().blacklist()
+        # Known here at once; other processes pick it up from the marker (models.py)
+        revocation_filter.add(self.payload[api_settings.JTI_CLAIM], blacklisted[0].token.expires_at)
+        return blacklisted
+
+
+class FillMateTokenRefreshSerializer(TokenRefreshSerializer):
+    """SIMPLE_JWT['TOKEN_REFRESH_SERIALIZER']: refreshed access tokens carry current claims."""
+    token_class = FillMateRefreshToken
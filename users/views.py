@@ -5,11 +5,14 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.utils.decorators import method_decorator
 from rest_framework import status
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
+from .tokens import FillMateRefreshToken  # Access tokens carry role claims (users/authentication.py)
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.contrib.auth.models import User, Group
 from .serializers import RegisterSerializer, LoginSerializer, JWTSerializer, UserSerializer
 from documents.models import SubmittedDocument  # Import the SubmittedDocument model
+from documents.stats import get_status_counts  # Cached HOD dashboard counts
+from fillmate.pagination import KeysetPaginator
+from documents.utils import invalidate_signature_overlays
 from rest_framework.decorators import api_view, permission_classes
 from django.urls import reverse
 from django.http import JsonResponse, HttpResponseRedirect
@@ -27,6 +30,7 @@ from datetime import timedelta
 from notifications.models import Notification
 from .forms import SignatureUploadForm  # Import SignatureUploadForm
 from .models import UserProfile  # Import UserProfile model
+from .roles import is_hod  # Cached group membership; also used with user_passes_test
 
 
 
@@ -35,8 +39,7 @@ class MarkNotificationRead(APIView):
     permission_classes = [IsAuthenticated] # Ensure only logged-in users can mark read
     def post(self, request, pk):
         notification = get_object_or_404(Notification, pk=pk, recipient=request.user)
-        notification.is_read = True
-        notification.save()
+        notification.mark_read()
         return Response({'status': 'success'})
 
 
@@ -58,7 +61,7 @@ class RegisterView(APIView):
             serializer = RegisterSerializer(data=request.data)
             if serializer.is_valid():
                 user = serializer.save()
-                refresh = RefreshToken.for_user(user)
+                refresh = FillMateRefreshToken.for_user(user)
                 return Response({
                     'user': UserSerializer(user).data,
                     'access_token': str(refresh.access_token),
@@ -209,7 +212,7 @@ class LoginView(APIView):
             # --- Regular user or HOD ---
             else:
                 # Generate JWT tokens for API usage by the frontend JS
-                refresh = RefreshToken.for_user(user)
+                refresh = FillMateRefreshToken.for_user(user)
                 access_token = str(refresh.access_token)
                 refresh_token = str(refresh)
 
@@ -240,17 +243,9 @@ class LoginView(APIView):
 
     def get_redirect_url(self, user):
         """Determine redirect URL based on user role"""
-        # Check if user is in the 'HOD' group (ensure group 'HOD' exists)
-        try:
-             # Check group membership safely
-            if user.groups.filter(name="HOD").exists():
-                return reverse('users:hod_dashboard') # Use reverse for safety
-        except Group.DoesNotExist:
-             print("Warning: 'HOD' group does not exist.") # Log warning if group missing
-             pass # Fall through to default dashboard
-        except AttributeError:
-             # Handle cases where user object might not have 'groups' (e.g., AnonymousUser)
-             pass
+        # Check if user is in the 'HOD' group (False for anonymous users or a missing group)
+        if is_hod(user):
+            return reverse('users:hod_dashboard') # Use reverse for safety
 
         return reverse('users:user_dashboard') # Default redirect
     
@@ -279,7 +274,7 @@ def user_dashboard(request):
     if request.user.is_staff:
         return redirect('/admin/')
     # Redirect HOD users to their specific dashboard
-    if request.user.groups.filter(name='HOD').exists():
+    if is_hod(request.user):
          return redirect('users:hod_dashboard')
 
     # Fetch notifications for the specific user
@@ -294,10 +289,6 @@ def user_dashboard(request):
 
 
 
-def is_hod(user):
-    """Check if the user is authenticated and in the HOD group."""
-    return user.is_authenticated and user.groups.filter(name='HOD').exists()
-
 @login_required
 @user_passes_test(is_hod, login_url='/dashboard/') # Redirect non-HODs to regular dashboard
 def hod_dashboard(request):
@@ -325,10 +316,14 @@ def hod_dashboard(request):
         'is_hod': True, # Flag for template
         'notifications': notifications,
         'recent_submissions': recent_submissions,
-        'pending_count': SubmittedDocument.objects.filter(status='Pending').count(),
-        'approved_count': SubmittedDocument.objects.filter(status='Approved').count(),
-        'rejected_count': SubmittedDocument.objects.filter(status='Rejected').count(),
     }
+    # One aggregate query, cached briefly and shared by all HODs
+    status_counts = get_status_counts()
+    context.update({
+        'pending_count': status_counts['Pending'],
+        'approved_count': status_counts['Approved'],
+        'rejected_count': status_counts['Rejected'],
+    })
     return render(request, 'hoddash.html', context)
 
 # Protected API Endpoint Example (JWT or Session protected)
@@ -408,10 +403,11 @@ def upload_signature(request):
             if 'digital_signature' in form.changed_data and updated_profile.digital_signature:
                  updated_profile.signature_uploaded_at = timezone.now()
             updated_profile.save()
+            invalidate_signature_overlays(request.user.id) # Next approval redraws the overlay
             messages.success(request, "Signature uploaded successfully!") # Add feedback
 
             # Redirect based on role (assuming HOD uploads signature from their dash)
-            if request.user.groups.filter(name='HOD').exists():
+            if is_hod(request.user):
                  return redirect('users:hod_dashboard')
             else:
                  # Or redirect to a general profile page if needed
@@ -457,23 +453,14 @@ def hod_submission_list(request, status):
         'user', 'template', 'approved_version' # Include approved_version here
     ).order_by('-submitted_at')
 
-    # Pagination
-    paginator = Paginator(submission_list, 15) # Show 15 submissions per page
-    page_number = request.GET.get('page')
-    try:
-        submissions = paginator.page(page_number)
-    except PageNotAnInteger:
-        # If page is not an integer, deliver first page.
-        submissions = paginator.page(1)
-    except EmptyPage:
-        # If page is out of range (e.g. 9999), deliver last page of results.
-        submissions = paginator.page(paginator.num_pages)
+    # Keyset pagination: no COUNT(*), and deep pages cost the same as the first one
+    submissions = KeysetPaginator(submission_list, 15, 'submitted_at').page(request.GET.get('cursor'))
 
     context = {
         'submissions': submissions, # Paginated submissions
         'status': status_db, # Pass the capitalized status for title/logic
         'page_title': f"{status_db} Submissions",
-        'is_paginated': paginator.num_pages > 1, # Pass flag for template
+        'is_paginated': submissions.has_other_pages(), # Pass flag for template
         'page_obj': submissions, # Pass page object for pagination controls
     }
     return render(request, 'hod_submission_list.html', context)